@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Throughput benchmark: per-datagram relay loop vs the batched datagram engine.
+
+Separate processes blast syslog-sized datagrams at a local listen port. Each
+mode receives and forwards them to a local sink for a fixed duration; the
+forwarded datagrams/sec and the relay's CPU microseconds per datagram are
+reported. With too few sender processes the senders, not the relay, become
+the limit, so CPU per datagram is the more stable comparison.
+
+Usage: python benchmarks/bench_batch_io.py [--duration 5] [--batch-size 64] [--senders 2]
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from relay_net import BatchReceiver, BatchSender, mmsg_available  # noqa: E402
+
+SAMPLE = (b"<14>Oct 18 09:15:02 Tower frigate[1234]: 2025-08-24 08:54:23.339023614 "
+          b"[INFO] Camera front_door: motion detected in zone driveway")
+
+
+def blast(port, stop_event):
+    """Send datagrams as fast as possible until told to stop"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    address = ('127.0.0.1', port)
+    while not stop_event.is_set():
+        for _ in range(256):
+            try:
+                sock.sendto(SAMPLE, address)
+            except OSError:
+                pass
+    sock.close()
+
+
+def legacy_loop(sock, forward_sock, sink, deadline):
+    """The original relay_worker loop: settimeout + recvfrom + sendto per datagram"""
+    forwarded = 0
+    while time.time() < deadline:
+        sock.settimeout(1.0)
+        try:
+            data, addr = sock.recvfrom(1024)
+        except socket.timeout:
+            continue
+        forward_sock.sendto(data, sink)
+        forwarded += 1
+    return forwarded
+
+
+def batched_loop(sock, forward_sock, sink, deadline, batch_size, use_mmsg):
+    receiver = BatchReceiver(sock, batch_size, 1024, use_mmsg=use_mmsg)
+    sender = BatchSender(forward_sock, batch_size, use_mmsg=use_mmsg)
+    forwarded = 0
+    while time.time() < deadline:
+        batch = receiver.receive(timeout=1.0)
+        forwarded += sender.send([data for data, addr in batch], sink)
+    return forwarded
+
+
+def run_mode(name, duration, batch_size, senders):
+    listen = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    listen.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    listen.bind(('127.0.0.1', 0))
+    port = listen.getsockname()[1]
+    sink_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink_sock.bind(('127.0.0.1', 0))
+    sink = sink_sock.getsockname()
+    forward_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    stop_event = multiprocessing.Event()
+    blasters = [multiprocessing.Process(target=blast, args=(port, stop_event), daemon=True)
+                for _ in range(senders)]
+    for blaster in blasters:
+        blaster.start()
+    time.sleep(0.2)
+
+    cpu_start = time.process_time()
+    start = time.time()
+    deadline = start + duration
+    if name == 'legacy':
+        forwarded = legacy_loop(listen, forward_sock, sink, deadline)
+    else:
+        forwarded = batched_loop(listen, forward_sock, sink, deadline, batch_size, name == 'recvmmsg')
+    elapsed = time.time() - start
+    cpu = time.process_time() - cpu_start
+
+    stop_event.set()
+    for blaster in blasters:
+        blaster.join(timeout=2)
+    for s in (listen, sink_sock, forward_sock):
+        s.close()
+    return forwarded / elapsed, cpu * 1e6 / max(forwarded, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per mode')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--senders', type=int, default=2, help='sender processes')
+    args = parser.parse_args()
+
+    modes = ['legacy', 'drain']
+    if mmsg_available():
+        modes.append('recvmmsg')
+
+    baseline = None
+    print(f"{'mode':<10} {'datagrams/sec':>15} {'speedup':>8} {'cpu us/datagram':>16}")
+    for mode in modes:
+        rate, cpu_per_datagram = run_mode(mode, args.duration, args.batch_size, args.senders)
+        baseline = baseline or rate
+        print(f"{mode:<10} {rate:>15,.0f} {rate / baseline:>7.2f}x {cpu_per_datagram:>16.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""Replay benchmark: fire the captured syslog traffic at a relay and measure what comes out.
+
+The replay corpus is parsed from the `syslog_relay` log capture (every
+INCOMING block: source IP + raw message). A sender process replays it at
+each requested rate and a sink process stands in for ktranslate. Every
+datagram carries a sequence number and its send time, so the sink measures
+end-to-end latency per message and loss without a lookup table.
+
+Capture source IPs are mapped onto loopback aliases (192.168.2.110 ->
+127.0.2.110) so the relay still sees one address per device and applies the
+per-source transforms. By default the relay under test is started in this
+process from syslog_relay_tray (its handler, pipeline and metrics, with the
+source IPs remapped and the log file in a temp directory). With --target the
+traffic goes to an already running relay instead, which must forward to the
+sink port.
+
+The in-process relay measures relay loss, not policy: storm suppression and
+duplicate coalescing are switched off, since they drop messages on purpose
+(the corpus is replayed round-robin, so every message repeats). --policy
+keeps them as configured; what they and the route/severity filters suppress
+is then reported as 'suppressed' and not counted as lost.
+
+Exercised in-process: the UDP receive engine, SyslogMessage parsing, the
+filter/route gates, the per-source transforms, the archive writer (temp
+directory) and UDP or TCP forwarding. The disk spool, on by default in
+production, only with --spool (temp directory). Not exercised: the TCP
+ingest listener, extra [[destinations]], worker processes and the periodic
+monitoring/config-reload tasks. With --target, whatever that relay runs.
+
+Results are printed as JSON. --baseline compares against an earlier result
+file and exits with status 1 on a throughput, p99 latency or loss regression.
+
+Usage: python benchmarks/bench_replay.py [--rates 500,2000,5000] [--duration 5]
+       [--target HOST:PORT] [--sink-port 514] [--forward-protocol udp|tcp] [--spool] [--policy]
+       [--output result.json]
+       [--baseline previous.json] [--tolerance 0.2] [--max-loss-increase 1.0]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import select
+import socket
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_CAPTURE = os.path.join(ROOT, 'syslog_relay')
+
+# Relay counters reported per run (in-process relay)
+RELAY_COUNTERS = ('received', 'forwarded', 'dropped', 'filtered', 'pri_filtered', 'rate_limited', 'deduplicated')
+
+# Counters of messages the relay drops by policy rather than loses
+SUPPRESSION_COUNTERS = ('filtered', 'pri_filtered', 'rate_limited', 'deduplicated')
+
+# Appended to every replayed message: " #bench=<sequence>:<perf_counter_ns at send>"
+MARKER = b' #bench='
+
+
+def load_corpus(path):
+    """Parse the INCOMING blocks of a relay log capture into [(source_ip, datagram)]"""
+    with open(path, 'rb') as f:
+        text = f.read().decode('utf-8', errors='ignore').replace('\r\n', '\n')
+    corpus = []
+    for block in text.split('\n=== INCOMING MESSAGE')[1:]:
+        source_ip = None
+        for line in block.split('\n', 3)[1:3]:
+            if line.startswith('Source IP: '):
+                source_ip = line[len('Source IP: '):].strip()
+        start = block.find('Raw message: ')
+        if source_ip is None or start < 0:
+            continue
+        end = block.find('\n==========', start)
+        message = block[start + len('Raw message: '):end if end >= 0 else None]
+        corpus.append((source_ip, message.encode('utf-8')))
+    return corpus
+
+
+def loopback_alias(source_ip):
+    """Map a device address onto 127.0.x.y (last two octets kept) so each source stays distinct"""
+    octets = source_ip.split('.')
+    return f"127.0.{octets[2]}.{octets[3]}" if len(octets) == 4 else '127.0.0.1'
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def sender_main(corpus, target, rate, duration, result_conn):
+    """Replay the corpus round-robin at `rate` messages/second for `duration` seconds"""
+    sockets = {}
+    for source_ip, _ in corpus:
+        alias = loopback_alias(source_ip)
+        if alias not in sockets:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                sock.bind((alias, 0))
+            except OSError:
+                sock.bind(('127.0.0.1', 0))  # No 127/8 aliases on this platform
+            sockets[alias] = sock
+    plan = [(sockets[loopback_alias(source_ip)], data) for source_ip, data in corpus]
+
+    sent = 0
+    errors = 0
+    start = time.perf_counter()
+    end = start + duration
+    while True:
+        now = time.perf_counter()
+        if now >= end:
+            break
+        # Send everything that is due, then sleep briefly; keeps the average rate exact
+        due = int((now - start) * rate) - sent
+        for _ in range(due):
+            sock, data = plan[sent % len(plan)]
+            try:
+                sock.sendto(b'%s%s%d:%d' % (data, MARKER, sent, time.perf_counter_ns()), target)
+            except OSError:
+                errors += 1
+            sent += 1
+        time.sleep(0.0005)
+    for sock in sockets.values():
+        sock.close()
+    result_conn.send({'sent': sent, 'send_errors': errors, 'elapsed': time.perf_counter() - start})
+
+
+def sink_main(sink_addr, protocol, control_conn):
+    """Receive forwarded messages (UDP datagrams or octet-framed TCP), recording per-message latency.
+
+    Runs for the whole benchmark; 'report' returns and resets the results, 'stop' also exits.
+    """
+    from relay_tcp import FrameDecoder
+
+    if protocol == 'tcp':
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(sink_addr)
+        listener.listen()
+    else:
+        listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        listener.bind(sink_addr)
+    decoders = {}
+    control_conn.send('ready')
+
+    latencies = []
+    seen = set()
+    counts = {'duplicates': 0, 'unmarked': 0}
+
+    def record(data, received_ns):
+        marker = data.rfind(MARKER)
+        if marker < 0:
+            counts['unmarked'] += 1  # e.g. the relay's own system-monitor messages
+            return
+        try:
+            sequence, sent_ns = data[marker + len(MARKER):].split(b':', 1)
+            sequence = int(sequence)
+            sent_ns = int(sent_ns.split()[0])
+        except (ValueError, IndexError):
+            counts['unmarked'] += 1
+            return
+        if sequence in seen:
+            counts['duplicates'] += 1
+            return
+        seen.add(sequence)
+        latencies.append((received_ns - sent_ns) / 1000.0)
+
+    while True:
+        if control_conn.poll():
+            command = control_conn.recv()
+            control_conn.send({'received': len(latencies), 'latencies_us': latencies, **counts})
+            if command == 'stop':
+                break
+            latencies = []
+            seen.clear()
+            counts = {'duplicates': 0, 'unmarked': 0}
+        readable, _, _ = select.select([listener] + list(decoders), [], [], 0.05)
+        for sock in readable:
+            if sock is listener and protocol == 'tcp':
+                connection, _ = listener.accept()
+                decoders[connection] = FrameDecoder()
+                continue
+            data = sock.recv(65535 if protocol == 'udp' else 1 << 20)
+            received_ns = time.perf_counter_ns()
+            if protocol == 'udp':
+                record(data, received_ns)
+            elif not data:
+                del decoders[sock]
+                sock.close()
+            else:
+                for frame in decoders[sock].feed(data):
+                    record(frame, received_ns)
+    for sock in decoders:
+        sock.close()
+    listener.close()
+
+
+def start_sink(ctx, sink_addr, protocol):
+    """Start the sink process; returns (process, control connection) once it is listening"""
+    sink_conn, sink_child = ctx.Pipe()
+    sink = ctx.Process(target=sink_main, args=(sink_addr, protocol, sink_child), daemon=True)
+    sink.start()
+    if not sink_conn.poll(10):
+        raise RuntimeError("sink did not start")
+    sink_conn.recv()
+    return sink, sink_conn
+
+
+def run_rate(ctx, corpus, target, sink_conn, rate, duration, drain, relay_metrics=None):
+    """One replay phase at a fixed rate; returns the result dict"""
+    before = relay_metrics.snapshot() if relay_metrics is not None else None
+    sender_conn, sender_child = ctx.Pipe()
+    sender = ctx.Process(target=sender_main, args=(corpus, target, rate, duration, sender_child), daemon=True)
+    sender.start()
+    sent = sender_conn.recv()
+    sender.join()
+
+    # Let in-flight datagrams arrive before counting losses
+    time.sleep(drain)
+    sink_conn.send('report')
+    received = sink_conn.recv()
+
+    latencies = sorted(received['latencies_us'])
+    relay = None
+    if before is not None:
+        after = relay_metrics.snapshot()
+        relay = {name: after[name] - before[name] for name in RELAY_COUNTERS}
+    # Messages the relay dropped on purpose (filters, storm suppression, coalescing) are not loss
+    suppressed = sum(relay[name] for name in SUPPRESSION_COUNTERS) if relay is not None else 0
+    lost = max(0, sent['sent'] - received['received'] - suppressed)
+    result = {
+        'rate': rate,
+        'duration': round(sent['elapsed'], 3),
+        'sent': sent['sent'],
+        'send_errors': sent['send_errors'],
+        'received': received['received'],
+        'suppressed': suppressed,
+        'lost': lost,
+        'loss_percent': round(100.0 * lost / sent['sent'], 3) if sent['sent'] else 0.0,
+        'duplicates': received['duplicates'],
+        'throughput_mps': round(received['received'] / sent['elapsed'], 1) if sent['elapsed'] else 0.0,
+        'latency_us': {
+            'p50': round(percentile(latencies, 50), 1),
+            'p99': round(percentile(latencies, 99), 1),
+            'max': round(latencies[-1], 1) if latencies else 0,
+        },
+    }
+    if relay is not None:
+        result['relay'] = relay
+    return result
+
+
+def start_in_process_relay(sink_addr, forward_protocol, spool=False, policy=False):
+    """Start syslog_relay_tray's relay on a free loopback port with the capture IPs remapped"""
+    import syslog_relay_tray as app
+    from relay_async import AsyncRelay
+    from relay_routes import RouteTable, host_routes
+    from relay_transforms import TransformPipeline
+
+    # The relay's active configuration (syslog_relay.toml if present, else the built-in defaults)
+    config = app.active_config
+    remap = {ip: loopback_alias(ip) for ip in
+             set(config.device_offsets) | config.date_strip_ips | config.docker_host_ips}
+    # CIDR routes are left out: capture addresses are only remapped one host at a time
+    app.transform_pipeline = TransformPipeline(RouteTable(host_routes(
+        {remap[ip]: hours for ip, hours in config.device_offsets.items()},
+        [remap[ip] for ip in config.date_strip_ips],
+        [remap[ip] for ip in config.docker_host_ips])))
+    app.source_profiles.invalidate(app.transform_pipeline)
+    if not policy:
+        # Lossy by design; measured separately with --policy
+        app.rate_limiter.configure(app.rate_limiter.spec._replace(source_rate=None, app_rate=None))
+        app.deduplicator.configure(0)
+    work_dir = tempfile.mkdtemp(prefix='bench_replay_')
+    app.log_writer.path = os.path.join(work_dir, 'syslog_relay.log')
+    app.log_writer.start()
+    app.archive_writer.directory = os.path.join(work_dir, 'archive')
+    if app.ARCHIVE_ENABLED:
+        app.archive_writer.start()
+
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    probe.bind(('127.0.0.1', 0))
+    listen_addr = probe.getsockname()
+    probe.close()
+    relay = AsyncRelay(listen_addr, sink_addr, app.handle_datagram, batch_size=app.RELAY_BATCH_SIZE,
+                       max_datagram_size=app.MAX_DATAGRAM_SIZE, metrics=app.relay_metrics,
+                       rcvbuf=app.LISTEN_RCVBUF, sndbuf=app.FORWARD_SNDBUF, forward_protocol=forward_protocol,
+                       forward_queue_size=app.FORWARD_QUEUE_SIZE, forward_batch_bytes=app.FORWARD_BATCH_BYTES,
+                       forward_backoff_max=app.FORWARD_RECONNECT_MAX,
+                       spool_dir=os.path.join(work_dir, 'spool') if spool else None,
+                       spool_segment_size=app.SPOOL_SEGMENT_SIZE, spool_max_segments=app.SPOOL_MAX_SEGMENTS,
+                       spool_catchup_rate=app.SPOOL_CATCHUP_RATE)
+    relay.start()
+    return app, relay
+
+
+def compare(results, baseline, tolerance, max_loss_increase):
+    """Regressions of results against a baseline result file"""
+    regressions = []
+    previous = {run['rate']: run for run in baseline.get('runs', [])}
+    for run in results['runs']:
+        base = previous.get(run['rate'])
+        if base is None:
+            continue
+        if run['throughput_mps'] < base['throughput_mps'] * (1 - tolerance):
+            regressions.append(f"rate {run['rate']}: throughput {run['throughput_mps']} < {base['throughput_mps']}")
+        if run['latency_us']['p99'] > base['latency_us']['p99'] * (1 + tolerance):
+            regressions.append(f"rate {run['rate']}: p99 {run['latency_us']['p99']}us > {base['latency_us']['p99']}us")
+        if run['loss_percent'] > base['loss_percent'] + max_loss_increase:
+            regressions.append(f"rate {run['rate']}: loss {run['loss_percent']}% > {base['loss_percent']}%")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--capture', default=DEFAULT_CAPTURE)
+    parser.add_argument('--rates', default='500,2000,5000', help='comma-separated messages/second')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per rate')
+    parser.add_argument('--drain', type=float, default=1.0, help='seconds to wait for stragglers')
+    parser.add_argument('--target', help='HOST:PORT of a running relay (default: start one in-process)')
+    parser.add_argument('--sink-port', type=int, default=514, help='where the relay forwards (ktranslate)')
+    parser.add_argument('--forward-protocol', choices=('udp', 'tcp'), default='udp',
+                        help='how the relay forwards to the sink (in-process relay: sets FORWARD_PROTOCOL)')
+    parser.add_argument('--spool', action='store_true', help='in-process relay: forward through the disk spool')
+    parser.add_argument('--policy', action='store_true',
+                        help='in-process relay: keep storm suppression and duplicate coalescing as configured')
+    parser.add_argument('--output', help='write the JSON result here as well as stdout')
+    parser.add_argument('--baseline', help='earlier result file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative drop in throughput / rise in p99 latency')
+    parser.add_argument('--max-loss-increase', type=float, default=1.0,
+                        help='allowed rise in loss, in percentage points')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.capture)
+    if not corpus:
+        sys.exit(f"No INCOMING messages found in {args.capture}")
+    sink_addr = ('127.0.0.1', args.sink_port)
+    ctx = multiprocessing.get_context('spawn')
+    # The sink runs for the whole benchmark so a TCP forwarder keeps one connection to it
+    sink, sink_conn = start_sink(ctx, sink_addr, args.forward_protocol)
+
+    app = relay = None
+    if args.target:
+        host, port = args.target.rsplit(':', 1)
+        target = (host, int(port))
+    else:
+        app, relay = start_in_process_relay(sink_addr, args.forward_protocol, args.spool, args.policy)
+        target = relay.listen_addr
+
+    sources = {}
+    for source_ip, _ in corpus:
+        sources[source_ip] = sources.get(source_ip, 0) + 1
+    results = {
+        'benchmark': 'replay',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'version': app.VERSION if app is not None else None,
+        'target': args.target or (f"in-process ({relay.ingest_mode}, forward {args.forward_protocol}, "
+                                  f"spool {'on' if args.spool else 'off'}, policy {'on' if args.policy else 'off'})"),
+        'corpus': {'path': os.path.basename(args.capture), 'messages': len(corpus), 'sources': sources},
+        'runs': [],
+    }
+    try:
+        for rate in (int(r) for r in args.rates.split(',') if r.strip()):
+            results['runs'].append(run_rate(ctx, corpus, target, sink_conn, rate, args.duration, args.drain,
+                                            app.relay_metrics if app is not None else None))
+    finally:
+        if relay is not None:
+            relay.stop()
+            app.archive_writer.stop()
+            app.log_writer.stop()
+        sink_conn.send('stop')
+        sink_conn.recv()
+        sink.join()
+
+    output = json.dumps(results, indent=2)
+    # Relay console output goes to stdout too; keep the JSON last and intact
+    sys.stdout.flush()
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.max_loss_increase)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
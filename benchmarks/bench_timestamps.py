@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Per-timestamp cost of the Unraid RFC 3164 offset conversion, before and after the cached converter.
+
+"before" is the conversion the offset stage did up to v1.53: strptime with
+datetime.now().year, add the offset, strftime. "after" is
+relay_timestamps.TimestampConverter. The "burst" row feeds timestamps the
+way a busy source sends them (many messages per second, so most are cache
+hits); the "distinct" row gives every message its own second, so every
+conversion is a cache miss and only the slicing parser is measured.
+
+Usage: python benchmarks/bench_timestamps.py [--messages 20000] [--per-second 20]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from relay_timestamps import TimestampConverter  # noqa: E402
+
+OFFSET_HOURS = 5  # Unraid
+
+
+def legacy_convert(timestamp):
+    dt = datetime.strptime(f"{datetime.now().year} {timestamp}", "%Y %b %d %H:%M:%S")
+    return (dt + timedelta(hours=OFFSET_HOURS)).strftime("%b %d %H:%M:%S")
+
+
+def timestamps(count, per_second):
+    """count RFC 3164 timestamps, per_second of them sharing each second"""
+    start = datetime(2026, 3, 7, 22, 0, 0)
+    return [(start + timedelta(seconds=i // per_second)).strftime("%b %d %H:%M:%S") for i in range(count)]
+
+
+def measure(func, stamps):
+    start = time.perf_counter()
+    for stamp in stamps:
+        func(stamp)
+    return (time.perf_counter() - start) * 1e6 / len(stamps)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--per-second', type=int, default=20)
+    args = parser.parse_args()
+
+    # Same output before timing means anything
+    converter = TimestampConverter(OFFSET_HOURS)
+    for stamp in timestamps(2000, 7):
+        assert converter.convert(stamp) == legacy_convert(stamp), stamp
+
+    print(f"{'path':<22} {'before us/msg':>14} {'after us/msg':>13} {'speedup':>8}")
+    for name, stamps in (('unraid burst', timestamps(args.messages, args.per_second)),
+                         ('unraid distinct', timestamps(args.messages, 1))):
+        before = measure(legacy_convert, stamps)
+        after = measure(TimestampConverter(OFFSET_HOURS).convert, stamps)
+        print(f"{name:<22} {before:>14.2f} {after:>13.2f} {before / after:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
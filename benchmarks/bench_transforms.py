@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""Per-message latency of the transform stage, before and after the precompiled pipeline.
+
+"before" is the v1.34 chain (is_rfc5424_message, adjust_timestamp,
+adjust_docker_hostname, strip_docker_dates) with its console prints removed
+so only the string work is measured. "after" is relay_transforms. The
+"hubitat datagram" row covers the whole per-datagram passthrough decision:
+decode + regex + re-encode before, raw byte classification after; the
+"unraid datagram" row converts from the raw datagram the way the relay does,
+with the parsed record handed to the timestamp stage.
+
+Before timing, both implementations are checked for identical output on
+every message of the `syslog_relay` capture (with its source IPs), as well
+as on the sample messages below.
+
+Usage: python benchmarks/bench_transforms.py [--iterations 20000] [--capture syslog_relay]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_replay import DEFAULT_CAPTURE, load_corpus  # noqa: E402
+from relay_message import SyslogMessage  # noqa: E402
+from relay_routes import RouteTable, host_routes  # noqa: E402
+from relay_transforms import TransformPipeline, is_rfc5424_message  # noqa: E402
+
+UNRAID_IP = "192.168.2.110"
+HUBITAT_IP = "192.168.2.108"
+DEVICE_OFFSETS = {UNRAID_IP: 5}
+DATE_STRIP_IPS = [UNRAID_IP]
+
+HUBITAT_MESSAGES = [
+    "<14>1 2025-08-29T01:57:29.190-04:00 HubitatC7 HVAC:.Conservatory.Floor.Second.Sensor 280 - - "
+    "HVAC: Conservatory Floor Second Sensor temperature is 76.8 °F",
+    "<15>1 2025-08-29T01:57:24.385-04:00 HubitatC8Pro Ecobee.Suite.Manager<span.style=\"color:green\">.Online</span> "
+    "3296 - - Checking for updates...",
+]
+
+UNRAID_MESSAGES = [
+    "<30>Aug 29 01:57:21 frigate[16201]: 2025-08-29 01:57:21.051633970  [2025-08-29 01:57:21] "
+    "frigate.record.maintainer      WARNING : Too many unprocessed recording segments in cache for kitchen.",
+    "<30>Aug 29 01:57:21 frigate[16201]: 2025-08-29 01:57:21.054600154  [ WARN:0@76595.554] global "
+    "cap.cpp:175 open VIDEOIO(CV_IMAGES): raised OpenCV exception:",
+    "<30>Aug 29 01:57:24 immichFrame-All[3021]: 25-08-29 01:57:24 info: Serving image 4f1c from album Family",
+    "<13>Aug 29 01:57:25 Tower emhttpd: spinning down /dev/sdc",
+]
+
+
+# --- v1.34 implementation (prints removed) -------------------------------------
+
+def legacy_is_rfc5424_message(message):
+    rfc5424_pattern = r'<[0-9]+>1\s+\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}[+-]\d{2}:\d{2}'
+    return bool(re.search(rfc5424_pattern, message))
+
+
+def legacy_adjust_docker_hostname(message, source_ip):
+    if source_ip != UNRAID_IP:
+        return message
+    pattern = r'([a-zA-Z0-9_-]+)\[([0-9]+)\]:'
+    match = re.search(pattern, message)
+    if match:
+        return re.sub(pattern, f'{match.group(1)} [{match.group(2)}]:', message)
+    return message
+
+
+def legacy_strip_docker_dates(message, source_ip):
+    if source_ip not in DATE_STRIP_IPS:
+        return message
+    if source_ip == UNRAID_IP:
+        container_pattern = r'([a-zA-Z0-9_-]+)\s*\[([0-9]+)\]:'
+        if re.search(container_pattern, message):
+            message = re.sub(r'\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}\.\d+', '', message)
+            message = re.sub(r'\s*\[\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}\]\s*', ' ', message)
+            message = re.sub(r'\d{2}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}\s+', '', message)
+    return re.sub(r'\s+', ' ', message)
+
+
+def legacy_adjust_timestamp(message, source_ip):
+    # The ISO 8601 branch of the original is unreachable here: messages it would
+    # match are classified as RFC 5424 and passed through first.
+    if source_ip not in DEVICE_OFFSETS:
+        return message
+    offset_hours = DEVICE_OFFSETS[source_ip]
+    traditional_pattern = r'(<[0-9]+>)([A-Za-z]{3}\s+\d{1,2}\s+\d{2}:\d{2}:\d{2})'
+    traditional_match = re.search(traditional_pattern, message)
+    if traditional_match:
+        priority = traditional_match.group(1)
+        timestamp = traditional_match.group(2)
+        dt = datetime.strptime(f"{datetime.now().year} {timestamp}", "%Y %b %d %H:%M:%S")
+        adjusted_timestamp = (dt + timedelta(hours=offset_hours)).strftime("%b %d %H:%M:%S")
+        return re.sub(traditional_pattern, f"{priority}{adjusted_timestamp}", message)
+    return message
+
+
+def legacy_process(message, source_ip):
+    if legacy_is_rfc5424_message(message):
+        return message
+    message = legacy_adjust_timestamp(message, source_ip)
+    message = legacy_adjust_docker_hostname(message, source_ip)
+    return legacy_strip_docker_dates(message, source_ip)
+
+
+# --- current pipeline ------------------------------------------------------------
+
+PIPELINE = TransformPipeline(RouteTable(host_routes(DEVICE_OFFSETS, DATE_STRIP_IPS, [UNRAID_IP])))
+
+
+def pipeline_process(message, source_ip):
+    if is_rfc5424_message(message):
+        return message
+    return PIPELINE.process(message, source_ip)
+
+
+def legacy_datagram(data, source_ip):
+    message = data.decode('utf-8', errors='ignore')
+    return legacy_process(message, source_ip).encode('utf-8')
+
+
+def pipeline_datagram(data, source_ip):
+    # As the relay does it: one parsed record, shared with the timestamp stage
+    record = SyslogMessage(data)
+    if record.family == 'rfc5424':
+        return data
+    stages = PIPELINE.stages_for(PIPELINE.rules_for(source_ip))
+    return PIPELINE.run(record.text, stages, record).encode('utf-8')
+
+
+def measure(func, messages, source_ip, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for message in messages:
+            func(message, source_ip)
+    return (time.perf_counter() - start) * 1e6 / (iterations * len(messages))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--capture', default=DEFAULT_CAPTURE)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.capture)
+    if not corpus:
+        sys.exit(f"No INCOMING messages found in {args.capture}")
+    for source_ip, data in corpus:
+        assert legacy_datagram(data, source_ip) == pipeline_datagram(data, source_ip), (source_ip, data)
+    print(f"Output identical for all {len(corpus)} messages in {os.path.basename(args.capture)}")
+
+    # Both implementations must produce the same output before timing means anything
+    for message in UNRAID_MESSAGES:
+        assert legacy_process(message, UNRAID_IP) == pipeline_process(message, UNRAID_IP), message
+        data = message.encode('utf-8')
+        assert legacy_datagram(data, UNRAID_IP) == pipeline_datagram(data, UNRAID_IP), message
+    for message in HUBITAT_MESSAGES:
+        assert legacy_process(message, HUBITAT_IP) == pipeline_process(message, HUBITAT_IP), message
+        data = message.encode('utf-8')
+        assert legacy_datagram(data, HUBITAT_IP) == pipeline_datagram(data, HUBITAT_IP), message
+
+    print(f"{'path':<22} {'before us/msg':>14} {'after us/msg':>13} {'speedup':>8}")
+    hubitat_datagrams = [message.encode('utf-8') for message in HUBITAT_MESSAGES]
+    unraid_datagrams = [message.encode('utf-8') for message in UNRAID_MESSAGES]
+    for name, before_func, after_func, messages, source_ip in (
+            ('hubitat passthrough', legacy_process, pipeline_process, HUBITAT_MESSAGES, HUBITAT_IP),
+            ('hubitat datagram', legacy_datagram, pipeline_datagram, hubitat_datagrams, HUBITAT_IP),
+            ('unraid conversion', legacy_process, pipeline_process, UNRAID_MESSAGES, UNRAID_IP),
+            ('unraid datagram', legacy_datagram, pipeline_datagram, unraid_datagrams, UNRAID_IP)):
+        before = measure(before_func, messages, source_ip, args.iterations)
+        after = measure(after_func, messages, source_ip, args.iterations)
+        print(f"{name:<22} {before:>14.2f} {after:>13.2f} {before / after:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -28,6 +28,15 @@ if %errorlevel% equ 0 (
     echo ✗ Failed to copy syslog_relay_tray.py
 )
 
+echo.
+echo Copying relay modules...
+copy "relay_*.py" "C:\Users\simon\Desktop\Syslog Relay\" /Y
+if %errorlevel% equ 0 (
+    echo ✓ relay modules copied successfully
+) else (
+    echo ✗ Failed to copy relay modules
+)
+
 echo.
 echo Copying start_syslog_relay.bat...
 copy "start_syslog_relay.bat" "C:\Users\simon\Desktop\Syslog Relay\start_syslog_relay.bat" /Y
@@ -17,6 +17,29 @@ if (!(Test-Path $desktopPath)) {
 # Files to copy
 $filesToCopy = @(
     "syslog_relay_tray.py",
+    "relay_net.py",
+    "relay_workers.py",
+    "relay_metrics.py",
+    "relay_kernel.py",
+    "relay_tcp.py",
+    "relay_forward.py",
+    "relay_spool.py",
+    "relay_config.py",
+    "relay_dedup.py",
+    "relay_archive.py",
+    "relay_destinations.py",
+    "relay_diagnostics.py",
+    "relay_exporter.py",
+    "relay_filters.py",
+    "relay_message.py",
+    "relay_ratelimit.py",
+    "relay_query.py",
+    "relay_routes.py",
+    "relay_timestamps.py",
+    "syslog_relay.example.toml",
+    "relay_transforms.py",
+    "relay_async.py",
+    "relay_logwriter.py",
     "start_syslog_relay.bat", 
     "requirements.txt"
 )
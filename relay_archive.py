@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""Compressed, indexed message archive.
+
+Every forwarded message is kept as one line ("time<TAB>source<TAB>message",
+local time to the millisecond, newlines in the message escaped as \\n) in
+gzip segments under the archive directory. The relay thread only appends
+(time, source, payload) to a bounded queue; a writer thread formats the
+lines, compresses them in blocks of about BLOCK_BYTES (or whatever arrived
+within block_interval seconds) and appends each block to the current
+segment as its own gzip member, so a segment is an ordinary .gz file that
+any gzip tool reads in full.
+
+Next to each segment, a sidecar index (".idx") gets one line per block,
+written after the block itself:
+
+    offset  length  first  last  count  sources
+
+(byte offset and compressed length of the block in the segment, first and
+last message time as epoch seconds, message count, comma-separated source
+IPs). A query for a time range or a source reads the index and decompresses
+only the blocks that can match.
+
+A segment is closed after segment_size compressed bytes or segment_seconds,
+whichever comes first. Segments older than retention_days, and the oldest
+segments while the archive is over max_bytes, are deleted. Both apply to
+this writer's prefix only: writers sharing a directory each need their
+share of the total cap.
+"""
+import os
+import threading
+import time
+import zlib
+from collections import deque, namedtuple
+
+# Uncompressed bytes per compressed block (the unit a query decompresses)
+BLOCK_BYTES = 256 * 1024
+
+SEGMENT_SUFFIX = '.log.gz'
+INDEX_SUFFIX = '.idx'
+
+# One index line: where a block is and what it holds
+IndexEntry = namedtuple('IndexEntry', 'offset length first last count sources')
+
+
+def segment_paths(directory, prefix):
+    """Segment files of one writer (prefix), oldest first"""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    start = f"{prefix}-"
+    return [os.path.join(directory, name) for name in sorted(names)
+            if name.startswith(start) and name.endswith(SEGMENT_SUFFIX)]
+
+
+def index_path(segment):
+    return segment[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+
+
+def read_index(segment):
+    """IndexEntry list of a segment, or None if it has no readable index"""
+    try:
+        with open(index_path(segment), 'r', encoding='ascii') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    entries = []
+    for line in lines:
+        fields = line.split('\t')
+        if len(fields) != 6:
+            # Torn last line after a crash: the blocks before it are still indexed
+            break
+        offset, length, first, last, count, sources = fields
+        entries.append(IndexEntry(int(offset), int(length), float(first), float(last), int(count),
+                                  frozenset(sources.split(',')) if sources else frozenset()))
+    return entries
+
+
+def read_block(f, entry):
+    """Uncompressed bytes of one indexed block (f: segment opened in binary mode)"""
+    f.seek(entry.offset)
+    return zlib.decompress(f.read(entry.length), wbits=31)
+
+
+def escape_message(payload):
+    """Message bytes as one archive line (trailing line breaks dropped, inner ones escaped)"""
+    payload = payload.rstrip(b'\r\n')
+    if b'\n' in payload or b'\\' in payload:
+        payload = payload.replace(b'\\', b'\\\\').replace(b'\n', b'\\n')
+    return payload
+
+
+def unescape_message(text):
+    """Inverse of escape_message (on decoded text)"""
+    if '\\' not in text:
+        return text
+    return '\\'.join(part.replace('\\n', '\n') for part in text.split('\\\\'))
+
+
+class ArchiveWriter:
+    """Bounded-queue, block-compressing, indexed archive writer (one writer thread)"""
+
+    def __init__(self, directory, prefix='archive', segment_size=16 * 1024 * 1024, segment_seconds=3600,
+                 max_bytes=512 * 1024 * 1024, retention_days=14, queue_size=50000, block_interval=10.0,
+                 level=6):
+        self.directory = directory
+        self.prefix = prefix
+        self.segment_size = segment_size
+        self.segment_seconds = segment_seconds
+        self.max_bytes = max_bytes
+        self.retention_days = retention_days
+        self.queue_size = queue_size
+        self.block_interval = block_interval
+        self.level = level
+        self.written = 0
+        self.dropped = 0
+        self.blocks = 0
+        self.segments = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._queue = deque()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._file = None
+        self._index = None
+        self._segment = None
+        self._segment_size = 0
+        self._segment_end = 0.0
+        # Local-time text of the last second formatted (most messages share it)
+        self._second = None
+        self._second_text = b''
+
+    def start(self):
+        """Start the writer thread (idempotent)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._wakeup.clear()
+            self._thread = threading.Thread(target=self._run, name="archive-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        """Write everything queued so far, close the segment and stop the writer thread"""
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def write(self, source_ip, payload):
+        """Queue one forwarded message (bytes); returns False if it was dropped"""
+        queue = self._queue
+        if len(queue) >= self.queue_size:
+            self.dropped += 1
+            return False
+        queue.append((time.time(), source_ip, payload))
+        return True
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    def _format(self, created, source_ip, payload):
+        second = int(created)
+        if second != self._second:
+            self._second = second
+            self._second_text = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(second)).encode('ascii')
+        return b'%s.%03d\t%s\t%s\n' % (self._second_text, int((created - second) * 1000),
+                                       source_ip.encode('ascii', errors='replace'), escape_message(payload))
+
+    def _run(self):
+        queue = self._queue
+        popleft = queue.popleft
+        lines = []
+        size = 0
+        sources = set()
+        first = last = 0.0
+        block_started = time.monotonic()
+        self._apply_retention()
+        while True:
+            stopping = self._stopping
+            while queue:
+                created, source_ip, payload = popleft()
+                try:
+                    line = self._format(created, source_ip, payload)
+                except Exception as e:
+                    print(f"Error formatting archive record: {e}")
+                    continue
+                if not lines:
+                    first = created
+                    block_started = time.monotonic()
+                last = created
+                lines.append(line)
+                sources.add(source_ip)
+                size += len(line)
+                if size >= BLOCK_BYTES:
+                    self._write_block(lines, size, first, last, sources)
+                    lines = []
+                    size = 0
+                    sources = set()
+            if lines and (stopping or time.monotonic() - block_started >= self.block_interval):
+                self._write_block(lines, size, first, last, sources)
+                lines = []
+                size = 0
+                sources = set()
+            if stopping:
+                break
+            # Nothing here needs low latency: poll a few times a second
+            self._wakeup.wait(0.25)
+        self._close_segment()
+
+    def _write_block(self, lines, size, first, last, sources):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        block = compressor.compress(b''.join(lines)) + compressor.flush()
+        try:
+            if self._file is None or self._segment_size >= self.segment_size or time.time() >= self._segment_end:
+                self._open_segment(first)
+            offset = self._segment_size
+            self._file.write(block)
+            self._file.flush()
+            # Index line only once its block is on disk
+            self._index.write(f"{offset}\t{len(block)}\t{first:.3f}\t{last:.3f}\t{len(lines)}\t"
+                              f"{','.join(sorted(sources))}\n")
+            self._index.flush()
+            self._segment_size += len(block)
+        except OSError as e:
+            print(f"Error writing archive: {e}")
+            self._close_segment()
+            self.dropped += len(lines)
+            return
+        self.written += len(lines)
+        self.blocks += 1
+        self.bytes_in += size
+        self.bytes_out += len(block)
+
+    def _open_segment(self, first):
+        self._close_segment()
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(first))
+        path = os.path.join(self.directory, f"{self.prefix}-{stamp}{SEGMENT_SUFFIX}")
+        # Never append to a segment from an earlier run (its index may be a block short)
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"{self.prefix}-{stamp}_{suffix}{SEGMENT_SUFFIX}")
+            suffix += 1
+        self._file = open(path, 'xb')
+        self._index = open(index_path(path), 'w', encoding='ascii', newline='\n')
+        self._segment = path
+        self._segment_size = 0
+        self._segment_end = time.time() + self.segment_seconds
+        self.segments += 1
+
+    def _close_segment(self):
+        if self._file is None:
+            return
+        for f in (self._file, self._index):
+            try:
+                f.close()
+            except OSError:
+                pass
+        self._file = self._index = self._segment = None
+        self._segment_size = 0
+        self._apply_retention()
+
+    def _apply_retention(self):
+        """Delete closed segments past retention_days, then the oldest while over max_bytes"""
+        cutoff = time.time() - self.retention_days * 86400
+        kept = []
+        for path in segment_paths(self.directory, self.prefix):
+            if path == self._segment:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if stat.st_mtime < cutoff:
+                self._remove(path)
+            else:
+                kept.append((path, stat.st_size))
+        total = sum(size for _, size in kept) + self._segment_size
+        for path, size in kept:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path):
+        for name in (path, index_path(path)):
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error removing archive segment: {e}")
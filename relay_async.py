@@ -0,0 +1,648 @@
+#!/usr/bin/env python3
+"""Asyncio relay core.
+
+The relay runs on one event loop in a background thread (the tray icon owns
+the main thread). Datagrams are received through a DatagramProtocol, handed
+to a handler that returns the payload to forward, and written to a connected
+forwarding transport without blocking. Periodic jobs (system monitoring,
+stats) are event-loop tasks that wait on a stop event instead of sleeping,
+so stop() takes effect immediately.
+
+Where the loop exposes socket readiness (selector loops, i.e. Linux), the
+listen socket is drained with the batched engine from relay_net instead of
+one callback per datagram, and UDP forwarding (TCP frames and the relay's
+own messages included) goes through its one BatchSender socket. An optional TCP listener (relay_tcp) feeds
+RFC 6587 frames to the same handler. Forwarding is either one UDP datagram
+per message or, with forward_protocol='tcp', a persistent octet-framed TCP
+connection (relay_forward) that can pause ingestion when the collector lags.
+
+With a spool directory, transformed messages are appended to an on-disk
+segment log (relay_spool) instead of going straight out; a pump task
+forwards them at up to spool_catchup_rate messages per second and commits
+the spool cursor only once delivery is confirmed, so a collector restart
+holds messages on disk instead of losing them.
+
+Extra destinations (relay_destinations) get a copy of every message their
+routing rules accept, each through its own bounded queue and sender task;
+an exclusive destination takes its messages away from the collector.
+"""
+import asyncio
+import socket
+import threading
+from collections import deque
+
+from relay_destinations import Destination
+from relay_kernel import set_socket_buffers
+from relay_metrics import RelayMetrics
+from relay_forward import TcpForwarder
+from relay_net import BatchReceiver, BatchSender
+from relay_spool import SegmentSpool
+from relay_tcp import TcpIngestProtocol
+
+# Spool pump cadence: the catch-up rate is enforced per tick, and a UDP send is
+# confirmed once a tick has passed without an ICMP error on the forward socket
+SPOOL_TICK = 0.05
+# Time between probes while the collector is refusing messages
+SPOOL_RETRY_INTERVAL = 1.0
+
+
+class RelayProtocol(asyncio.DatagramProtocol):
+    """Ingest protocol: pass every datagram to the relay"""
+
+    def __init__(self, relay):
+        self.relay = relay
+
+    def datagram_received(self, data, addr):
+        self.relay.handle_datagram(data, addr)
+
+    def error_received(self, exc):
+        # Windows surfaces ICMP port unreachable as a receive error; nothing to do
+        print(f"Relay socket error: {exc}")
+
+
+class ForwardProtocol(asyncio.DatagramProtocol):
+    """Forwarding endpoint; only reports errors (e.g. collector not listening)"""
+
+    def error_received(self, exc):
+        print(f"Error forwarding message: {exc}")
+
+
+class AsyncRelay:
+    """UDP relay driven by an asyncio event loop"""
+
+    def __init__(self, listen_addr, forward_addr, handler, batch_size=64,
+                 max_datagram_size=1024, reuse_port=False, metrics=None, rcvbuf=None, sndbuf=None,
+                 tcp_listen_addr=None, max_message_size=65536, tcp_max_connections=256, tcp_idle_timeout=300,
+                 forward_protocol='udp', forward_queue_size=10000, forward_batch_bytes=64 * 1024,
+                 forward_backoff_max=30.0, spool_dir=None, spool_segment_size=16 * 1024 * 1024,
+                 spool_max_segments=64, spool_catchup_rate=5000, destinations=()):
+        # listen_addr None runs the loop for periodic tasks only (worker-process mode parent)
+        self.listen_addr = listen_addr
+        self.forward_addr = forward_addr
+        # handler(data, addr) -> bytes to forward, or None when a relay rule (route, filter, rate
+        # limit, dedup) dropped it; the handler counts those itself, so they are not counted as dropped
+        self.handler = handler
+        self.batch_size = batch_size
+        self.max_datagram_size = max_datagram_size
+        self.reuse_port = reuse_port
+        # Optional TCP listener alongside the UDP one; frames up to max_message_size bytes
+        self.tcp_listen_addr = tcp_listen_addr
+        self.max_message_size = max_message_size
+        self.tcp_max_connections = tcp_max_connections
+        self.tcp_idle_timeout = tcp_idle_timeout
+        self.tcp_connections = set()
+        # 'udp' (datagram per message) or 'tcp' (TcpForwarder)
+        self.forward_protocol = forward_protocol
+        self.forward_queue_size = forward_queue_size
+        self.forward_batch_bytes = forward_batch_bytes
+        self.forward_backoff_max = forward_backoff_max
+        self.forwarder = None
+        # Disk spool between the handler and the forwarder (None disables it)
+        self.spool_dir = spool_dir
+        self.spool_segment_size = spool_segment_size
+        self.spool_max_segments = spool_max_segments
+        self.spool_catchup_rate = spool_catchup_rate
+        self.spool = None
+        self._spool_sock = None
+        self._spool_sender = None
+        self._spool_wakeup = None
+        # (forwarder.delivered target, spool position, count, bytes) per batch awaiting confirmation
+        self._spool_in_flight = deque()
+        self._spool_submitted = 0
+        # DestinationSpecs for extra collectors; the running Destination objects while started
+        self.destination_specs = tuple(destinations)
+        self.destinations = ()
+        # Set while the TCP forwarder asks for backpressure
+        self.ingest_paused = False
+        self._reader = None
+        # SO_RCVBUF for the listen socket / SO_SNDBUF for the forward socket (None = OS default)
+        self.rcvbuf = rcvbuf
+        self.sndbuf = sndbuf
+        # 'listen'/'forward' -> {option: (requested, actual)}, filled in when the sockets are created
+        self.socket_buffers = {}
+        self.ingest_mode = None
+        self.loop = None
+        self._periodic = []
+        self._stop_event = None
+        self._thread = None
+        self._started = threading.Event()
+        self._stop_requested = False
+        self._start_error = None
+        self._forward_transport = None
+        self._sender = None
+        # Batched path: payloads a full forward send buffer refused, sent from a writer callback
+        self._unsent = deque()
+        # Hot-path counters, only written by the loop thread (shared with the handler if passed in)
+        self.metrics = metrics if metrics is not None else RelayMetrics()
+
+    def add_periodic(self, interval, func, run_immediately=False):
+        """Run func (in the default executor) every interval seconds while the relay runs"""
+        self._periodic.append((interval, func, run_immediately))
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive() and self._started.is_set()
+
+    def start(self, timeout=10):
+        """Start the relay thread and wait until the sockets are bound"""
+        self._started.clear()
+        self._stop_requested = False
+        self._start_error = None
+        self._thread = threading.Thread(target=self.run, name="relay-loop", daemon=True)
+        self._thread.start()
+        self._started.wait(timeout)
+        if self._start_error is not None:
+            raise self._start_error
+        return self._started.is_set()
+
+    def stop(self, timeout=5):
+        """Ask the loop to stop and wait for the relay thread to finish"""
+        self._stop_requested = True
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(self._stop_event.set)
+            except RuntimeError:
+                pass  # Loop already closed
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def run(self):
+        """Run the relay until stop() is called (blocking)"""
+        try:
+            asyncio.run(self._main())
+        except Exception as e:
+            self._start_error = e
+            print(f"Relay error: {e}")
+        finally:
+            # Unblock start() if we never got as far as binding
+            self._started.set()
+
+    def call_soon(self, func, *args):
+        """Schedule func on the relay loop from another thread"""
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(func, *args)
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        if self._stop_requested:
+            # stop() was called before the loop existed
+            self._stop_event.set()
+
+        if self.listen_addr is None:
+            self.ingest_mode = "none"
+            await self._run_tasks()
+            return
+
+        if self.spool_dir is not None:
+            self.spool = SegmentSpool(self.spool_dir, self.spool_segment_size, self.spool_max_segments)
+            self._spool_wakeup = asyncio.Event()
+
+        forward_transport = None
+        batch_forward_sock = None
+        # Drain many datagrams per readiness callback with recvmmsg/sendmmsg where the loop allows it
+        batched = self.batch_size > 1 and self._supports_readers()
+        if self.forward_protocol == 'tcp':
+            # With a spool there is nothing to push back on: the backlog waits on disk
+            pause, resume = (None, None) if self.spool is not None else (self._pause_ingest, self._resume_ingest)
+            self.forwarder = TcpForwarder(self.forward_addr, self.metrics, queue_size=self.forward_queue_size,
+                                          batch_bytes=self.forward_batch_bytes, backoff_max=self.forward_backoff_max,
+                                          on_pause=pause, on_resume=resume)
+            self.forwarder.start()
+        elif self.spool is not None:
+            # The pump sends from a plain connected socket so it can see the collector refusing datagrams
+            forward_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                self.socket_buffers['forward'] = set_socket_buffers(forward_sock, sndbuf=self.sndbuf)
+                forward_sock.setblocking(False)
+                forward_sock.connect(self.forward_addr)
+            except BaseException:
+                forward_sock.close()
+                raise
+            self._spool_sock = forward_sock
+            self._spool_sender = BatchSender(forward_sock, self.batch_size)
+        elif batched:
+            # The batch sender is the only forward socket: every message goes through its backlog
+            batch_forward_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                self.socket_buffers['forward'] = set_socket_buffers(batch_forward_sock, sndbuf=self.sndbuf)
+                batch_forward_sock.setblocking(False)
+            except BaseException:
+                batch_forward_sock.close()
+                raise
+            self._sender = BatchSender(batch_forward_sock, self.batch_size)
+        else:
+            forward_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                self.socket_buffers['forward'] = set_socket_buffers(forward_sock, sndbuf=self.sndbuf)
+                forward_sock.setblocking(False)
+                forward_sock.connect(self.forward_addr)
+                forward_transport, _ = await self.loop.create_datagram_endpoint(
+                    ForwardProtocol, sock=forward_sock)
+            except BaseException:
+                forward_sock.close()
+                raise
+            self._forward_transport = forward_transport
+
+        destinations = []
+        for spec in self.destination_specs:
+            destination = Destination(spec, self.metrics.destination(spec.name), self.batch_size,
+                                      self.sndbuf, self.forward_backoff_max)
+            try:
+                await destination.start()
+            except OSError as e:
+                print(f"Error starting destination {spec.name} ({spec.host}:{spec.port}): {e}")
+                continue
+            destinations.append(destination)
+        self.destinations = tuple(destinations)
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        ingest_transport = None
+        reader_registered = False
+        tcp_server = None
+        pump = None
+        try:
+            if self.reuse_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            # Size the receive buffer before bind so no burst lands in a default-sized queue
+            self.socket_buffers['listen'] = set_socket_buffers(sock, rcvbuf=self.rcvbuf)
+            sock.bind(self.listen_addr)
+            sock.setblocking(False)
+
+            if batched:
+                receiver = BatchReceiver(sock, self.batch_size, self.max_datagram_size)
+                self._reader = (sock.fileno(), receiver)
+                self.loop.add_reader(sock.fileno(), self._drain, receiver)
+                reader_registered = True
+                self.ingest_mode = f"asyncio+{receiver.mode}"
+            else:
+                ingest_transport, _ = await self.loop.create_datagram_endpoint(
+                    lambda: RelayProtocol(self), sock=sock)
+                self.ingest_mode = "asyncio"
+
+            if self.tcp_listen_addr is not None:
+                tcp_server = await self.loop.create_server(
+                    lambda: TcpIngestProtocol(self), self.tcp_listen_addr[0], self.tcp_listen_addr[1],
+                    reuse_port=self.reuse_port or None)
+                self.ingest_mode += "+tcp"
+
+            if self.spool is not None:
+                pump = self.loop.create_task(self._pump_spool())
+
+            await self._run_tasks()
+        finally:
+            if tcp_server is not None:
+                tcp_server.close()
+                for connection in list(self.tcp_connections):
+                    connection.transport.close()
+                await tcp_server.wait_closed()
+            if reader_registered:
+                self.loop.remove_reader(sock.fileno())
+                self._reader = None
+            if ingest_transport is not None:
+                ingest_transport.close()
+            else:
+                sock.close()
+            if batch_forward_sock is not None:
+                if self._unsent:
+                    self.loop.remove_writer(batch_forward_sock.fileno())
+                    self.metrics.dropped += len(self._unsent)
+                    self._unsent.clear()
+                batch_forward_sock.close()
+            if pump is not None:
+                pump.cancel()
+                await asyncio.gather(pump, return_exceptions=True)
+            if self.forwarder is not None:
+                # Ingest is closed; give the queue a moment to reach the collector
+                await self.forwarder.stop()
+            if self.spool is not None:
+                # Whatever was not confirmed stays on disk and is replayed on the next start
+                self._confirm_spooled()
+                self.spool.close()
+                self.spool = None
+                self._spool_in_flight.clear()
+            if self._spool_sock is not None:
+                self._spool_sock.close()
+                self._spool_sock = None
+                self._spool_sender = None
+            self.forwarder = None
+            for destination in self.destinations:
+                await destination.stop()
+            self.destinations = ()
+            if forward_transport is not None:
+                forward_transport.close()
+            self._forward_transport = None
+            self._sender = None
+            self.ingest_paused = False
+
+    async def _run_tasks(self):
+        """Run the periodic tasks until stop() is called"""
+        tasks = [asyncio.create_task(self._run_periodic(interval, func, immediately))
+                 for interval, func, immediately in self._periodic]
+        self._started.set()
+
+        await self._stop_event.wait()
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _supports_readers(self):
+        """Selector loops support add_reader; the Windows proactor loop does not"""
+        try:
+            probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        except OSError:
+            return False
+        try:
+            self.loop.add_reader(probe.fileno(), lambda: None)
+            self.loop.remove_reader(probe.fileno())
+            return True
+        except NotImplementedError:
+            return False
+        finally:
+            probe.close()
+
+    def handle_datagram(self, data, addr):
+        """Run the handler for one datagram and forward the result"""
+        metrics = self.metrics
+        metrics.received += 1
+        metrics.bytes_in += len(data)
+        try:
+            payload = self.handler(data, addr)
+        except Exception as e:
+            print(f"Error processing message: {e}")
+            metrics.dropped += 1
+            return
+        if payload is None:
+            return
+        if self.destinations and not self._fan_out(payload, addr[0]):
+            metrics.claimed += 1
+        elif self.spool is not None:
+            self._spool_payload(payload)
+        elif self.forwarder is not None:
+            # Delivered/dropped counts are kept by the forwarder
+            self.forwarder.submit(payload)
+        elif self._forward_transport is not None:
+            self._forward_transport.sendto(payload)
+            metrics.forwarded += 1
+            metrics.bytes_out += len(payload)
+        elif self._sender is not None:
+            self._send_batch([payload])
+        else:
+            metrics.dropped += 1
+
+    def forward(self, payload):
+        """Send a message generated by the relay itself (loop thread) the same way as relayed ones"""
+        metrics = self.metrics
+        if self.spool is not None:
+            self._spool_payload(payload)
+        elif self.forwarder is not None:
+            self.forwarder.submit(payload)
+        elif self._forward_transport is not None:
+            self._forward_transport.sendto(payload)
+            metrics.forwarded += 1
+            metrics.bytes_out += len(payload)
+        elif self._sender is not None:
+            self._send_batch([payload])
+
+    def _drain(self, receiver):
+        """Reader callback: drain a batch, run the handler, forward in one sendmmsg"""
+        try:
+            batch = receiver.receive(timeout=0)
+        except OSError as e:
+            print(f"Error receiving messages: {e}")
+            return
+        handler = self.handler
+        fan_out = self._fan_out if self.destinations else None
+        outgoing = []
+        bytes_in = 0
+        claimed = 0
+        failed = 0
+        for data, addr in batch:
+            bytes_in += len(data)
+            try:
+                payload = handler(data, addr)
+            except Exception as e:
+                print(f"Error processing message: {e}")
+                failed += 1
+                continue
+            if payload is None:
+                continue
+            if fan_out is not None and not fan_out(payload, addr[0]):
+                claimed += 1
+                continue
+            outgoing.append(payload)
+        metrics = self.metrics
+        metrics.received += len(batch)
+        metrics.bytes_in += bytes_in
+        metrics.claimed += claimed
+        metrics.dropped += failed
+        forwarder = self.forwarder
+        if self.spool is not None or forwarder is not None:
+            # Delivered/dropped counts for queued messages are kept by the spool pump or the forwarder
+            enqueue = self._spool_payload if self.spool is not None else forwarder.submit
+            for payload in outgoing:
+                enqueue(payload)
+            return
+        if outgoing:
+            self._send_batch(outgoing)
+
+    def _send_batch(self, payloads):
+        """Forward through the batch sender without blocking the loop; a full send buffer defers the rest"""
+        unsent = self._unsent
+        if unsent:
+            # Keep order behind the backlog; the writer callback sends it
+            room = max(0, self.forward_queue_size - len(unsent))
+            unsent.extend(payloads[:room])
+            self.metrics.dropped += max(0, len(payloads) - room)
+            return
+        unsent.extend(payloads[self._send_now(payloads):])
+        if unsent:
+            # Stop draining the listen socket (its kernel buffer holds the burst) until there is room
+            if self._reader is not None:
+                self.loop.remove_reader(self._reader[0])
+            self.loop.add_writer(self._sender.sock.fileno(), self._flush_unsent)
+
+    def _send_now(self, payloads):
+        """One non-blocking send; returns how many payloads were used up (sent or failed)"""
+        sender = self._sender
+        metrics = self.metrics
+        errors = sender.errors
+        sent = sender.send(payloads, self.forward_addr, wait=False)
+        failed = sender.errors - errors
+        metrics.forwarded += sent
+        metrics.dropped += failed
+        if sent:
+            metrics.bytes_out += sum(map(len, payloads if sent == len(payloads) else payloads[:sent]))
+        return sent + failed
+
+    def _flush_unsent(self):
+        """Writer callback: the forward send buffer has room again"""
+        unsent = self._unsent
+        used = self._send_now(list(unsent))
+        for _ in range(used):
+            unsent.popleft()
+        if unsent:
+            return
+        self.loop.remove_writer(self._sender.sock.fileno())
+        if self._reader is not None and not self.ingest_paused:
+            self.loop.add_reader(self._reader[0], self._drain, self._reader[1])
+
+    def _fan_out(self, payload, source_ip):
+        """Queue payload for each extra destination that accepts it; False if one claimed it"""
+        to_collector = True
+        for destination in self.destinations:
+            if destination.accepts(source_ip, payload):
+                # A full queue counts the drop against that destination only
+                destination.submit(payload)
+                if destination.exclusive:
+                    to_collector = False
+        return to_collector
+
+    def _spool_payload(self, payload):
+        """Append one message to the disk spool and wake the pump"""
+        metrics = self.metrics
+        if self.spool.append(payload):
+            metrics.spooled += 1
+            if not self._spool_wakeup.is_set():
+                self._spool_wakeup.set()
+        else:
+            metrics.dropped += 1
+            metrics.spool_dropped += 1
+
+    async def _pump_spool(self):
+        """Forward spooled messages, committing the spool cursor as delivery is confirmed"""
+        spool = self.spool
+        forwarder = self.forwarder
+        wakeup = self._spool_wakeup
+        budget = max(1, int(self.spool_catchup_rate * SPOOL_TICK))
+        outage = False
+        while True:
+            confirmed = self._confirm_spooled()
+            if confirmed is None:
+                if not outage:
+                    print(f"Collector not accepting messages, holding them in the spool ({spool.pending})")
+                outage = True
+                await asyncio.sleep(SPOOL_RETRY_INTERVAL)
+            elif outage and confirmed:
+                outage = False
+                print(f"Collector accepting messages again, {spool.pending} spooled messages to replay")
+            spool.persist()
+
+            # While the collector is refusing messages, probe with one at a time
+            count = 1 if outage else budget
+            if forwarder is not None:
+                count = min(count, forwarder.high_water - forwarder.depth) if forwarder.connected else 0
+            read_from = spool.read_position
+            payloads, positions = spool.read(count) if count > 0 else ([], [])
+            backlog = bool(payloads) and len(payloads) == count
+            if payloads:
+                if forwarder is not None:
+                    for payload in payloads:
+                        forwarder.submit(payload)
+                    self._spool_submitted += len(payloads)
+                    self._spool_in_flight.append(
+                        (self._spool_submitted, positions[-1], len(payloads), 0))
+                else:
+                    sender = self._spool_sender
+                    errors = sender.errors
+                    sent = sender.send(payloads, self.forward_addr, wait=False)
+                    if sender.errors != errors:
+                        # Send error: the collector may have refused earlier datagrams too, so
+                        # everything unconfirmed goes again
+                        self._spool_in_flight.clear()
+                        spool.rewind()
+                        outage = True
+                    else:
+                        if sent:
+                            self._spool_in_flight.append(
+                                (None, positions[sent - 1], sent, sum(map(len, payloads[:sent]))))
+                        if sent < len(payloads):
+                            # Full send buffer: read the rest again after a tick instead of blocking the loop
+                            spool.rewind(positions[sent - 1] if sent else read_from)
+                            backlog = True
+
+            if outage or backlog:
+                # Backlog: cap the catch-up rate
+                await asyncio.sleep(SPOOL_TICK)
+                continue
+            # Caught up: wait for new messages (or the next confirmation / cursor write)
+            wakeup.clear()
+            if self._spool_in_flight or count == 0:
+                timeout = SPOOL_TICK
+            elif spool.dirty:
+                timeout = spool.commit_interval
+            else:
+                timeout = None
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _confirm_spooled(self):
+        """Commit spooled batches the collector has taken; returns how many, or None if it refused them"""
+        in_flight = self._spool_in_flight
+        if not in_flight:
+            return 0
+        spool = self.spool
+        confirmed = 0
+        if self.forwarder is not None:
+            # TCP: delivered once the forwarder has written and drained them
+            delivered = self.forwarder.delivered
+            while in_flight and in_flight[0][0] <= delivered:
+                _, position, count, _ = in_flight.popleft()
+                spool.commit(position, count)
+                confirmed += count
+            return confirmed
+        # UDP: a collector that is not listening answers with ICMP port unreachable, which the
+        # connected socket reports as a pending error (this also clears it)
+        error = self._spool_sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            in_flight.clear()
+            spool.rewind()
+            return None
+        metrics = self.metrics
+        for _, position, count, sent_bytes in in_flight:
+            spool.commit(position, count)
+            metrics.forwarded += count
+            metrics.bytes_out += sent_bytes
+            confirmed += count
+        in_flight.clear()
+        return confirmed
+
+    def _pause_ingest(self):
+        """Backpressure from the TCP forwarder: stop reading until its queue drains"""
+        self.ingest_paused = True
+        if self._reader is not None:
+            self.loop.remove_reader(self._reader[0])
+        for connection in self.tcp_connections:
+            connection.transport.pause_reading()
+
+    def _resume_ingest(self):
+        if not self.ingest_paused:
+            return
+        self.ingest_paused = False
+        if self._reader is not None:
+            self.loop.add_reader(self._reader[0], self._drain, self._reader[1])
+        for connection in self.tcp_connections:
+            connection.transport.resume_reading()
+
+    async def _run_periodic(self, interval, func, run_immediately):
+        if not run_immediately and await self._wait_stopped(interval):
+            return
+        while True:
+            try:
+                await self.loop.run_in_executor(None, func)
+            except Exception as e:
+                print(f"Error in periodic task {getattr(func, '__name__', func)}: {e}")
+            if await self._wait_stopped(interval):
+                return
+
+    async def _wait_stopped(self, timeout):
+        """Sleep for timeout seconds, returning True early if the relay is stopping"""
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
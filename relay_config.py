@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""External relay configuration (TOML), compiled once per load and hot-reloaded.
+
+The file is parsed and validated off the hot path into an immutable
+RelayConfig (read-only mapping, frozensets), from which the relay builds a
+new TransformPipeline. The relay swaps both in on its own loop thread, so a
+message is always handled entirely under the old or the new configuration
+and the hot path never takes a lock. A file that fails to parse or validate
+is reported and the running configuration is kept.
+
+Example (syslog_relay.toml):
+
+    [relay]
+    listen_port = 513
+    forward_host = "127.0.0.1"
+    forward_port = 514
+
+    [devices]
+    "192.168.2.110" = 5   # hours added to RFC 3164 timestamps
+    "192.168.2.120" = "America/New_York"   # or the device's time zone (to UTC, DST-aware)
+
+    [transforms]
+    date_strip_ips = ["192.168.2.110"]
+    docker_host_ips = ["192.168.2.110"]
+    dedup_window = 30     # seconds; repeats collapse into one line (0 = off)
+
+    [rate_limit]          # token buckets, see relay_ratelimit
+    source_rate = 500     # messages per second per source IP
+    app_rate = 100        # ... per source IP and app name
+
+    [diagnostics]         # per-message tracing, see relay_diagnostics
+    level = "debug"
+    sources = ["192.168.2.110"]
+
+    [[routes]]            # CIDR rule sets, see relay_routes
+    cidr = "172.17.0.0/16"
+    docker_tags = true
+    sample = 0.5
+
+    [[filters]]           # severity/facility rules, see relay_filters
+    action = "drop"
+    severities = ["debug"]
+
+    [[destinations]]      # extra collectors, see relay_destinations
+    name = "archive"
+    host = "192.168.2.50"
+    port = 514
+    max_severity = 4
+
+Sections and keys that are left out keep the built-in defaults. The per-IP
+settings become /32 routes; a [[routes]] entry for a more specific network
+wins, and one for the same network replaces them.
+"""
+import ipaddress
+import os
+from types import MappingProxyType
+
+from relay_destinations import parse_destination
+from relay_diagnostics import DIAGNOSTICS_KEYS, parse_diagnostics
+from relay_filters import parse_filter
+from relay_ratelimit import RATE_LIMIT_KEYS, parse_rate_limit
+from relay_routes import parse_route
+from relay_timestamps import parse_offset
+
+try:
+    import tomllib  # Python 3.11+
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+# Settings that only take effect when the sockets are recreated (relay restart)
+RESTART_SETTINGS = ('listen_port', 'forward_host', 'forward_port', 'destinations')
+
+# Arrays of tables ([[routes]], [[destinations]])
+TABLE_ARRAYS = ('routes', 'filters', 'destinations')
+
+# Keys accepted in each section ([devices] maps source IPs to hours, so any key)
+SECTION_KEYS = {
+    'relay': ('listen_port', 'forward_host', 'forward_port'),
+    'devices': None,
+    'transforms': ('date_strip_ips', 'docker_host_ips', 'dedup_window'),
+    'rate_limit': RATE_LIMIT_KEYS,
+    'diagnostics': DIAGNOSTICS_KEYS,
+}
+
+
+class RelayConfig:
+    """One compiled, immutable configuration"""
+    __slots__ = ('listen_port', 'forward_host', 'forward_port', 'device_offsets',
+                 'date_strip_ips', 'docker_host_ips', 'routes', 'filters', 'destinations',
+                 'rate_limit', 'dedup_window', 'diagnostics', 'source')
+
+    def __init__(self, listen_port, forward_host, forward_port, device_offsets, date_strip_ips,
+                 docker_host_ips, routes=(), destinations=(), rate_limit=None, dedup_window=0, filters=(),
+                 diagnostics=None, source=None):
+        object.__setattr__(self, 'listen_port', listen_port)
+        object.__setattr__(self, 'forward_host', forward_host)
+        object.__setattr__(self, 'forward_port', forward_port)
+        object.__setattr__(self, 'device_offsets', MappingProxyType(dict(device_offsets)))
+        object.__setattr__(self, 'date_strip_ips', frozenset(date_strip_ips))
+        object.__setattr__(self, 'docker_host_ips', frozenset(docker_host_ips))
+        # ((network, RuleSet), ...) from [[routes]], in file order
+        object.__setattr__(self, 'routes', tuple(routes))
+        # (FilterRule, ...) from [[filters]], in file order
+        object.__setattr__(self, 'filters', tuple(filters))
+        # (DestinationSpec, ...) from [[destinations]]
+        object.__setattr__(self, 'destinations', tuple(destinations))
+        # RateLimitSpec (None: no rate limiting)
+        object.__setattr__(self, 'rate_limit', rate_limit)
+        # Seconds repeats of a message are collapsed for (0: off)
+        object.__setattr__(self, 'dedup_window', dedup_window)
+        # DiagnosticsSpec (None: per-message diagnostics off)
+        object.__setattr__(self, 'diagnostics', diagnostics)
+        # Path the configuration was loaded from (None for the built-in defaults)
+        object.__setattr__(self, 'source', source)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RelayConfig is immutable")
+
+
+def _port(value, name):
+    if not isinstance(value, int) or isinstance(value, bool) or not 0 < value < 65536:
+        raise ValueError(f"{name} must be a port number, got {value!r}")
+    return value
+
+
+def _ip(value, name):
+    try:
+        return str(ipaddress.ip_address(value))
+    except ValueError:
+        raise ValueError(f"{name}: {value!r} is not an IP address") from None
+
+
+def compile_config(data, defaults, source=None):
+    """Validate parsed TOML data and build a RelayConfig (missing keys keep the defaults)"""
+    unknown = set(data) - set(SECTION_KEYS) - set(TABLE_ARRAYS)
+    if unknown:
+        raise ValueError(f"unknown section(s): {', '.join(sorted(unknown))}")
+    for section, keys in SECTION_KEYS.items():
+        if not isinstance(data.get(section, {}), dict):
+            raise ValueError(f"[{section}] must be a table")
+        # Catch typos instead of silently keeping the default
+        unknown = set(data.get(section, {})) - set(keys) if keys is not None else ()
+        if unknown:
+            raise ValueError(f"unknown key(s) in [{section}]: {', '.join(sorted(unknown))}")
+    relay = data.get('relay', {})
+    transforms = data.get('transforms', {})
+
+    device_offsets = defaults.device_offsets
+    if 'devices' in data:
+        device_offsets = {}
+        for ip, hours in data['devices'].items():
+            device_offsets[_ip(ip, 'devices')] = parse_offset(hours, f"devices: offset for {ip}")
+
+    def ip_list(key):
+        if key not in transforms:
+            return getattr(defaults, key)
+        values = transforms[key]
+        if not isinstance(values, list):
+            raise ValueError(f"transforms.{key} must be a list of IP addresses")
+        return [_ip(value, f"transforms.{key}") for value in values]
+
+    def table_array(key, parse):
+        if key not in data:
+            return getattr(defaults, key)
+        if not isinstance(data[key], list):
+            raise ValueError(f"{key} must be an array of tables ([[{key}]])")
+        return [parse(entry) for entry in data[key]]
+
+    routes = table_array('routes', parse_route)
+    filters = table_array('filters', parse_filter)
+    destinations = table_array('destinations', parse_destination)
+    names = [spec.name for spec in destinations]
+    if len(set(names)) != len(names):
+        raise ValueError(f"destination names must be unique, got {names}")
+
+    rate_limit = defaults.rate_limit
+    if 'rate_limit' in data:
+        if defaults.rate_limit is None:
+            raise ValueError("[rate_limit] needs built-in rate limit defaults")
+        rate_limit = parse_rate_limit(data['rate_limit'], defaults.rate_limit)
+
+    diagnostics = defaults.diagnostics
+    if 'diagnostics' in data:
+        if defaults.diagnostics is None:
+            raise ValueError("[diagnostics] needs built-in diagnostics defaults")
+        diagnostics = parse_diagnostics(data['diagnostics'], defaults.diagnostics)
+
+    dedup_window = transforms.get('dedup_window', defaults.dedup_window)
+    if not isinstance(dedup_window, (int, float)) or isinstance(dedup_window, bool) or not 0 <= dedup_window <= 3600:
+        raise ValueError(f"transforms.dedup_window must be 0-3600 seconds, got {dedup_window!r}")
+
+    forward_host = relay.get('forward_host', defaults.forward_host)
+    if not isinstance(forward_host, str) or not forward_host:
+        raise ValueError(f"relay.forward_host must be a host name or address, got {forward_host!r}")
+    return RelayConfig(
+        listen_port=_port(relay.get('listen_port', defaults.listen_port), 'relay.listen_port'),
+        forward_host=forward_host,
+        forward_port=_port(relay.get('forward_port', defaults.forward_port), 'relay.forward_port'),
+        device_offsets=device_offsets,
+        date_strip_ips=ip_list('date_strip_ips'),
+        docker_host_ips=ip_list('docker_host_ips'),
+        routes=routes,
+        destinations=destinations,
+        rate_limit=rate_limit,
+        dedup_window=dedup_window,
+        filters=filters,
+        diagnostics=diagnostics,
+        source=source,
+    )
+
+
+def load_config(path, defaults):
+    """Read and compile a TOML file; raises OSError/ValueError on a bad file"""
+    if tomllib is None:
+        raise ValueError("reading TOML needs Python 3.11+ or the tomli package")
+    with open(path, 'rb') as f:
+        try:
+            data = tomllib.load(f)
+        except tomllib.TOMLDecodeError as e:
+            raise ValueError(str(e)) from None
+    return compile_config(data, defaults, source=path)
+
+
+class ConfigWatcher:
+    """Tracks the config file and compiles a new RelayConfig when it changes"""
+
+    def __init__(self, path, defaults):
+        self.path = path
+        self.defaults = defaults
+        # Successful reloads after startup / files rejected
+        self.reloads = 0
+        self.errors = 0
+        self._signature = None
+        # Current configuration: the file if it exists and is valid, else the defaults
+        self.config = self._load() or defaults
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def poll(self):
+        """New RelayConfig if the file changed and compiles cleanly, else None"""
+        config = self._load()
+        if config is not None:
+            self.reloads += 1
+        return config
+
+    def _load(self):
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return None
+        # Remember the signature even if the file is bad, so it is reported once per change
+        self._signature = signature
+        try:
+            config = load_config(self.path, self.defaults)
+        except (OSError, ValueError) as e:
+            self.errors += 1
+            print(f"Error loading config {self.path}: {e} (keeping the current configuration)")
+            return None
+        self.config = config
+        return config
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Duplicate-message coalescing with a time-bucketed hash index.
+
+The first occurrence of a message is forwarded as usual. Further messages
+from the same source with the same normalized body (PRI and everything after
+the timestamp of the parsed message, trailing NUL/newlines removed) within the window are not
+forwarded, only counted. When the window of the first occurrence ends, one
+line is forwarded in their place: the first forwarded line with a
+" (repeated N times)" suffix, N being the number of suppressed copies.
+
+Index entries live in a dict keyed on (source IP, body hash) and are also
+listed in one-second buckets in creation order, so expiry pops whole buckets
+from the front of a deque: O(1) per entry, no scanning. At most max_entries
+messages are tracked at a time; beyond that new messages are forwarded
+untracked instead of growing the index. Runs on the relay loop thread.
+"""
+import time
+from collections import deque
+
+# Width of one expiry bucket, seconds
+BUCKET_SECONDS = 1.0
+
+# Trailing bytes ignored when comparing bodies
+TRAILING = b' \x00\r\n'
+
+
+def normalized_body(record):
+    """(PRI, rest of the message after the timestamp) of a SyslogMessage"""
+    # header_end is 0 when there is no timestamp: the whole datagram is compared
+    return record.pri, record.data[record.header_end:].rstrip(TRAILING)
+
+
+class DedupEntry:
+    """One tracked message: the line that was forwarded and the copies suppressed since"""
+    __slots__ = ('body', 'payload', 'count')
+
+    def __init__(self, body):
+        # Normalized body, compared on a hash match so a collision is never mistaken for a repeat
+        self.body = body
+        # Forwarded (transformed) line, set by the caller once the message has been processed
+        self.payload = None
+        self.count = 0
+
+
+class Deduplicator:
+    """Time-windowed duplicate index; check() per message, expire() periodically"""
+
+    def __init__(self, window=30.0, max_entries=10000, clock=time.monotonic):
+        # Seconds after the first occurrence during which copies are suppressed (0 disables)
+        self.window = window
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = {}
+        # (bucket number, [keys]) oldest first
+        self._buckets = deque()
+        # Totals since startup
+        self.suppressed = 0
+        self.untracked = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def enabled(self):
+        return self.window > 0
+
+    def configure(self, window):
+        """New window (config reload); entries already tracked keep their bucket"""
+        self.window = window
+
+    def check(self, source_ip, record):
+        """Entry to fill in with the forwarded line if record is new, None if it is a repeat (counted)"""
+        body = normalized_body(record)
+        key = (source_ip, hash(body))
+        entries = self._entries
+        entry = entries.get(key)
+        if entry is not None and entry.payload is not None and entry.body == body:
+            entry.count += 1
+            self.suppressed += 1
+            return None
+        if entry is not None or len(entries) >= self.max_entries:
+            # Hash collision, or a message whose first copy was not forwarded, or the index is full
+            self.untracked += 1
+            return DedupEntry(body)
+        entry = entries[key] = DedupEntry(body)
+        bucket = int(self.clock() // BUCKET_SECONDS)
+        buckets = self._buckets
+        if not buckets or buckets[-1][0] != bucket:
+            buckets.append((bucket, [key]))
+        else:
+            buckets[-1][1].append(key)
+        return entry
+
+    def expire(self, flush=False):
+        """Drop entries whose window has ended; returns the repeat lines to forward (all with flush)"""
+        horizon = int((self.clock() - self.window) // BUCKET_SECONDS)
+        buckets = self._buckets
+        entries = self._entries
+        lines = []
+        while buckets and (flush or buckets[0][0] < horizon):
+            for key in buckets.popleft()[1]:
+                entry = entries.pop(key, None)
+                if entry is not None and entry.count and entry.payload is not None:
+                    lines.append(b"%s (repeated %d time%s)" % (entry.payload.rstrip(TRAILING), entry.count,
+                                                                b"s" if entry.count > 1 else b""))
+        return lines
+
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""Extra forwarding destinations (fan-out).
+
+Besides the collector (FORWARD_HOST/FORWARD_PORT, with its spool), the relay
+can copy the stream to more destinations: a local archive collector, a
+second ktranslate for some sources, and so on. Each destination has its own
+bounded queue and its own sender task on the relay loop, so a slow or dead
+destination only fills (and then drops from) its own queue; it never holds
+up the collector, the other destinations or the receive loop.
+
+Routing: a destination can be limited to source networks (CIDR), to a
+maximum severity and to facilities, and an exclusive destination takes the
+messages it accepts away from the collector.
+"""
+import asyncio
+import ipaddress
+import itertools
+import socket
+import time
+from collections import deque, namedtuple
+
+from relay_filters import FACILITY_NAMES, NO_PRI, parse_levels, parse_pri, pri_table
+from relay_forward import TcpForwarder
+from relay_net import BatchSender
+from relay_routes import RouteTable
+
+# One configured destination (immutable; compared to decide whether a restart is needed)
+DestinationSpec = namedtuple('DestinationSpec',
+                             'name host port protocol sources max_severity exclusive queue_size facilities')
+
+DESTINATION_DEFAULTS = {'protocol': 'udp', 'sources': (), 'max_severity': None, 'exclusive': False,
+                        'queue_size': 10000, 'facilities': None}
+
+
+def parse_destination(entry):
+    """DestinationSpec from a destination dict; raises ValueError describing the problem"""
+    if not isinstance(entry, dict):
+        raise ValueError(f"destination must be a table, got {entry!r}")
+    unknown = set(entry) - set(DestinationSpec._fields)
+    if unknown:
+        raise ValueError(f"unknown destination key(s): {', '.join(sorted(unknown))}")
+    for key in ('name', 'host', 'port'):
+        if key not in entry:
+            raise ValueError(f"destination without a {key}")
+    values = dict(DESTINATION_DEFAULTS, **entry)
+    name = values['name']
+    if not isinstance(name, str) or not name or any(c in name for c in ' ,=|'):
+        raise ValueError(f"destination name must be one word, got {name!r}")
+    if not isinstance(values['host'], str) or not values['host']:
+        raise ValueError(f"destination {name}: host must be a host name or address")
+    port = values['port']
+    if not isinstance(port, int) or isinstance(port, bool) or not 0 < port < 65536:
+        raise ValueError(f"destination {name}: port must be a port number, got {port!r}")
+    if values['protocol'] not in ('udp', 'tcp'):
+        raise ValueError(f"destination {name}: protocol must be 'udp' or 'tcp'")
+    try:
+        sources = tuple(ipaddress.ip_network(cidr, strict=False) for cidr in values['sources'])
+    except (TypeError, ValueError):
+        raise ValueError(f"destination {name}: sources must be a list of networks/addresses") from None
+    max_severity = values['max_severity']
+    if max_severity is not None and (not isinstance(max_severity, int) or isinstance(max_severity, bool)
+                                     or not 0 <= max_severity <= 7):
+        raise ValueError(f"destination {name}: max_severity must be 0-7, got {max_severity!r}")
+    if not isinstance(values['exclusive'], bool):
+        raise ValueError(f"destination {name}: exclusive must be true or false")
+    queue_size = values['queue_size']
+    if not isinstance(queue_size, int) or isinstance(queue_size, bool) or queue_size < 1:
+        raise ValueError(f"destination {name}: queue_size must be a positive number")
+    facilities = values['facilities']
+    if facilities is not None:
+        facilities = parse_levels(facilities, FACILITY_NAMES, f"destination {name}: facilities")
+    return DestinationSpec(name, values['host'], port, values['protocol'], sources, max_severity,
+                           values['exclusive'], queue_size, facilities)
+
+
+class UdpSender:
+    """Bounded queue + sender task for one UDP destination"""
+
+    def __init__(self, address, stats, queue_size=10000, batch_size=64, sndbuf=None):
+        self.address = address
+        # DestinationStats: forwarded/bytes_out/latency on send, dropped/forward_overflow when full
+        self.stats = stats
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.sndbuf = sndbuf
+        # Datagrams need no connection; reported as connected for the stats line
+        self.connected = True
+        self._queue = deque()
+        self._enqueued = deque()
+        self._sock = None
+        self._sender = None
+        self._wakeup = None
+        self._task = None
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    async def start(self):
+        """Resolve the host (without blocking the loop), open the socket and start the sender task"""
+        loop = asyncio.get_running_loop()
+        family, _, _, _, sockaddr = (await loop.getaddrinfo(self.address[0], self.address[1],
+                                                            type=socket.SOCK_DGRAM))[0]
+        self.address = sockaddr[:2]
+        self._sock = socket.socket(family, socket.SOCK_DGRAM)
+        if self.sndbuf:
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf)
+        self._sock.setblocking(False)
+        self._sender = BatchSender(self._sock, self.batch_size)
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    async def stop(self, flush_timeout=2.0):
+        """Give queued messages flush_timeout seconds to go out, then close"""
+        if self._task is None:
+            return
+        deadline = time.monotonic() + flush_timeout
+        while self._queue and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._sock.close()
+
+    def submit(self, payload):
+        """Queue one message; returns False (and counts a drop) if the queue is full"""
+        queue = self._queue
+        if len(queue) >= self.queue_size:
+            self.stats.dropped += 1
+            self.stats.forward_overflow += 1
+            return False
+        queue.append(payload)
+        self._enqueued.append(time.monotonic())
+        if len(queue) == 1:
+            self._wakeup.set()
+        return True
+
+    async def _run(self):
+        queue = self._queue
+        enqueued = self._enqueued
+        stats = self.stats
+        sender = self._sender
+        while True:
+            if not queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            batch = list(itertools.islice(queue, self.batch_size))
+            errors = sender.errors
+            sent = sender.send(batch, self.address, wait=False)
+            failed = sender.errors - errors
+            now = time.monotonic()
+            sent_bytes = 0
+            for _ in range(sent + failed):
+                sent_bytes += len(queue.popleft())
+                stats.record_latency(now - enqueued.popleft())
+            stats.forwarded += sent
+            stats.dropped += failed
+            stats.bytes_out += sent_bytes
+            # Full send buffer: back off briefly; otherwise let the receive loop run between batches
+            await asyncio.sleep(0.005 if sent + failed < len(batch) else 0)
+
+
+class Destination:
+    """One extra destination: routing rules plus its own queue and sender"""
+
+    def __init__(self, spec, stats, batch_size=64, sndbuf=None, backoff_max=30.0):
+        self.spec = spec
+        self.name = spec.name
+        self.protocol = spec.protocol
+        self.exclusive = spec.exclusive
+        # Source networks this destination takes (None: every source); lookups are memoized per IP
+        self._sources = RouteTable([(network, True) for network in spec.sources]) if spec.sources else None
+        # Accepted PRI values (None: all); messages without a readable PRI are passed rather than silently lost
+        self._pri = None
+        if spec.max_severity is not None or spec.facilities is not None:
+            severities = frozenset(range(spec.max_severity + 1)) if spec.max_severity is not None else None
+            self._pri = pri_table(severities, spec.facilities)[:NO_PRI] + (True,)
+        if spec.protocol == 'tcp':
+            # No backpressure: a slow extra destination drops from its own queue instead of pausing ingest
+            self.sender = TcpForwarder((spec.host, spec.port), stats, queue_size=spec.queue_size,
+                                       backoff_max=backoff_max, track_latency=True)
+        else:
+            self.sender = UdpSender((spec.host, spec.port), stats, spec.queue_size, batch_size, sndbuf)
+        self.submit = self.sender.submit
+
+    @property
+    def depth(self):
+        return self.sender.depth
+
+    @property
+    def connected(self):
+        return self.sender.connected
+
+    def accepts(self, source_ip, payload):
+        """Routing rules: source network, severity and facility"""
+        if self._sources is not None and self._sources.lookup(source_ip) is None:
+            return False
+        return self._pri is None or self._pri[parse_pri(payload)]
+
+    async def start(self):
+        if self.protocol == 'tcp':
+            # TcpForwarder resolves the host when it connects, on its own task
+            self.sender.start()
+        else:
+            await self.sender.start()
+
+    async def stop(self):
+        await self.sender.stop()
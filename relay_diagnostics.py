@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Leveled, sampled per-message diagnostics.
+
+Nothing about individual messages is printed or logged on the hot path
+unless diagnostics are switched on; when they are off the cost per message
+is one attribute read (Diagnostics.active). They can be switched on at
+runtime from the [diagnostics] section of the config file (hot-reloaded),
+limited to some source networks and/or a fraction of the messages, so
+tracing one device on a busy relay does not make console or disk I/O the
+throughput ceiling.
+
+Levels:
+    off         nothing per message (default)
+    messages    incoming and outgoing text of traced messages in the log file
+    debug       also the parsed header fields in the log file and a summary line
+                per traced message on the console
+
+Keys ([diagnostics] table or the DIAGNOSTICS_* settings):
+    level       "off", "messages" or "debug"
+    sources     CIDR list of sources to trace           (default: all)
+    sample      fraction of the matching messages traced (default: 1)
+"""
+import ipaddress
+from collections import namedtuple
+
+from relay_routes import RouteTable
+
+LEVELS = ('off', 'messages', 'debug')
+
+OFF, MESSAGES, DEBUG = range(len(LEVELS))
+
+# Diagnostics settings (immutable)
+DiagnosticsSpec = namedtuple('DiagnosticsSpec', 'level sources sample')
+
+DIAGNOSTICS_KEYS = DiagnosticsSpec._fields
+
+
+def parse_diagnostics(entry, defaults):
+    """DiagnosticsSpec from a [diagnostics] dict (missing keys keep defaults); raises ValueError"""
+    if not isinstance(entry, dict):
+        raise ValueError(f"diagnostics must be a table, got {entry!r}")
+    unknown = set(entry) - set(DIAGNOSTICS_KEYS)
+    if unknown:
+        raise ValueError(f"unknown key(s) in [diagnostics]: {', '.join(sorted(unknown))}")
+    values = defaults._replace(**entry)
+    if values.level not in LEVELS:
+        raise ValueError(f"diagnostics.level must be one of {', '.join(LEVELS)}, got {values.level!r}")
+    try:
+        sources = tuple(ipaddress.ip_network(cidr, strict=False) for cidr in values.sources)
+    except (TypeError, ValueError):
+        raise ValueError("diagnostics.sources must be a list of networks/addresses") from None
+    sample = values.sample
+    if not isinstance(sample, (int, float)) or isinstance(sample, bool) or not 0 < sample <= 1:
+        raise ValueError(f"diagnostics.sample must be a fraction in (0, 1], got {sample!r}")
+    return values._replace(sources=sources, sample=float(sample))
+
+
+class Diagnostics:
+    """Runtime switch for per-message diagnostics; check `active` before calling traces()"""
+
+    def __init__(self, spec):
+        self.configure(spec)
+
+    def configure(self, spec):
+        """Apply new settings (config reload, relay loop thread)"""
+        self.spec = spec
+        self.level = LEVELS.index(spec.level)
+        # Source networks traced (None: every source); lookups are memoized per IP
+        self._sources = RouteTable([(network, True) for network in spec.sources]) if spec.sources else None
+        self._credit = 0.0
+        # Read once per message: False means no further diagnostics work for it
+        self.active = self.level > OFF
+
+    def traces(self, source_ip):
+        """True if a message from source_ip should be traced (source filter, then sampling)"""
+        if self._sources is not None and self._sources.lookup(source_ip) is None:
+            return False
+        sample = self.spec.sample
+        if sample < 1.0:
+            # Exactly `sample` of the matching messages, evenly spaced
+            self._credit += sample
+            if self._credit < 1.0:
+                return False
+            self._credit -= 1.0
+        return True
+
+    def describe(self):
+        spec = self.spec
+        parts = [spec.level]
+        if spec.level != 'off':
+            if spec.sources:
+                parts.append(f"sources={','.join(map(str, spec.sources))}")
+            if spec.sample < 1.0:
+                parts.append(f"sample={spec.sample:g}")
+        return ' '.join(parts)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""Prometheus metrics endpoint for the relay (HTTP, localhost by default).
+
+The relay's periodic metrics sample (an executor thread, not the relay loop)
+publishes a counter snapshot (RelayMetrics.snapshot(), merged across worker
+processes) plus a few gauges; publish() is one attribute assignment. The
+HTTP server runs on its own thread and renders the text exposition format
+from the last published snapshot, once per snapshot, so a scrape never
+reads the relay's live counters or waits on the relay loop. Process RSS and CPU time are read at
+scrape time from the OS (psutil).
+
+Served paths: /metrics (text format 0.0.4) and / (a pointer to /metrics).
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psutil
+
+from relay_metrics import COUNTER_FIELDS, DESTINATION_FIELDS, LATENCY_BUCKETS_US
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+PREFIX = 'syslog_relay'
+
+# Help text per RelayMetrics counter (exported as <PREFIX>_<name>_total)
+COUNTER_HELP = {
+    'received': "Messages received (UDP datagrams and TCP frames)",
+    'forwarded': "Messages forwarded to the collector",
+    'dropped': "Messages lost (handler or send errors, full queues or spool), not rule drops",
+    'bytes_in': "Bytes received",
+    'bytes_out': "Bytes forwarded to the collector",
+    'transformed': "Messages that went through the RFC 3164 transforms",
+    'tcp_accepted': "TCP ingest connections accepted",
+    'frames_truncated': "TCP frames truncated to the maximum message size",
+    'forward_overflow': "Messages dropped because the forward queue was full",
+    'forward_connects': "TCP connections made to the collector",
+    'spooled': "Messages written to the disk spool",
+    'spool_dropped': "Messages the disk spool could not take",
+    'filtered': "Messages dropped or sampled out by the route rules",
+    'claimed': "Messages taken by an exclusive extra destination",
+    'rate_limited': "Messages suppressed by the rate limiter",
+    'deduplicated': "Repeats collapsed by duplicate coalescing",
+    'pri_filtered': "Messages dropped or sampled out by the severity/facility filters",
+    'traced': "Messages selected for diagnostics",
+}
+
+# Per-destination counters (label destination=...); latency_sum_us is exported in seconds
+DESTINATION_HELP = {
+    'forwarded': "Messages delivered to an extra destination",
+    'dropped': "Messages an extra destination dropped",
+    'bytes_out': "Bytes delivered to an extra destination",
+    'forward_overflow': "Messages dropped because an extra destination's queue was full",
+    'forward_connects': "TCP connections made to an extra destination",
+    'latency_count': "Messages whose queueing delay was measured",
+}
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, float):
+        if value != value:
+            return 'NaN'
+        if value in (float('inf'), float('-inf')):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(int(value))
+
+
+class _Family:
+    """Lines of one metric family (HELP, TYPE, samples)"""
+
+    def __init__(self, lines, name, kind, help_text):
+        self.lines = lines
+        self.name = name
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, value, labels=None, suffix=''):
+        if labels:
+            label_text = ','.join(f'{key}="{escape_label(label)}"' for key, label in labels.items())
+            self.lines.append(f"{self.name}{suffix}{{{label_text}}} {format_value(value)}")
+        else:
+            self.lines.append(f"{self.name}{suffix} {format_value(value)}")
+
+
+def render_snapshot(snapshot, gauges, version=None):
+    """Exposition text for a counter snapshot and gauges {name: (help, value or {label value: value}, label name)}"""
+    lines = []
+    if version is not None:
+        _Family(lines, f"{PREFIX}_build_info", 'gauge', "Relay version").sample(1, {'version': version})
+    for name in COUNTER_FIELDS:
+        _Family(lines, f"{PREFIX}_{name}_total", 'counter', COUNTER_HELP.get(name, name)).sample(snapshot[name])
+
+    family = _Family(lines, f"{PREFIX}_source_messages_total", 'counter',
+                     "Messages received per source IP (sources past the tracking limit count as 'other')")
+    for source, count in sorted(snapshot['per_source'].items()):
+        family.sample(count, {'source': source})
+    family = _Family(lines, f"{PREFIX}_format_messages_total", 'counter', "Messages received per syslog format")
+    for name, count in sorted(snapshot['per_format'].items()):
+        family.sample(count, {'format': name})
+
+    # Histogram buckets are cumulative and in seconds
+    family = _Family(lines, f"{PREFIX}_transform_duration_seconds", 'histogram',
+                     "Time spent in the RFC 3164 transforms per message")
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS_US, snapshot['latency_buckets']):
+        cumulative += count
+        family.sample(cumulative, {'le': repr(bound / 1e6)}, '_bucket')
+    cumulative += snapshot['latency_buckets'][-1]
+    family.sample(cumulative, {'le': '+Inf'}, '_bucket')
+    family.sample(snapshot['latency_sum_us'] / 1e6, suffix='_sum')
+    family.sample(cumulative, suffix='_count')
+
+    destinations = snapshot['destinations']
+    if destinations:
+        for field in DESTINATION_FIELDS:
+            if field == 'latency_sum_us':
+                family = _Family(lines, f"{PREFIX}_destination_latency_seconds_total", 'counter',
+                                 "Queueing delay summed over the measured messages of an extra destination")
+                for name, counts in sorted(destinations.items()):
+                    family.sample(counts[field] / 1e6, {'destination': name})
+                continue
+            family = _Family(lines, f"{PREFIX}_destination_{field}_total", 'counter', DESTINATION_HELP[field])
+            for name, counts in sorted(destinations.items()):
+                family.sample(counts[field], {'destination': name})
+
+    for name, (help_text, value, label) in gauges.items():
+        family = _Family(lines, f"{PREFIX}_{name}", 'gauge', help_text)
+        if isinstance(value, dict):
+            for key, item in sorted(value.items()):
+                family.sample(item, {label: key})
+        else:
+            family.sample(value)
+    return '\n'.join(lines) + '\n'
+
+
+def render_process(process, published):
+    """Exposition text for this process (RSS, CPU, threads) and when the snapshot was published"""
+    lines = []
+    try:
+        memory = process.memory_info()
+        cpu = process.cpu_times()
+        _Family(lines, 'process_resident_memory_bytes', 'gauge', "Resident memory size in bytes").sample(memory.rss)
+        _Family(lines, 'process_virtual_memory_bytes', 'gauge', "Virtual memory size in bytes").sample(memory.vms)
+        _Family(lines, 'process_cpu_seconds_total', 'counter',
+                "User and system CPU time in seconds").sample(float(cpu.user + cpu.system))
+        _Family(lines, 'process_start_time_seconds', 'gauge',
+                "Start time of the process since the epoch in seconds").sample(float(process.create_time()))
+        _Family(lines, 'process_threads', 'gauge', "Threads in the process").sample(process.num_threads())
+    except psutil.Error as e:
+        print(f"Error reading process metrics: {e}")
+    if published is not None:
+        _Family(lines, f"{PREFIX}_snapshot_timestamp_seconds", 'gauge',
+                "When the relay published the counters above (epoch seconds)").sample(float(published))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter:
+    """HTTP server thread serving the last published snapshot as Prometheus metrics"""
+
+    def __init__(self, host='127.0.0.1', port=9513, version=None):
+        self.host = host
+        self.port = port
+        self.version = version
+        self.scrapes = 0
+        # (published time, snapshot, gauges): replaced as a whole by publish()
+        self._published = None
+        # (published tuple, rendered bytes): rendering happens once per snapshot, on a scrape
+        self._rendered = (None, b'')
+        self._render_lock = threading.Lock()
+        self._process = psutil.Process()
+        self._server = None
+        self._thread = None
+
+    def publish(self, snapshot, gauges):
+        """Make a new snapshot current (metrics sampling thread; no locking)"""
+        self._published = (time.time(), snapshot, gauges)
+
+    def start(self):
+        """Bind and serve on a daemon thread; raises OSError if the port is taken"""
+        if self._server is not None:
+            return
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == '/metrics':
+                    body = exporter.render()
+                    content_type = CONTENT_TYPE
+                    status = 200
+                elif path == '/':
+                    body = b'<html><body><a href="/metrics">/metrics</a></body></html>\n'
+                    content_type = 'text/html; charset=utf-8'
+                    status = 200
+                else:
+                    body = b'Not found\n'
+                    content_type = 'text/plain; charset=utf-8'
+                    status = 404
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # One line per scrape would flood the console
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        self._thread = None
+
+    def render(self):
+        """Exposition bytes: the published snapshot (rendered once) plus current process metrics"""
+        self.scrapes += 1
+        published = self._published
+        if published is None:
+            # Nothing sampled yet (the relay publishes within its first sample interval)
+            return render_process(self._process, None).encode('utf-8')
+        with self._render_lock:
+            rendered_for, body = self._rendered
+            if rendered_for is not published:
+                _, snapshot, gauges = published
+                body = render_snapshot(snapshot, gauges, self.version).encode('utf-8')
+                self._rendered = (published, body)
+        return body + render_process(self._process, published[0]).encode('utf-8')
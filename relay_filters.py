@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""PRI parsing and the severity/facility filter engine.
+
+parse_pri() reads the <PRI> at the start of a raw datagram with byte checks
+only (no regex, no decode); facility is PRI >> 3 and severity PRI & 7.
+
+Filter rules drop or sample messages by severity, facility and source
+network. They are compiled per source IP into a table indexed by PRI (one
+slot per PRI value plus one for messages without a PRI), so the decision
+for a message is one parse and one tuple index, taken before any decode or
+transform work. Rules are checked in order and the first match wins; a
+'forward' rule exempts what it matches from the rules after it.
+
+Rule entries (TOML [[filters]] tables or FILTER_RULES dicts):
+    action      "drop", "sample" or "forward"               (required)
+    severities  names or numbers, e.g. ["debug", "info"]    (default: any)
+    facilities  names or numbers, e.g. ["local0", 3]        (default: any)
+    sources     CIDR list                                   (default: any)
+    sample      fraction forwarded for action "sample"
+"""
+import ipaddress
+
+from relay_routes import RouteTable
+
+SEVERITY_NAMES = ('emerg', 'alert', 'crit', 'err', 'warning', 'notice', 'info', 'debug')
+
+FACILITY_NAMES = ('kern', 'user', 'mail', 'daemon', 'auth', 'syslog', 'lpr', 'news', 'uucp', 'cron',
+                  'authpriv', 'ftp', 'ntp', 'security', 'console', 'solaris-cron',
+                  'local0', 'local1', 'local2', 'local3', 'local4', 'local5', 'local6', 'local7')
+
+# Index used for messages without a valid PRI (valid PRIs are 0-191)
+NO_PRI = 192
+
+FILTER_KEYS = ('action', 'severities', 'facilities', 'sources', 'sample')
+
+
+def parse_pri(data):
+    """PRI value (0-191) at the start of a raw datagram, or NO_PRI"""
+    if data[:1] != b'<':
+        return NO_PRI
+    end = data.find(b'>', 2, 5)
+    if end < 0:
+        return NO_PRI
+    digits = data[1:end]
+    if not digits.isdigit():
+        return NO_PRI
+    pri = int(digits)
+    return pri if pri < NO_PRI else NO_PRI
+
+
+def parse_levels(values, names, what):
+    """frozenset of level numbers from a list of names/numbers; raises ValueError"""
+    if isinstance(values, (str, int)):
+        values = [values]
+    if not isinstance(values, (list, tuple)):
+        raise ValueError(f"{what} must be a list of names or numbers, got {values!r}")
+    levels = set()
+    for value in values:
+        if isinstance(value, str) and value.lower() in names:
+            levels.add(names.index(value.lower()))
+        elif isinstance(value, int) and not isinstance(value, bool) and 0 <= value < len(names):
+            levels.add(value)
+        else:
+            raise ValueError(f"{what}: {value!r} is not one of {', '.join(names)} or 0-{len(names) - 1}")
+    return frozenset(levels)
+
+
+def pri_table(severities=None, facilities=None):
+    """Tuple indexed by PRI (and NO_PRI): True where severity and facility both match"""
+    table = [severities is None and facilities is None] * (NO_PRI + 1)
+    for pri in range(NO_PRI):
+        table[pri] = ((severities is None or pri & 7 in severities)
+                      and (facilities is None or pri >> 3 in facilities))
+    return tuple(table)
+
+
+class FilterRule:
+    """One compiled rule; admit() is asked for each message it matches"""
+    __slots__ = ('action', 'severities', 'facilities', 'sources', 'sample', 'matches_pri', '_credit')
+
+    def __init__(self, action, severities=None, facilities=None, sources=(), sample=1.0):
+        self.action = action
+        self.severities = severities
+        self.facilities = facilities
+        # Networks the rule applies to (empty: every source)
+        self.sources = tuple(sources)
+        self.sample = sample
+        self.matches_pri = pri_table(severities, facilities)
+        self._credit = 0.0
+
+    def admit(self):
+        """Drop/sample decision for one matching message"""
+        if self.action == 'drop':
+            return False
+        # Forward exactly `sample` of the matching messages, evenly spaced
+        self._credit += self.sample
+        if self._credit >= 1.0:
+            self._credit -= 1.0
+            return True
+        return False
+
+    def describe(self):
+        parts = [self.action if self.action != 'sample' else f"sample={self.sample:g}"]
+        if self.severities is not None:
+            parts.append(f"severities={','.join(SEVERITY_NAMES[s] for s in sorted(self.severities))}")
+        if self.facilities is not None:
+            parts.append(f"facilities={','.join(FACILITY_NAMES[f] for f in sorted(self.facilities))}")
+        if self.sources:
+            parts.append(f"sources={','.join(map(str, self.sources))}")
+        return ' '.join(parts)
+
+
+def parse_filter(entry):
+    """FilterRule from a filter dict; raises ValueError describing the problem"""
+    if not isinstance(entry, dict):
+        raise ValueError(f"filter must be a table, got {entry!r}")
+    unknown = set(entry) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"unknown filter key(s): {', '.join(sorted(unknown))}")
+    action = entry.get('action')
+    if action not in ('drop', 'sample', 'forward'):
+        raise ValueError(f"filter action must be 'drop', 'sample' or 'forward', got {action!r}")
+    severities = entry.get('severities')
+    if severities is not None:
+        severities = parse_levels(severities, SEVERITY_NAMES, 'filter severities')
+    facilities = entry.get('facilities')
+    if facilities is not None:
+        facilities = parse_levels(facilities, FACILITY_NAMES, 'filter facilities')
+    try:
+        sources = [ipaddress.ip_network(cidr, strict=False) for cidr in entry.get('sources', ())]
+    except (TypeError, ValueError):
+        raise ValueError("filter sources must be a list of networks/addresses") from None
+    sample = entry.get('sample', 1.0 if action != 'sample' else None)
+    if not isinstance(sample, (int, float)) or isinstance(sample, bool) or not 0 < sample <= 1:
+        raise ValueError(f"filter sample must be a fraction in (0, 1], got {sample!r}")
+    return FilterRule(action, severities, facilities, sources, float(sample))
+
+
+class FilterEngine:
+    """Ordered filter rules, compiled into one PRI-indexed action table per source"""
+
+    def __init__(self, rules=()):
+        self.rules = tuple(rules)
+        # Source filter per rule (None: every source), longest-prefix tables from relay_routes
+        self._sources = [RouteTable([(network, True) for network in rule.sources]) if rule.sources else None
+                         for rule in self.rules]
+        # Rule combination -> table, shared by every source that matches the same rules
+        self._tables = {}
+
+    def __len__(self):
+        return len(self.rules)
+
+    def table_for(self, source_ip):
+        """Tuple indexed by PRI: the FilterRule to ask (drop/sample), or None to forward; None if no rule applies"""
+        applicable = tuple(rule for rule, sources in zip(self.rules, self._sources)
+                           if sources is None or sources.lookup(source_ip) is not None)
+        if not applicable:
+            return None
+        table = self._tables.get(applicable)
+        if table is None:
+            actions = [None] * (NO_PRI + 1)
+            for pri in range(NO_PRI + 1):
+                for rule in applicable:
+                    if rule.matches_pri[pri]:
+                        actions[pri] = rule if rule.action != 'forward' else None
+                        break
+            table = self._tables[applicable] = tuple(actions)
+        return table
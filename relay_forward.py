@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""Persistent TCP forwarding to the collector (ktranslate).
+
+Instead of one UDP datagram per message, TcpForwarder keeps one long-lived
+TCP connection and writes RFC 6587 octet-counted frames ("LEN SP MSG"),
+coalescing everything queued into writes of up to batch_bytes. Messages wait
+in a bounded in-memory queue while the collector is down or slow; the
+connection is re-established with exponential backoff. A batch is only
+dropped from the queue once it has been written and drained, so a
+collector restart re-sends the batch in flight rather than losing it.
+
+Backpressure: when the queue passes its high-water mark while the collector
+is connected but slow, the relay is asked to pause ingestion (the kernel
+socket buffer absorbs the burst) and to resume below the low-water mark.
+While the collector is unreachable ingestion continues and messages that do
+not fit are dropped and counted.
+
+Runs on the relay's event loop; submit() must be called from the loop thread.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+
+
+class TcpForwarder:
+    """Bounded queue + one persistent octet-framed TCP connection"""
+
+    def __init__(self, address, metrics, queue_size=10000, batch_bytes=64 * 1024,
+                 backoff_initial=0.5, backoff_max=30.0, high_water=0.8, low_water=0.5,
+                 on_pause=None, on_resume=None, track_latency=False):
+        self.address = address
+        # RelayMetrics of the owning relay: forwarded/bytes_out on delivery, dropped/forward_overflow when full
+        self.metrics = metrics
+        self.queue_size = queue_size
+        self.batch_bytes = batch_bytes
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.high_water = int(queue_size * high_water)
+        self.low_water = int(queue_size * low_water)
+        self.on_pause = on_pause
+        self.on_resume = on_resume
+        self.connected = False
+        self.paused = False
+        # Messages written and drained so far (lets the disk spool confirm delivery)
+        self.delivered = 0
+        self._queue = deque()
+        # Enqueue times, parallel to the queue, when metrics.record_latency should see queueing delay
+        self._enqueued = deque() if track_latency else None
+        self._wakeup = None
+        self._task = None
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    def start(self):
+        """Start the connection/writer task on the running loop"""
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, flush_timeout=2.0):
+        """Give queued messages flush_timeout seconds to go out, then close"""
+        if self._task is None:
+            return
+        if self._queue and self.connected:
+            try:
+                await asyncio.wait_for(self._drained(), flush_timeout)
+            except asyncio.TimeoutError:
+                print(f"TCP forwarder stopping with {len(self._queue)} messages still queued")
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def submit(self, payload):
+        """Queue one message; returns False (and counts a drop) if the queue is full"""
+        queue = self._queue
+        if len(queue) >= self.queue_size:
+            self.metrics.dropped += 1
+            self.metrics.forward_overflow += 1
+            return False
+        queue.append(payload)
+        if self._enqueued is not None:
+            self._enqueued.append(time.monotonic())
+        if len(queue) == 1:
+            self._wakeup.set()
+        # Only push back on a connected-but-slow collector; while it is down, overflow is dropped and counted
+        if not self.paused and self.connected and len(queue) >= self.high_water:
+            self.paused = True
+            if self.on_pause is not None:
+                self.on_pause()
+        return True
+
+    async def _drained(self):
+        while self._queue:
+            await asyncio.sleep(0.05)
+
+    async def _run(self):
+        attempt = 0
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(*self.address)
+            except OSError as e:
+                delay = min(self.backoff_max, self.backoff_initial * (2 ** attempt))
+                delay += random.uniform(0, delay / 10)  # Jitter so workers do not reconnect in lockstep
+                if attempt == 0:
+                    print(f"Error connecting to collector {self.address[0]}:{self.address[1]}: {e}")
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            if attempt:
+                print(f"Reconnected to collector {self.address[0]}:{self.address[1]} after {attempt} attempts")
+            attempt = 0
+            self.metrics.forward_connects += 1
+            self.connected = True
+            # The collector never sends anything; reading only detects it closing the connection
+            watcher = asyncio.get_running_loop().create_task(self._watch(reader, writer))
+            try:
+                await self._write_loop(writer)
+            except (OSError, ConnectionError) as e:
+                print(f"Error forwarding to collector, reconnecting: {e}")
+            finally:
+                self.connected = False
+                watcher.cancel()
+                writer.close()
+                self._resume()
+
+    async def _watch(self, reader, writer):
+        try:
+            while await reader.read(4096):
+                pass
+        except (OSError, ConnectionError):
+            pass
+        # Wake the write loop so it notices the closed connection
+        writer.close()
+        self._wakeup.set()
+
+    async def _write_loop(self, writer):
+        queue = self._queue
+        metrics = self.metrics
+        while True:
+            if not queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                if writer.is_closing():
+                    raise ConnectionError("collector closed the connection")
+                continue
+            # Coalesce as many queued messages as fit in one write
+            frames = []
+            size = 0
+            count = 0
+            for payload in queue:
+                frame = b'%d %s' % (len(payload), payload)
+                frames.append(frame)
+                size += len(frame)
+                count += 1
+                if size >= self.batch_bytes:
+                    break
+            writer.write(b''.join(frames))
+            await writer.drain()
+            if writer.is_closing():
+                raise ConnectionError("collector closed the connection")
+            # Only now is the batch handed to the kernel; drop it from the queue
+            delivered_bytes = 0
+            for _ in range(count):
+                delivered_bytes += len(queue.popleft())
+            self.delivered += count
+            metrics.forwarded += count
+            metrics.bytes_out += delivered_bytes
+            if self._enqueued is not None:
+                now = time.monotonic()
+                for _ in range(count):
+                    metrics.record_latency(now - self._enqueued.popleft())
+            if self.paused and len(queue) <= self.low_water:
+                self._resume()
+
+    def _resume(self):
+        if self.paused:
+            self.paused = False
+            if self.on_resume is not None:
+                self.on_resume()
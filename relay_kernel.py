@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Socket buffer sizing and kernel-level UDP drop counters.
+
+Datagrams the relay never sees are dropped by the kernel when a socket's
+receive buffer is full. These helpers size SO_RCVBUF/SO_SNDBUF, detect when
+the kernel clamped the requested size (net.core.rmem_max / wmem_max on
+Linux), and read the drop counters from /proc/net/udp (per socket) and
+/proc/net/snmp (system-wide Udp: InErrors, RcvbufErrors, SndbufErrors).
+The /proc readers return None on platforms without them (Windows).
+"""
+import socket
+import sys
+
+PROC_NET_UDP = '/proc/net/udp'
+PROC_NET_SNMP = '/proc/net/snmp'
+
+# Udp: counters reported from /proc/net/snmp
+SNMP_UDP_FIELDS = ('InDatagrams', 'NoPorts', 'InErrors', 'RcvbufErrors', 'SndbufErrors')
+
+
+def set_socket_buffers(sock, rcvbuf=None, sndbuf=None):
+    """Request buffer sizes on sock; returns {option: (requested, actual)} for the options set"""
+    results = {}
+    for name, option, size in (('SO_RCVBUF', socket.SO_RCVBUF, rcvbuf),
+                               ('SO_SNDBUF', socket.SO_SNDBUF, sndbuf)):
+        if not size:
+            continue
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, option, size)
+        except OSError as e:
+            print(f"Error setting {name} to {size}: {e}")
+        results[name] = (size, sock.getsockopt(socket.SOL_SOCKET, option))
+    return results
+
+
+def clamped_buffers(results):
+    """Options whose effective size is below the requested size"""
+    # Linux doubles the requested size (bookkeeping overhead) and reports that,
+    # so an unclamped request reads back as 2 * requested; anything less was clamped
+    factor = 2 if sys.platform.startswith('linux') else 1
+    return {name: sizes for name, sizes in results.items() if sizes[1] < sizes[0] * factor}
+
+
+def probe_socket_buffers(rcvbuf=None, sndbuf=None):
+    """Apply the sizes to a throwaway UDP socket to see what the kernel grants"""
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        return set_socket_buffers(probe, rcvbuf, sndbuf)
+    finally:
+        probe.close()
+
+
+def udp_socket_stats(port, path=PROC_NET_UDP):
+    """Drops and queued bytes for every UDP socket bound to port (None if unavailable)"""
+    try:
+        with open(path) as f:
+            lines = f.readlines()[1:]
+    except OSError:
+        return None
+    stats = {'sockets': 0, 'drops': 0, 'rx_queue': 0, 'tx_queue': 0}
+    for line in lines:
+        # sl local_address rem_address st tx_queue:rx_queue tr tm->when retrnsmt uid timeout inode ref pointer drops
+        fields = line.split()
+        if len(fields) < 13:
+            continue
+        try:
+            if int(fields[1].rsplit(':', 1)[1], 16) != port:
+                continue
+            tx_queue, rx_queue = fields[4].split(':')
+            stats['sockets'] += 1
+            stats['tx_queue'] += int(tx_queue, 16)
+            stats['rx_queue'] += int(rx_queue, 16)
+            stats['drops'] += int(fields[12])
+        except (IndexError, ValueError):
+            continue
+    return stats
+
+
+def udp_snmp_counters(path=PROC_NET_SNMP):
+    """System-wide Udp: counters from /proc/net/snmp (None if unavailable)"""
+    try:
+        with open(path) as f:
+            udp_lines = [line.split() for line in f if line.startswith('Udp:')]
+    except OSError:
+        return None
+    # Two lines: field names, then values
+    if len(udp_lines) < 2:
+        return None
+    values = dict(zip(udp_lines[0][1:], udp_lines[1][1:]))
+    try:
+        return {name: int(values[name]) for name in SNMP_UDP_FIELDS if name in values}
+    except ValueError:
+        return None
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Background log writer for the syslog relay.
+
+Callers put records on a bounded queue and return immediately; a single
+writer thread owns the log file handle, writes records in batches, flushes
+on a size or time threshold and rotates the file based on a size counter
+kept in memory (no stat per write).
+
+Queue-full policy:
+  'drop'  - the record is discarded and counted in `dropped` (default; the
+            relay must never wait on the disk)
+  'block' - the caller waits up to block_timeout seconds for room, then the
+            record is dropped and counted
+"""
+import os
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class LogWriter:
+    """Bounded-queue, single-handle, batched log file writer"""
+
+    def __init__(self, path, max_size, max_files, formatter=None, queue_size=10000,
+                 flush_bytes=64 * 1024, flush_interval=1.0, full_policy='drop', block_timeout=1.0):
+        self.path = path
+        self.max_size = max_size
+        self.max_files = max_files
+        # formatter(record) -> str, used for queued records that are not already strings
+        self.formatter = formatter
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.full_policy = full_policy
+        self.block_timeout = block_timeout
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.written = 0
+        self.rotations = 0
+        self._file = None
+        self._size = 0
+        self._thread = None
+
+    def start(self):
+        """Start the writer thread (idempotent)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        """Flush everything queued so far and stop the writer thread"""
+        if self._thread is None:
+            return
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
+
+    def write(self, record):
+        """Queue a record (str or formatter input); returns False if it was dropped"""
+        try:
+            if self.full_policy == 'block':
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    @property
+    def depth(self):
+        return self.queue.qsize()
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, 'ab')
+        # One seek when the file is opened; after that the size is tracked in memory
+        self._size = self._file.seek(0, os.SEEK_END)
+
+    def _rotate(self):
+        """Rotate path -> path.1 -> ... -> path.(max_files-1), dropping the oldest"""
+        self._file.close()
+        self._file = None
+        try:
+            for i in range(self.max_files - 1, 0, -1):
+                old_file = f"{self.path}.{i}"
+                new_file = f"{self.path}.{i + 1}"
+                if os.path.exists(old_file):
+                    if i == self.max_files - 1:
+                        os.remove(old_file)  # Remove oldest
+                    else:
+                        os.replace(old_file, new_file)
+            os.replace(self.path, f"{self.path}.1")
+            self.rotations += 1
+            print(f"Log file rotated: {self.path} -> {self.path}.1")
+        except OSError as e:
+            print(f"Error rotating log file: {e}")
+        self._open()
+
+    def _format(self, record):
+        if isinstance(record, str):
+            return record
+        return self.formatter(record)
+
+    def _run(self):
+        pending = []
+        pending_bytes = 0
+        last_flush = time.monotonic()
+        stopping = False
+        while not stopping:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            # Drain whatever else is already queued without blocking
+            items = [] if item is None else [item]
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for item in items:
+                if item is _STOP:
+                    stopping = True
+                    continue
+                try:
+                    data = self._format(item).encode('utf-8', errors='replace')
+                except Exception as e:
+                    print(f"Error formatting log record: {e}")
+                    continue
+                pending.append(data)
+                pending_bytes += len(data)
+                self.written += 1
+            now = time.monotonic()
+            if pending and (stopping or pending_bytes >= self.flush_bytes
+                            or now - last_flush >= self.flush_interval):
+                self._flush(pending)
+                pending = []
+                pending_bytes = 0
+                last_flush = now
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _flush(self, chunks):
+        try:
+            if self._file is None:
+                self._open()
+            data = b''.join(chunks)
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+            if self._size > self.max_size:
+                self._rotate()
+        except OSError as e:
+            print(f"Error writing log file: {e}")
+            if self._file is not None:
+                try:
+                    self._file.close()
+                except OSError:
+                    pass
+                self._file = None
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""Parsed syslog message record shared by the relay stages.
+
+SyslogMessage reads the PRI and the format (RFC 5424 or RFC 3164) of a raw
+datagram when it is built. The first time a stage asks for a header field,
+the header is split once, with byte operations and no regex: timestamp,
+hostname, app name, proc id, msg id, structured data and the offset of the
+message body (RFC 3164 with or without a hostname, as Docker sends it, and
+with the Docker tag in the "NAME [PID]:" form the relay forwards).
+Fields are decoded to str only when asked for, once. The filter, rate limit,
+dedup, transform and logging stages all read this one object instead of
+each re-scanning the datagram.
+
+Structured data is delimited properly ("]" and spaces inside quoted
+parameter values are part of the value), so an SD-ELEMENT with spaces does
+not shift the message body.
+"""
+from relay_filters import NO_PRI
+
+FAMILY_RFC5424 = 'rfc5424'
+FAMILY_RFC3164 = 'rfc3164'
+
+# Header field indexes (SyslogMessage.raw/field)
+TIMESTAMP, HOSTNAME, APP, PROCID, MSGID, STRUCTURED_DATA = range(6)
+
+# Bytes after the RFC 3164 timestamp searched for the "TAG[PID]:" that ends the header
+TAG_SCAN_BYTES = 96
+
+# Fields of a message without a recognizable header
+_NO_FIELDS = (b'',) * 6
+
+# "<PRI>" prefix -> PRI value, so reading the PRI is one find and one dict lookup (leading zeros allowed)
+_PRI_PREFIXES = {b'<%0*d>' % (width, pri): pri for pri in range(NO_PRI) for width in (1, 2, 3)}
+
+
+class SyslogMessage:
+    """One datagram plus its header fields; the header is split on first use, fields decoded once"""
+    __slots__ = ('data', 'pri', 'family', '_start', '_fields', '_header_end', '_body_start', '_decoded')
+
+    def __init__(self, data):
+        # Raw datagram (bytes); never modified
+        self.data = data
+        # PRI value 0-191, or NO_PRI
+        self.pri = NO_PRI
+        self.family = FAMILY_RFC3164
+        # Offset just past the PRI
+        self._start = 0
+        # Raw field values indexed by TIMESTAMP ... STRUCTURED_DATA (b'' when absent); None until asked for
+        self._fields = None
+        self._header_end = 0
+        self._body_start = 0
+        self._decoded = None
+        end = data.find(b'>', 2, 5) + 1
+        pri = _PRI_PREFIXES.get(data[:end])
+        if pri is None:
+            return
+        self.pri = pri
+        self._start = end
+        # RFC 5424: "<PRI>1 YYYY-MM-DDTHH:MM:SS..." (or the "-" NILVALUE timestamp); every third byte from
+        # the first "-" of the date falls on a separator. A "1 " without that timestamp is read as RFC 3164
+        if data[end:end + 2] == b'1 ' and (data[end + 6:end + 19:3] == b'--T::' or data[end + 2:end + 4] == b'- '):
+            self.family = FAMILY_RFC5424
+
+    def _parse(self):
+        """Split the header (once, on first use); returns the fields"""
+        if self.pri == NO_PRI:
+            self._fields = _NO_FIELDS
+        elif self.family == FAMILY_RFC5424:
+            self._parse_rfc5424(self.data, self._start + 2)
+        else:
+            self._parse_rfc3164(self.data, self._start)
+        return self._fields
+
+    def _parse_rfc5424(self, data, pos):
+        # TIMESTAMP HOSTNAME APP-NAME PROCID MSGID, single spaces between, then SD and MSG
+        fields = data[pos:].split(b' ', 5)
+        if len(fields) < 6:
+            fields += [b''] * (6 - len(fields))
+        self._header_end = pos + len(fields[0]) + 1
+        rest = fields[5]
+        sd_end = 0
+        if rest[:1] == b'-':
+            sd_end = 1
+        else:
+            while rest[sd_end:sd_end + 1] == b'[':
+                end = _sd_element_end(rest, sd_end)
+                if end < 0:
+                    break
+                sd_end = end
+        fields[5] = rest[:sd_end]
+        self._fields = tuple(fields)
+        if rest[sd_end:sd_end + 1] == b' ':
+            sd_end += 1
+        self._body_start = len(data) - len(rest) + sd_end
+
+    def _parse_rfc3164(self, data, pos):
+        # "Mmm dd hh:mm:ss " (BSD timestamp, day space-padded): separators at every third byte
+        if data[pos + 3:pos + 16:3] != b'  :: ':
+            self._fields = _NO_FIELDS
+            self._body_start = pos
+            return
+        timestamp = data[pos:pos + 15]
+        pos += 16
+        self._header_end = pos
+        host = tag = procid = b''
+        # Then "HOSTNAME TAG[PID]:" or, from Docker, "TAG[PID]:"; anything else is message text
+        colon = data.find(b':', pos, pos + TAG_SCAN_BYTES)
+        if colon > pos:
+            host, space, tag = data[pos:colon].rpartition(b' ')
+            if tag[:1] == b'[' and tag[-1:] == b']' and tag[1:-1].isdigit() and host:
+                # "[HOSTNAME ]TAG [PID]:", the Docker tag as the relay forwards (and archives) it
+                host, space, name = host.rpartition(b' ')
+                if name and b' ' not in host and (host or not space):
+                    self._fields = (timestamp, host, name, tag[1:-1], b'', b'')
+                    self._body_start = colon + 2 if data[colon + 1:colon + 2] == b' ' else colon + 1
+                    return
+                host, tag = b'', b''
+            # One word (Docker) or two, none empty
+            if tag and b' ' not in host and (host or not space):
+                if tag[-1:] == b']':
+                    name, bracket, procid = tag[:-1].partition(b'[')
+                    if name and bracket:
+                        tag = name
+                    else:
+                        procid = b''
+                pos = colon + 2 if data[colon + 1:colon + 2] == b' ' else colon + 1
+            else:
+                host = tag = b''
+        self._fields = (timestamp, host, tag, procid, b'', b'')
+        self._body_start = pos
+
+    @property
+    def header_end(self):
+        """Offset just past the timestamp and the space after it (0 without a timestamp)"""
+        if self._fields is None:
+            self._parse()
+        return self._header_end
+
+    @property
+    def body_start(self):
+        """Offset of the free-form message (MSG)"""
+        if self._fields is None:
+            self._parse()
+        return self._body_start
+
+    @property
+    def facility(self):
+        return self.pri >> 3 if self.pri != NO_PRI else None
+
+    @property
+    def severity(self):
+        return self.pri & 7 if self.pri != NO_PRI else None
+
+    def raw(self, field):
+        """Bytes of a header field, or b'' (RFC 5424 NILVALUE "-" counts as absent)"""
+        fields = self._fields
+        if fields is None:
+            fields = self._parse()
+        value = fields[field]
+        return b'' if value == b'-' else value
+
+    def field(self, field):
+        """Decoded header field (str), or None; decoded once"""
+        decoded = self._decoded
+        if decoded is None:
+            decoded = self._decoded = {}
+        try:
+            return decoded[field]
+        except KeyError:
+            pass
+        value = self.raw(field)
+        value = decoded[field] = value.decode('utf-8', errors='replace') if value else None
+        return value
+
+    @property
+    def timestamp(self):
+        return self.field(TIMESTAMP)
+
+    @property
+    def hostname(self):
+        return self.field(HOSTNAME)
+
+    @property
+    def app(self):
+        return self.field(APP)
+
+    @property
+    def procid(self):
+        return self.field(PROCID)
+
+    @property
+    def msgid(self):
+        return self.field(MSGID)
+
+    @property
+    def body(self):
+        """Free-form message text after the header"""
+        decoded = self._decoded
+        if decoded is None:
+            decoded = self._decoded = {}
+        body = decoded.get('body')
+        if body is None:
+            body = decoded['body'] = self.data[self.body_start:].decode('utf-8', errors='replace')
+        return body
+
+    @property
+    def text(self):
+        """The whole datagram decoded the way the transform stages expect it"""
+        decoded = self._decoded
+        if decoded is None:
+            decoded = self._decoded = {}
+        text = decoded.get('text')
+        if text is None:
+            text = decoded['text'] = self.data.decode('utf-8', errors='ignore')
+        return text
+
+    @property
+    def structured_data(self):
+        """[(SD-ID, {param: value})] from RFC 5424 structured data (parsed on first use)"""
+        decoded = self._decoded
+        if decoded is None:
+            decoded = self._decoded = {}
+        elements = decoded.get('sd')
+        if elements is None:
+            elements = decoded['sd'] = _parse_structured_data(self.raw(STRUCTURED_DATA))
+        return elements
+
+    def describe(self):
+        """One-line summary of the parsed header (for the log file)"""
+        parts = [self.family]
+        if self.pri != NO_PRI:
+            parts.append(f"facility={self.facility} severity={self.severity}")
+        for name, value in (('host', self.hostname), ('app', self.app), ('procid', self.procid),
+                            ('msgid', self.msgid)):
+            if value is not None:
+                parts.append(f"{name}={value}")
+        if self.family == FAMILY_RFC5424 and self.raw(STRUCTURED_DATA):
+            parts.append(f"sd={len(self.structured_data)}")
+        return ' '.join(parts)
+
+
+def _sd_element_end(data, pos):
+    """Offset just past the SD-ELEMENT starting at data[pos] ('['), or -1 if it is not closed"""
+    pos += 1
+    while True:
+        close = data.find(b']', pos)
+        quote = data.find(b'"', pos)
+        if close < 0:
+            return -1
+        if quote < 0 or close < quote:
+            return close + 1
+        # Skip the quoted PARAM-VALUE, where \" and \] are escaped
+        pos = quote + 1
+        while True:
+            quote = data.find(b'"', pos)
+            if quote < 0:
+                return -1
+            backslashes = 0
+            while data[quote - 1 - backslashes] == 92:
+                backslashes += 1
+            pos = quote + 1
+            if backslashes % 2 == 0:
+                break
+
+
+def _parse_structured_data(raw):
+    elements = []
+    pos = 0
+    while raw[pos:pos + 1] == b'[':
+        end = _sd_element_end(raw, pos)
+        if end < 0:
+            break
+        inner = raw[pos + 1:end - 1].decode('utf-8', errors='replace')
+        sd_id, _, rest = inner.partition(' ')
+        params = {}
+        while rest:
+            name, _, rest = rest.lstrip().partition('="')
+            value = []
+            i = 0
+            while i < len(rest) and rest[i] != '"':
+                if rest[i] == '\\' and i + 1 < len(rest):
+                    i += 1
+                value.append(rest[i])
+                i += 1
+            if name:
+                params[name] = ''.join(value)
+            rest = rest[i + 1:]
+        elements.append((sd_id, params))
+        pos = end
+    return elements
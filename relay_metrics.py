@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""Relay metrics: per-thread/per-worker hot-path counters and off-path rate windows.
+
+Each relay loop (the in-process relay, or each worker process) owns one
+RelayMetrics object and is its only writer, so the hot path is plain
+attribute and dict increments with no locks. Readers take a snapshot (a
+plain dict, copied in C under the GIL) and merge snapshots from several
+workers. Rates are computed from periodic samples kept in a RateWindow,
+never on the hot path.
+"""
+import bisect
+import threading
+import time
+from collections import deque
+
+# Transform latency histogram bucket upper bounds, in microseconds (last bucket is +Inf)
+LATENCY_BUCKETS_US = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Per-source counters beyond this many sources are folded into 'other'
+MAX_TRACKED_SOURCES = 1024
+
+COUNTER_FIELDS = ('received', 'forwarded', 'dropped', 'bytes_in', 'bytes_out', 'transformed',
+                  'tcp_accepted', 'frames_truncated', 'forward_overflow', 'forward_connects',
+                  'spooled', 'spool_dropped', 'filtered', 'claimed', 'rate_limited',
+                  'deduplicated', 'pri_filtered', 'traced')
+
+# Counters kept for each extra forwarding destination (relay_destinations)
+DESTINATION_FIELDS = ('forwarded', 'dropped', 'bytes_out', 'forward_overflow', 'forward_connects',
+                      'latency_count', 'latency_sum_us')
+
+
+class DestinationStats:
+    """Counters for one extra destination; same single-writer rules as RelayMetrics
+
+    Uses the same counter names as RelayMetrics, so a TcpForwarder can count into it directly.
+    """
+    __slots__ = DESTINATION_FIELDS + ('latency_max_us',)
+
+    def __init__(self):
+        for name in DESTINATION_FIELDS:
+            setattr(self, name, 0)
+        self.latency_max_us = 0.0
+
+    def record_latency(self, seconds):
+        """Add the queueing delay of one delivered message"""
+        micros = seconds * 1e6
+        self.latency_count += 1
+        self.latency_sum_us += micros
+        if micros > self.latency_max_us:
+            self.latency_max_us = micros
+
+    def snapshot(self):
+        snap = {name: getattr(self, name) for name in DESTINATION_FIELDS}
+        snap['latency_max_us'] = self.latency_max_us
+        return snap
+
+
+class RelayMetrics:
+    """Counters for one relay loop; single writer, lock-free"""
+
+    def __init__(self):
+        self.received = 0
+        self.forwarded = 0
+        # Messages lost (handler or send errors, full queues, full spool); messages a rule
+        # drops on purpose are counted in filtered/pri_filtered/rate_limited/deduplicated
+        self.dropped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.transformed = 0
+        self.tcp_accepted = 0
+        self.frames_truncated = 0
+        self.forward_overflow = 0
+        self.forward_connects = 0
+        self.spooled = 0
+        self.spool_dropped = 0
+        self.filtered = 0
+        # Messages that went only to an exclusive extra destination (not to the collector)
+        self.claimed = 0
+        # Messages suppressed by the per-source/per-app token buckets
+        self.rate_limited = 0
+        # Repeats of a recent message collapsed into a "repeated N times" line
+        self.deduplicated = 0
+        # Messages dropped (or sampled out) by the severity/facility filter rules
+        self.pri_filtered = 0
+        # Messages selected for per-message diagnostics (relay_diagnostics)
+        self.traced = 0
+        # Destination name -> DestinationStats
+        self.destinations = {}
+        self.per_source = {}
+        self.per_format = {}
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS_US) + 1)
+        self.latency_sum_us = 0.0
+
+    def record_source(self, source_ip, family):
+        """Count one message for its source IP and format family"""
+        per_source = self.per_source
+        count = per_source.get(source_ip)
+        if count is not None:
+            per_source[source_ip] = count + 1
+        elif len(per_source) < MAX_TRACKED_SOURCES:
+            per_source[source_ip] = 1
+        else:
+            per_source['other'] = per_source.get('other', 0) + 1
+        self.per_format[family] = self.per_format.get(family, 0) + 1
+
+    def destination(self, name):
+        """DestinationStats for an extra destination (created on first use, kept across restarts)"""
+        stats = self.destinations.get(name)
+        if stats is None:
+            stats = self.destinations[name] = DestinationStats()
+        return stats
+
+    def record_transform(self, seconds):
+        """Add one transform duration to the latency histogram"""
+        micros = seconds * 1e6
+        self.transformed += 1
+        self.latency_sum_us += micros
+        self.latency_buckets[bisect.bisect_left(LATENCY_BUCKETS_US, micros)] += 1
+
+    def snapshot(self):
+        """Point-in-time copy of every counter (safe to call from another thread)"""
+        snap = {name: getattr(self, name) for name in COUNTER_FIELDS}
+        snap['per_source'] = dict(self.per_source)
+        snap['per_format'] = dict(self.per_format)
+        snap['latency_buckets'] = list(self.latency_buckets)
+        snap['latency_sum_us'] = self.latency_sum_us
+        snap['destinations'] = {name: stats.snapshot() for name, stats in list(self.destinations.items())}
+        return snap
+
+
+def empty_snapshot():
+    return RelayMetrics().snapshot()
+
+
+def merge_snapshots(snapshots):
+    """Sum snapshots from several relay loops / worker processes"""
+    total = empty_snapshot()
+    for snap in snapshots:
+        if not snap:
+            continue
+        for name in COUNTER_FIELDS:
+            total[name] += snap.get(name, 0)
+        for key in ('per_source', 'per_format'):
+            merged = total[key]
+            for name, count in snap.get(key, {}).items():
+                merged[name] = merged.get(name, 0) + count
+        for i, count in enumerate(snap.get('latency_buckets', ())):
+            total['latency_buckets'][i] += count
+        total['latency_sum_us'] += snap.get('latency_sum_us', 0.0)
+        for name, counts in snap.get('destinations', {}).items():
+            merged = total['destinations'].setdefault(name, DestinationStats().snapshot())
+            for field in DESTINATION_FIELDS:
+                merged[field] += counts.get(field, 0)
+            merged['latency_max_us'] = max(merged['latency_max_us'], counts.get('latency_max_us', 0.0))
+    return total
+
+
+def latency_percentile(snapshot, percentile):
+    """Histogram percentile as the upper bound of the bucket it falls in (microseconds)"""
+    buckets = snapshot['latency_buckets']
+    count = sum(buckets)
+    if not count:
+        return 0
+    rank = count * percentile / 100.0
+    seen = 0
+    for i, bucket_count in enumerate(buckets):
+        seen += bucket_count
+        if seen >= rank:
+            return LATENCY_BUCKETS_US[i] if i < len(LATENCY_BUCKETS_US) else float('inf')
+    return float('inf')
+
+
+class RateWindow:
+    """Sliding-window rates from periodic (timestamp, counter totals) samples
+
+    record() and rate() may run at the same time on different executor threads (the periodic
+    sampling and stats tasks), so the samples are only touched under a lock.
+    """
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self._samples = deque()
+        self._lock = threading.Lock()
+
+    def record(self, totals, now=None):
+        """Store a sample of monotonically increasing counters"""
+        now = time.monotonic() if now is None else now
+        sample = (now, dict(totals))
+        with self._lock:
+            samples = self._samples
+            samples.append(sample)
+            while len(samples) > 2 and now - samples[1][0] >= self.max_age:
+                samples.popleft()
+
+    def rate(self, name, window=60, per=60):
+        """Increase of counter `name` per `per` seconds over the last `window` seconds"""
+        with self._lock:
+            samples = list(self._samples)
+        if len(samples) < 2:
+            return 0
+        now, latest = samples[-1]
+        # Oldest sample that is still inside the window (or the oldest we have)
+        start_time, start = samples[0]
+        for sample_time, sample in reversed(samples):
+            if now - sample_time > window:
+                break
+            start_time, start = sample_time, sample
+        elapsed = now - start_time
+        if elapsed <= 0:
+            return 0
+        # With less than `per` seconds of history report the count so far rather than extrapolating
+        return (latest.get(name, 0) - start.get(name, 0)) * per / max(elapsed, per)
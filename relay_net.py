@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""Batched UDP datagram I/O for the syslog relay.
+
+On Linux the receiver and sender use recvmmsg/sendmmsg (through ctypes) so a
+single syscall moves a whole batch of datagrams. Everywhere else they fall
+back to draining a non-blocking socket until it is empty or the batch is full.
+"""
+import ctypes
+import ctypes.util
+import errno
+import select
+import socket
+import struct
+import sys
+
+# Default number of datagrams drained per wakeup
+DEFAULT_BATCH_SIZE = 64
+
+# Linux flag values used with recvmmsg/sendmmsg
+MSG_DONTWAIT = 0x40
+
+# Large enough for sockaddr_in and sockaddr_in6
+SOCKADDR_SIZE = 128
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [
+        ('iov_base', ctypes.c_void_p),
+        ('iov_len', ctypes.c_size_t),
+    ]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p),
+        ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.POINTER(_IOVec)),
+        ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p),
+        ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_hdr', _MsgHdr),
+        ('msg_len', ctypes.c_uint),
+    ]
+
+
+def _load_mmsg_libc():
+    """Return libc if it exports recvmmsg/sendmmsg (Linux only), otherwise None"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint,
+                                  ctypes.c_int, ctypes.c_void_p]
+        libc.recvmmsg.restype = ctypes.c_int
+        libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int]
+        libc.sendmmsg.restype = ctypes.c_int
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+_libc = _load_mmsg_libc()
+
+
+def mmsg_available():
+    """True when recvmmsg/sendmmsg can be used on this platform"""
+    return _libc is not None
+
+
+def _decode_sockaddr(raw):
+    """Turn raw sockaddr bytes into a (host, port) tuple"""
+    family = int.from_bytes(raw[0:2], sys.byteorder)
+    port = int.from_bytes(raw[2:4], 'big')
+    if family == socket.AF_INET:
+        return (socket.inet_ntop(socket.AF_INET, raw[4:8]), port)
+    if family == socket.AF_INET6:
+        return (socket.inet_ntop(socket.AF_INET6, raw[8:24]), port)
+    return ('', 0)
+
+
+def _encode_sockaddr(family, address):
+    """Build a raw sockaddr buffer for a (host, port) destination"""
+    host, port = address[0], address[1]
+    if family == socket.AF_INET6:
+        raw = (socket.AF_INET6.to_bytes(2, sys.byteorder) + port.to_bytes(2, 'big') + bytes(4)
+               + socket.inet_pton(socket.AF_INET6, host) + bytes(4))
+    else:
+        raw = (socket.AF_INET.to_bytes(2, sys.byteorder) + port.to_bytes(2, 'big')
+               + socket.inet_pton(socket.AF_INET, host) + bytes(8))
+    return ctypes.create_string_buffer(raw, len(raw))
+
+
+class BatchReceiver:
+    """Drain up to batch_size datagrams from a UDP socket per wakeup"""
+
+    def __init__(self, sock, batch_size=DEFAULT_BATCH_SIZE, max_datagram_size=1024, use_mmsg=True):
+        self.sock = sock
+        self.batch_size = max(1, int(batch_size))
+        self.max_datagram_size = max_datagram_size
+        self.use_mmsg = use_mmsg and mmsg_available()
+        self.mode = 'recvmmsg' if self.use_mmsg else 'drain'
+        # The socket stays non-blocking; waiting is done with select()
+        sock.setblocking(False)
+        if self.use_mmsg:
+            self._setup_mmsg()
+
+    def _setup_mmsg(self):
+        """Preallocate the buffers, iovecs and headers reused by every recvmmsg call"""
+        n = self.batch_size
+        size = self.max_datagram_size
+        # One contiguous data area and one contiguous address area, sliced per message
+        self._data = ctypes.create_string_buffer(n * size)
+        self._names = ctypes.create_string_buffer(n * SOCKADDR_SIZE)
+        self._iovecs = (_IOVec * n)()
+        self._headers = (_MMsgHdr * n)()
+        data_base = ctypes.addressof(self._data)
+        names_base = ctypes.addressof(self._names)
+        for i in range(n):
+            self._iovecs[i].iov_base = data_base + i * size
+            self._iovecs[i].iov_len = size
+            hdr = self._headers[i].msg_hdr
+            hdr.msg_name = names_base + i * SOCKADDR_SIZE
+            hdr.msg_namelen = SOCKADDR_SIZE
+            hdr.msg_iov = ctypes.pointer(self._iovecs[i])
+            hdr.msg_iovlen = 1
+        # Raw views let the hot loop read lengths/addresses without ctypes attribute access
+        self._data_view = memoryview(self._data).cast('B')
+        self._names_view = memoryview(self._names).cast('B')
+        self._header_view = memoryview(self._headers).cast('B')
+        # Unpack (msg_namelen, msg_len) for every header in one pass
+        stride = ctypes.sizeof(_MMsgHdr)
+        namelen_offset = _MsgHdr.msg_namelen.offset
+        len_offset = _MMsgHdr.msg_len.offset
+        self._header_struct = struct.Struct(
+            f'={namelen_offset}xI{len_offset - namelen_offset - 4}xI{stride - len_offset - 4}x')
+        self._stride = stride
+        # Pristine copy of the headers, used to reset the value-result fields after each call
+        self._header_template = bytes(self._header_view)
+        self._addr_cache = {}
+
+    def wait(self, timeout):
+        """Block until the socket is readable or timeout expires"""
+        readable, _, _ = select.select([self.sock], [], [], timeout)
+        return bool(readable)
+
+    def receive(self, timeout=1.0):
+        """Return a list of (data, addr) tuples; empty if nothing arrived before timeout"""
+        if not self.wait(timeout):
+            return []
+        if self.use_mmsg:
+            return self._receive_mmsg()
+        return self._receive_drain()
+
+    def _receive_mmsg(self):
+        n = self.batch_size
+        count = _libc.recvmmsg(self.sock.fileno(), self._headers, n, MSG_DONTWAIT, None)
+        if count < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            raise OSError(err, f"recvmmsg failed: {errno.errorcode.get(err, err)}")
+        batch = []
+        size = self.max_datagram_size
+        used = count * self._stride
+        data = self._data_view
+        names = self._names_view
+        cache = self._addr_cache
+        offset = 0
+        name_offset = 0
+        for namelen, length in self._header_struct.iter_unpack(self._header_view[:used]):
+            raw_name = names[name_offset:name_offset + namelen].tobytes()
+            addr = cache.get(raw_name)
+            if addr is None:
+                if len(cache) > 4096:
+                    cache.clear()
+                addr = cache[raw_name] = _decode_sockaddr(raw_name)
+            batch.append((data[offset:offset + length].tobytes(), addr))
+            offset += size
+            name_offset += SOCKADDR_SIZE
+        # msg_namelen/msg_len are value-result fields; restore them for the next call
+        self._header_view[:used] = self._header_template[:used]
+        return batch
+
+    def _receive_drain(self):
+        batch = []
+        recvfrom = self.sock.recvfrom
+        size = self.max_datagram_size
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(recvfrom(size))
+            except (BlockingIOError, InterruptedError):
+                break
+            except ConnectionResetError:
+                # Windows reports ICMP port unreachable on the next recvfrom; skip it
+                continue
+        return batch
+
+
+class BatchSender:
+    """Send a list of payloads to one destination with as few syscalls as possible"""
+
+    def __init__(self, sock, batch_size=DEFAULT_BATCH_SIZE, use_mmsg=True):
+        self.sock = sock
+        self.batch_size = max(1, int(batch_size))
+        self.use_mmsg = use_mmsg and mmsg_available()
+        self.mode = 'sendmmsg' if self.use_mmsg else 'sendto'
+        # Payloads that failed with an error other than a full send buffer (they are not retried)
+        self.errors = 0
+        self._dest = None
+        self._dest_name = None
+        if self.use_mmsg:
+            n = self.batch_size
+            self._iovecs = (_IOVec * n)()
+            self._headers = (_MMsgHdr * n)()
+            for i in range(n):
+                self._headers[i].msg_hdr.msg_iov = ctypes.pointer(self._iovecs[i])
+                self._headers[i].msg_hdr.msg_iovlen = 1
+            self._iovec_view = memoryview(self._iovecs).cast('B')
+            self._iovec_stride = ctypes.sizeof(_IOVec)
+
+    def _set_destination(self, address):
+        """Point every header at the (cached) destination sockaddr"""
+        self._dest = address
+        self._dest_name = _encode_sockaddr(self.sock.family, address)
+        name = ctypes.addressof(self._dest_name)
+        for i in range(self.batch_size):
+            hdr = self._headers[i].msg_hdr
+            hdr.msg_name = name
+            hdr.msg_namelen = len(self._dest_name)
+
+    def send(self, payloads, address, wait=True):
+        """Send every payload (bytes) to address, returning the number sent
+
+        With wait=False a full kernel send buffer ends the call early instead of
+        blocking briefly for room: the first (sent + new errors) payloads were used
+        up and the caller keeps the rest to retry.
+        """
+        if not payloads:
+            return 0
+        if not self.use_mmsg or len(payloads) == 1:
+            return self._send_loop(payloads, address, wait)
+        if address != self._dest:
+            self._set_destination(address)
+        sent = 0
+        total = len(payloads)
+        while sent < total:
+            chunk = payloads[sent:sent + self.batch_size]
+            count = self._sendmmsg(chunk)
+            if count <= 0:
+                # Let sendto surface the error (and deliver what it can) for the remainder
+                return sent + self._send_loop(payloads[sent:], address, wait)
+            sent += count
+        return sent
+
+    def _sendmmsg(self, chunk):
+        # Copy the chunk into one buffer and point each iovec at its slice
+        buffer = ctypes.create_string_buffer(b''.join(chunk))
+        base = ctypes.addressof(buffer)
+        view = self._iovec_view
+        stride = self._iovec_stride
+        pack_into = struct.pack_into
+        offset = 0
+        for i, payload in enumerate(chunk):
+            length = len(payload)
+            pack_into('PN', view, i * stride, base + offset, length)
+            offset += length
+        return _libc.sendmmsg(self.sock.fileno(), self._headers, len(chunk), 0)
+
+    def _send_loop(self, payloads, address, wait=True):
+        sent = 0
+        sendto = self.sock.sendto
+        for payload in payloads:
+            try:
+                sendto(payload, address)
+                sent += 1
+            except (BlockingIOError, InterruptedError):
+                if not wait:
+                    break
+                # Kernel send buffer is full; wait briefly for room and retry once
+                select.select([], [self.sock], [], 0.05)
+                try:
+                    sendto(payload, address)
+                    sent += 1
+                except OSError as e:
+                    self.errors += 1
+                    print(f"Error forwarding message: {e}")
+            except OSError as e:
+                self.errors += 1
+                print(f"Error forwarding message: {e}")
+        return sent
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""Query the message archive (relay_archive) by time, source, hostname, app and regex.
+
+Segments that start after the end of the range, or whose index shows
+nothing in the range or from the wanted sources, are skipped unopened;
+within a segment only the indexed blocks that can match are decompressed,
+read from a memory map of the file. A block written after the index line
+was lost (crash) or a segment without an index is still read, by walking
+its gzip members. Results are streamed block by block, so memory stays at
+about one block whatever the size of the archive or of the result.
+
+Usage:
+    python relay_query.py --app "immich*" --since 10:00 --until 10:05
+    python relay_query.py --source 192.168.2.0/24 --grep "error|fail" -i --since 2h
+    python relay_query.py --host HubitatC8Pro --since "2026-10-18 09:30" --count
+
+Times are local: "HH:MM[:SS]" (today), "YYYY-MM-DD HH:MM[:SS]", or a span
+back from now ("90s", "15m", "2h", "1d"). --host and --app take shell-style
+patterns and ignore case.
+"""
+import argparse
+import fnmatch
+import ipaddress
+import mmap
+import os
+import re
+import sys
+import time
+import zlib
+from datetime import datetime
+
+from relay_archive import SEGMENT_SUFFIX, read_index, unescape_message
+from relay_message import SyslogMessage
+
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), "Desktop", "Syslog Relay", "archive")
+
+SPAN_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Length of the "YYYY-MM-DDTHH:MM:SS.mmm" time at the start of each archive line
+TIME_TEXT_LENGTH = 23
+
+# Compressed bytes fed to the decompressor at a time when a segment is read without its index
+SCAN_CHUNK_BYTES = 64 * 1024
+
+
+def parse_time(value, now=None):
+    """Epoch seconds of a --since/--until value; raises ValueError"""
+    now = time.time() if now is None else now
+    value = value.strip()
+    unit = SPAN_UNITS.get(value[-1:])
+    if unit is not None and value[:-1].replace('.', '', 1).isdigit():
+        return now - float(value[:-1]) * unit
+    for pattern in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M'):
+        try:
+            return time.mktime(time.strptime(value, pattern))
+        except ValueError:
+            pass
+    for pattern in ('%H:%M:%S', '%H:%M'):
+        try:
+            clock = datetime.strptime(value, pattern)
+        except ValueError:
+            continue
+        today = datetime.fromtimestamp(now)
+        return today.replace(hour=clock.hour, minute=clock.minute, second=clock.second, microsecond=0).timestamp()
+    raise ValueError(f"unrecognized time {value!r} (HH:MM, YYYY-MM-DD HH:MM[:SS] or 15m/2h/1d)")
+
+
+def time_text(epoch):
+    """Archive line time of an epoch (so lines are compared as bytes, without parsing)"""
+    second = int(epoch)
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(second)).encode('ascii') + \
+        b'.%03d' % int((epoch - second) * 1000)
+
+
+def segment_start(name):
+    """Epoch of the time in a segment name (prefix-YYYYMMDD-HHMMSS[_n].log.gz), or None"""
+    try:
+        return time.mktime(time.strptime(name.split('-', 1)[1][:15], '%Y%m%d-%H%M%S'))
+    except (IndexError, ValueError):
+        return None
+
+
+def archive_segments(directory):
+    """(start, path) of every segment in the archive (all writers), in start order"""
+    try:
+        names = os.listdir(directory)
+    except OSError as e:
+        raise ValueError(f"cannot read archive directory {directory}: {e}") from None
+    segments = []
+    for name in names:
+        if name.endswith(SEGMENT_SUFFIX):
+            start = segment_start(name)
+            if start is not None:
+                segments.append((start, os.path.join(directory, name)))
+    segments.sort()
+    return segments
+
+
+def gzip_members(data, offset):
+    """Uncompressed bytes of each complete gzip member in data from offset on (read in chunks)"""
+    decompressor = zlib.decompressobj(wbits=31)
+    parts = []
+    pending = b''
+    while True:
+        if not pending:
+            if offset >= len(data):
+                # Anything left in parts is a member cut short by a crash mid-write
+                return
+            pending = data[offset:offset + SCAN_CHUNK_BYTES]
+            offset += len(pending)
+        try:
+            parts.append(decompressor.decompress(pending))
+        except zlib.error:
+            return
+        if decompressor.eof:
+            yield b''.join(parts)
+            parts = []
+            pending = decompressor.unused_data
+            decompressor = zlib.decompressobj(wbits=31)
+        else:
+            pending = b''
+
+
+class Query:
+    """Archive filters; blocks() and records() are generators"""
+
+    def __init__(self, since=None, until=None, sources=(), hosts=(), apps=(), pattern=None):
+        self.since = since
+        self.until = until
+        self.since_text = time_text(since) if since is not None else None
+        self.until_text = time_text(until) if until is not None else None
+        self.sources = tuple(ipaddress.ip_network(source, strict=False) for source in sources)
+        self.hosts = tuple(host.lower() for host in hosts)
+        self.apps = tuple(app.lower() for app in apps)
+        self.pattern = pattern
+        # Index source IPs already checked against self.sources
+        self._source_matches = {}
+        self.segments_read = 0
+        self.segments_skipped = 0
+        self.blocks_read = 0
+        self.blocks_skipped = 0
+
+    def source_matches(self, source_ip):
+        matched = self._source_matches.get(source_ip)
+        if matched is None:
+            try:
+                address = ipaddress.ip_address(source_ip)
+                matched = any(address in network for network in self.sources)
+            except ValueError:
+                matched = False
+            self._source_matches[source_ip] = matched
+        return matched
+
+    def block_matches(self, entry):
+        """Whether an indexed block can hold a match (time range and sources)"""
+        # Index times are rounded to the millisecond, line times truncated: allow 1 ms either way
+        if self.since is not None and entry.last < self.since - 0.001:
+            return False
+        if self.until is not None and entry.first > self.until + 0.001:
+            return False
+        return not self.sources or any(self.source_matches(source) for source in entry.sources)
+
+    def blocks(self, directory):
+        """Uncompressed blocks that can hold matches, oldest segment first"""
+        for start, path in archive_segments(directory):
+            if self.until is not None and start > self.until:
+                self.segments_skipped += 1
+                continue
+            index = read_index(path)
+            try:
+                with open(path, 'rb') as f:
+                    size = os.fstat(f.fileno()).st_size
+                    if size == 0:
+                        continue
+                    indexed_end = index[-1].offset + index[-1].length if index else 0
+                    wanted = [entry for entry in index or () if self.block_matches(entry)]
+                    if not wanted and indexed_end >= size:
+                        self.segments_skipped += 1
+                        continue
+                    self.segments_read += 1
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                        self.blocks_skipped += len(index or ()) - len(wanted)
+                        for entry in wanted:
+                            self.blocks_read += 1
+                            yield zlib.decompress(data[entry.offset:entry.offset + entry.length], wbits=31)
+                        # Blocks the index does not cover are read without skipping
+                        for block in gzip_members(data, indexed_end):
+                            self.blocks_read += 1
+                            yield block
+            except (OSError, ValueError, zlib.error) as e:
+                print(f"Error reading archive segment {path}: {e}", file=sys.stderr)
+
+    def records(self, directory):
+        """(time text, source IP, message) of every matching archive line"""
+        since_text = self.since_text
+        until_text = self.until_text
+        sources = self.sources
+        pattern = self.pattern
+        hosts = self.hosts
+        apps = self.apps
+        for block in self.blocks(directory):
+            for line in block.split(b'\n'):
+                if not line:
+                    continue
+                stamp = line[:TIME_TEXT_LENGTH]
+                if since_text is not None and stamp < since_text:
+                    continue
+                if until_text is not None and stamp > until_text:
+                    continue
+                fields = line.split(b'\t', 2)
+                if len(fields) != 3:
+                    continue
+                _, source_ip, message = fields
+                source_ip = source_ip.decode('ascii', errors='replace')
+                if sources and not self.source_matches(source_ip):
+                    continue
+                if hosts or apps:
+                    record = SyslogMessage(message)
+                    if hosts and not _matches(record.hostname, hosts):
+                        continue
+                    if apps and not _matches(record.app, apps):
+                        continue
+                text = unescape_message(message.decode('utf-8', errors='replace'))
+                if pattern is not None and pattern.search(text) is None:
+                    continue
+                yield stamp.decode('ascii'), source_ip, text
+
+
+def _matches(value, patterns):
+    if value is None:
+        return False
+    value = value.lower()
+    return any(fnmatch.fnmatchcase(value, pattern) for pattern in patterns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dir', default=DEFAULT_DIR, help=f"archive directory (default: {DEFAULT_DIR})")
+    parser.add_argument('--since', help="start of the time range")
+    parser.add_argument('--until', help="end of the time range")
+    parser.add_argument('--source', action='append', default=[], help="source IP or network (repeatable)")
+    parser.add_argument('--host', action='append', default=[], help="hostname pattern (repeatable)")
+    parser.add_argument('--app', action='append', default=[], help="app name / tag pattern (repeatable)")
+    parser.add_argument('--grep', help="regular expression searched in the message")
+    parser.add_argument('-i', '--ignore-case', action='store_true', help="case-insensitive --grep")
+    parser.add_argument('--limit', type=int, help="stop after this many messages")
+    parser.add_argument('--count', action='store_true', help="print only the number of matches")
+    parser.add_argument('--stats', action='store_true', help="report segments and blocks read/skipped")
+    args = parser.parse_args(argv)
+
+    try:
+        query = Query(since=parse_time(args.since) if args.since else None,
+                      until=parse_time(args.until) if args.until else None,
+                      sources=args.source, hosts=args.host, apps=args.app,
+                      pattern=re.compile(args.grep, re.IGNORECASE if args.ignore_case else 0) if args.grep else None)
+    except (ValueError, re.error) as e:
+        parser.error(str(e))
+
+    matches = 0
+    try:
+        for stamp, source_ip, text in query.records(args.dir):
+            matches += 1
+            if not args.count:
+                print(f"{stamp} {source_ip} {text}")
+            if args.limit is not None and matches >= args.limit:
+                break
+    except ValueError as e:
+        parser.error(str(e))
+    except (BrokenPipeError, KeyboardInterrupt):
+        return 1
+    if args.count:
+        print(matches)
+    if args.stats:
+        print(f"segments read {query.segments_read}, skipped {query.segments_skipped}; "
+              f"blocks read {query.blocks_read}, skipped {query.blocks_skipped}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""Token-bucket rate limiting and storm suppression.
+
+Each source IP has a token bucket, and so does each (source IP, app name)
+pair, where the app name is the RFC 3164 tag or the RFC 5424 APP-NAME of the
+parsed message (relay_message). A
+message spends one token from both buckets; when either is empty the message
+is suppressed (dropped, or with mode 'sample' one in every 1/sample is still
+forwarded). Suppressed messages are counted per bucket and reported in a
+periodic summary ("suppressed N messages from X") forwarded like any other
+message.
+
+Buckets are small __slots__ objects in plain dicts. A bucket that has been
+idle long enough to refill is indistinguishable from a new one, so it is
+evicted at the next summary; a hard cap bounds the tables between summaries.
+Runs on the relay loop thread (each worker process has its own limiter).
+"""
+import time
+from collections import namedtuple
+
+from relay_message import APP
+
+# Rate limits (immutable; None rate disables that level)
+RateLimitSpec = namedtuple('RateLimitSpec', 'source_rate source_burst app_rate app_burst mode sample')
+
+RATE_LIMIT_KEYS = RateLimitSpec._fields
+
+
+def parse_rate_limit(entry, defaults):
+    """RateLimitSpec from a [rate_limit] dict (missing keys keep defaults); raises ValueError"""
+    if not isinstance(entry, dict):
+        raise ValueError(f"rate_limit must be a table, got {entry!r}")
+    unknown = set(entry) - set(RATE_LIMIT_KEYS)
+    if unknown:
+        raise ValueError(f"unknown key(s) in [rate_limit]: {', '.join(sorted(unknown))}")
+    values = defaults._replace(**entry)
+    for level in ('source', 'app'):
+        rate = getattr(values, f'{level}_rate')
+        burst = getattr(values, f'{level}_burst')
+        # TOML has no null: 0 turns a level off
+        if rate == 0:
+            values = values._replace(**{f'{level}_rate': None})
+            continue
+        if rate is None:
+            continue
+        if not isinstance(rate, (int, float)) or isinstance(rate, bool) or rate < 0:
+            raise ValueError(f"rate_limit.{level}_rate must be messages per second, got {rate!r}")
+        if not isinstance(burst, (int, float)) or isinstance(burst, bool) or burst < 1:
+            raise ValueError(f"rate_limit.{level}_burst must be at least 1, got {burst!r}")
+    if values.mode not in ('drop', 'sample'):
+        raise ValueError(f"rate_limit.mode must be 'drop' or 'sample', got {values.mode!r}")
+    sample = values.sample
+    if not isinstance(sample, (int, float)) or isinstance(sample, bool) or not 0 < sample <= 1:
+        raise ValueError(f"rate_limit.sample must be a fraction in (0, 1], got {sample!r}")
+    return values
+
+
+class TokenBucket:
+    """Tokens and suppression count for one source or app"""
+    __slots__ = ('tokens', 'stamp', 'suppressed', 'credit')
+
+    def __init__(self, burst, now):
+        self.tokens = burst
+        self.stamp = now
+        # Messages suppressed since the last summary
+        self.suppressed = 0
+        # Sampling credit while the bucket is empty (mode 'sample')
+        self.credit = 0.0
+
+
+class RateLimiter:
+    """Per-source and per-app token buckets; admit() is called once per message"""
+
+    def __init__(self, spec, max_entries=16384, clock=time.monotonic):
+        self.spec = spec
+        # Buckets per table before idle ones are evicted early
+        self.max_entries = max_entries
+        self.clock = clock
+        # Source IP -> TokenBucket, (source IP, app name) -> TokenBucket
+        self.sources = {}
+        self.apps = {}
+        # Totals since startup
+        self.suppressed = 0
+        self.sampled = 0
+        self.evictions = 0
+        # Suppressed counts of buckets evicted before their summary
+        self._unreported = 0
+
+    @property
+    def enabled(self):
+        return self.spec.source_rate is not None or self.spec.app_rate is not None
+
+    def configure(self, spec):
+        """Switch to new limits (config reload), keeping the current buckets and counts"""
+        self.spec = spec
+
+    def admit(self, source_ip, record):
+        """True if the message (a SyslogMessage) should be forwarded"""
+        spec = self.spec
+        now = self.clock()
+        allowed = True
+        bucket = None
+        if spec.source_rate is not None:
+            bucket = self._take(self.sources, source_ip, spec.source_rate, spec.source_burst, now)
+            allowed = bucket is None
+        if spec.app_rate is not None:
+            app = record.raw(APP)
+            if app:
+                # An app bucket is only charged for messages the source bucket let through
+                app_bucket = self._take(self.apps, (source_ip, app), spec.app_rate, spec.app_burst, now) \
+                    if allowed else None
+                if app_bucket is not None:
+                    bucket = app_bucket
+                    allowed = False
+        if allowed:
+            return True
+        if spec.mode == 'sample':
+            bucket.credit += spec.sample
+            if bucket.credit >= 1.0:
+                bucket.credit -= 1.0
+                self.sampled += 1
+                return True
+        bucket.suppressed += 1
+        self.suppressed += 1
+        return False
+
+    def _take(self, table, key, rate, burst, now):
+        """Spend one token from key's bucket; returns the bucket if it was empty, else None"""
+        bucket = table.get(key)
+        if bucket is None:
+            if len(table) >= self.max_entries:
+                self._evict(table, rate, burst, now, force=True)
+            table[key] = TokenBucket(burst - 1, now)
+            return None
+        tokens = bucket.tokens + (now - bucket.stamp) * rate
+        bucket.stamp = now
+        if tokens >= 1.0:
+            bucket.tokens = min(tokens, burst) - 1.0
+            return None
+        bucket.tokens = tokens
+        return bucket
+
+    def _evict(self, table, rate, burst, now, force=False):
+        """Remove buckets that have refilled (idle); with force, also the oldest until half full"""
+        idle = [key for key, bucket in table.items()
+                if not bucket.suppressed and bucket.tokens + (now - bucket.stamp) * rate >= burst]
+        for key in idle:
+            del table[key]
+        self.evictions += len(idle)
+        if force and len(table) >= self.max_entries:
+            # Storm from many distinct sources: forget the oldest buckets (dicts keep insertion order)
+            for key in list(table)[:len(table) - self.max_entries // 2]:
+                self._unreported += table.pop(key).suppressed
+                self.evictions += 1
+
+    def summaries(self):
+        """[(source_ip, app name or None, suppressed count)] since the last call; also evicts idle buckets"""
+        now = self.clock()
+        spec = self.spec
+        report = []
+        for table, rate, burst in ((self.sources, spec.source_rate, spec.source_burst),
+                                   (self.apps, spec.app_rate, spec.app_burst)):
+            for key, bucket in table.items():
+                if bucket.suppressed:
+                    if isinstance(key, tuple):
+                        report.append((key[0], key[1].decode('utf-8', errors='replace'), bucket.suppressed))
+                    else:
+                        report.append((key, None, bucket.suppressed))
+                    bucket.suppressed = 0
+            if rate is None:
+                # Level switched off by a reload
+                self.evictions += len(table)
+                table.clear()
+            else:
+                self._evict(table, rate, burst, now)
+        if self._unreported:
+            report.append((None, None, self._unreported))
+            self._unreported = 0
+        report.sort(key=lambda item: item[2], reverse=True)
+        return report
+
+    def __len__(self):
+        return len(self.sources) + len(self.apps)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Source routing table: CIDR routes to per-device rule sets.
+
+Each route maps a network (a single host is a /32 or /128) to a RuleSet:
+timezone offset, date stripping, Docker tag rewrite, fixed hostname, drop,
+or sampling. A source IP gets the rule set of its most specific matching
+route (longest prefix). Routes are kept in one hash table per prefix length,
+so a lookup is at most one dict probe per distinct prefix length, and the
+result is memoized per IP, so the cost stays flat as routes are added.
+
+Route entries (TOML [[routes]] tables or SOURCE_ROUTES dicts):
+    cidr        "172.17.0.0/16" or a plain IP          (required)
+    offset      hours added to RFC 3164 timestamps, or the device's time zone
+                ("America/New_York": converted to UTC, DST-aware)
+    strip_dates strip superfluous container dates, collapse whitespace
+    docker_tags container[ID]: -> container [ID]:
+    hostname    replace the RFC 3164 hostname field
+    drop        discard every message from the source
+    sample      fraction of messages to forward (0 < sample <= 1)
+"""
+import ipaddress
+
+from relay_timestamps import parse_offset
+
+# Per-IP lookup results kept before the memo is cleared
+MAX_MEMOIZED_SOURCES = 65536
+
+ROUTE_KEYS = ('cidr', 'offset', 'strip_dates', 'docker_tags', 'hostname', 'drop', 'sample')
+
+
+class RuleSet:
+    """What to do with messages from one route; immutable and shared by every matching IP"""
+    __slots__ = ('offset', 'strip_dates', 'docker_tags', 'hostname', 'drop', 'sample')
+
+    def __init__(self, offset=None, strip_dates=False, docker_tags=False, hostname=None, drop=False, sample=1.0):
+        object.__setattr__(self, 'offset', offset)
+        object.__setattr__(self, 'strip_dates', strip_dates)
+        object.__setattr__(self, 'docker_tags', docker_tags)
+        object.__setattr__(self, 'hostname', hostname)
+        object.__setattr__(self, 'drop', drop)
+        object.__setattr__(self, 'sample', sample)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RuleSet is immutable")
+
+    @property
+    def gated(self):
+        """True if some messages from this route are not forwarded"""
+        return self.drop or self.sample < 1.0
+
+    def describe(self):
+        parts = []
+        if self.offset is not None:
+            parts.append(f"offset={self.offset}" if isinstance(self.offset, str) else f"offset={self.offset:+g}h")
+        for name in ('strip_dates', 'docker_tags', 'drop'):
+            if getattr(self, name):
+                parts.append(name)
+        if self.hostname is not None:
+            parts.append(f"hostname={self.hostname}")
+        if self.sample < 1.0:
+            parts.append(f"sample={self.sample:g}")
+        return ' '.join(parts) or 'passthrough'
+
+
+def parse_route(entry):
+    """(network, RuleSet) from a route dict; raises ValueError describing the problem"""
+    if not isinstance(entry, dict):
+        raise ValueError(f"route must be a table, got {entry!r}")
+    unknown = set(entry) - set(ROUTE_KEYS)
+    if unknown:
+        raise ValueError(f"unknown route key(s): {', '.join(sorted(unknown))}")
+    if 'cidr' not in entry:
+        raise ValueError("route without a cidr")
+    try:
+        network = ipaddress.ip_network(entry['cidr'], strict=False)
+    except (TypeError, ValueError):
+        raise ValueError(f"route cidr {entry['cidr']!r} is not a network or address") from None
+    offset = entry.get('offset')
+    if offset is not None:
+        parse_offset(offset, f"route {network}: offset")
+    for name in ('strip_dates', 'docker_tags', 'drop'):
+        if not isinstance(entry.get(name, False), bool):
+            raise ValueError(f"route {network}: {name} must be true or false")
+    hostname = entry.get('hostname')
+    if hostname is not None and (not isinstance(hostname, str) or not hostname or ' ' in hostname):
+        raise ValueError(f"route {network}: hostname must be one word, got {hostname!r}")
+    sample = entry.get('sample', 1.0)
+    if not isinstance(sample, (int, float)) or isinstance(sample, bool) or not 0 < sample <= 1:
+        raise ValueError(f"route {network}: sample must be a fraction in (0, 1], got {sample!r}")
+    return network, RuleSet(offset, entry.get('strip_dates', False), entry.get('docker_tags', False),
+                            hostname, entry.get('drop', False), float(sample))
+
+
+def host_routes(device_offsets, date_strip_ips, docker_host_ips):
+    """Per-IP device settings (DEVICE_OFFSETS and the IP lists) as /32 or /128 routes"""
+    routes = []
+    for ip in sorted(set(device_offsets) | set(date_strip_ips) | set(docker_host_ips)):
+        routes.append((ipaddress.ip_network(ip), RuleSet(
+            offset=device_offsets.get(ip),
+            strip_dates=ip in date_strip_ips,
+            docker_tags=ip in docker_host_ips)))
+    return routes
+
+
+class RouteTable:
+    """Longest-prefix match from source IP to RuleSet"""
+
+    def __init__(self, routes=()):
+        # Later routes for the same network replace earlier ones
+        self.routes = {}
+        for network, rules in routes:
+            self.routes[network] = rules
+        # IP version -> [(host bits, {address >> host bits: RuleSet})], longest prefix first
+        by_length = {4: {}, 6: {}}
+        for network, rules in self.routes.items():
+            host_bits = network.max_prefixlen - network.prefixlen
+            by_length[network.version].setdefault(host_bits, {})[int(network.network_address) >> host_bits] = rules
+        self._tables = {version: sorted(tables.items()) for version, tables in by_length.items()}
+        self._memo = {}
+
+    def __len__(self):
+        return len(self.routes)
+
+    def lookup(self, source_ip):
+        """RuleSet of the most specific route containing source_ip, or None"""
+        try:
+            return self._memo[source_ip]
+        except KeyError:
+            pass
+        rules = self._match(source_ip)
+        if len(self._memo) >= MAX_MEMOIZED_SOURCES:
+            self._memo.clear()
+        self._memo[source_ip] = rules
+        return rules
+
+    def _match(self, source_ip):
+        try:
+            address = ipaddress.ip_address(source_ip.split('%', 1)[0])
+        except ValueError:
+            return None
+        value = int(address)
+        for host_bits, table in self._tables[address.version]:
+            rules = table.get(value >> host_bits)
+            if rules is not None:
+                return rules
+        return None
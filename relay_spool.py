@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""Disk-backed store-and-forward spool for collector outages.
+
+Messages that passed the transform stage are appended to a log of
+fixed-size segment files (spool-<n>.seg), each memory-mapped so appends and
+reads are plain memory copies. Records are a 4-byte little-endian length
+followed by the payload; a zero length marks the end of the written data
+(new segments are zero-filled). The payload is written before its length, so
+a crash mid-append leaves the record invisible rather than corrupt.
+
+Two positions are kept:
+  read position - how far the forwarder has been handed records (in memory)
+  cursor        - how far delivery has been confirmed; persisted to the
+                  `cursor` file (atomic replace) at most every commit_interval
+After a restart reading resumes at the cursor, so records that were read but
+not confirmed are sent again (at-least-once). Segments wholly before the
+cursor are deleted.
+
+Single-threaded: every method must be called from the relay loop thread.
+"""
+import mmap
+import os
+import re
+import struct
+import time
+
+LENGTH = struct.Struct('<I')
+
+SEGMENT_PATTERN = re.compile(r'^spool-(\d{12})\.seg$')
+
+
+class _Segment:
+    """One memory-mapped segment file"""
+    __slots__ = ('seq', 'path', 'file', 'map')
+
+    def __init__(self, seq, path, size):
+        self.seq = seq
+        self.path = path
+        exists = os.path.exists(path)
+        self.file = open(path, 'r+b' if exists else 'w+b')
+        if not exists or os.path.getsize(path) < size:
+            self.file.truncate(size)  # Zero-filled: a zero length marks the end of the data
+        self.map = mmap.mmap(self.file.fileno(), size)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+class SegmentSpool:
+    """Append-only, memory-mapped segment log with a committed read cursor"""
+
+    def __init__(self, directory, segment_size=16 * 1024 * 1024, max_segments=64, commit_interval=0.5):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.commit_interval = commit_interval
+        self._segments = {}
+        # Cursor committed in memory but not yet written to the cursor file
+        self.dirty = False
+        self._last_persist = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self._cursor_path = os.path.join(directory, 'cursor')
+        self._open()
+
+    def _open(self):
+        """Recover the cursor and the write position from the files on disk"""
+        existing = sorted(int(m.group(1)) for m in map(SEGMENT_PATTERN.match, os.listdir(self.directory)) if m)
+        cursor = self._load_cursor()
+        if cursor is None:
+            cursor = (existing[0] if existing else 0, 0)
+        for seq in existing:
+            if seq < cursor[0]:
+                os.remove(self._path(seq))
+        existing = [seq for seq in existing if seq >= cursor[0]]
+        self.cursor = cursor
+        self.read_position = cursor
+        self._first_seq = cursor[0]
+        write_seq = existing[-1] if existing else cursor[0]
+        self.write_position = (write_seq, self._scan_end(write_seq))
+        # Records between the cursor and the end of the data (counted once at startup)
+        self.pending = self._count(cursor, self.write_position)
+        if self.pending:
+            print(f"Spool recovered {self.pending} undelivered messages in {self.directory}")
+
+    def _load_cursor(self):
+        try:
+            with open(self._cursor_path) as f:
+                seq, offset = f.read().split()
+            return int(seq), int(offset)
+        except (OSError, ValueError):
+            return None
+
+    def _persist_cursor(self):
+        temp_path = self._cursor_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(f"{self.cursor[0]} {self.cursor[1]}\n")
+        os.replace(temp_path, self._cursor_path)
+        self.dirty = False
+        self._last_persist = time.monotonic()
+
+    def _path(self, seq):
+        return os.path.join(self.directory, f"spool-{seq:012d}.seg")
+
+    def _segment(self, seq):
+        segment = self._segments.get(seq)
+        if segment is None:
+            segment = self._segments[seq] = _Segment(seq, self._path(seq), self.segment_size)
+        return segment
+
+    def _release(self, seq):
+        segment = self._segments.pop(seq, None)
+        if segment is not None:
+            segment.close()
+
+    def _scan_end(self, seq):
+        """Offset just past the last complete record in segment seq"""
+        if not os.path.exists(self._path(seq)):
+            return 0
+        data = self._segment(seq).map
+        offset = 0
+        limit = self.segment_size - LENGTH.size
+        while offset <= limit:
+            (length,) = LENGTH.unpack_from(data, offset)
+            if length == 0 or offset + LENGTH.size + length > self.segment_size:
+                break
+            offset += LENGTH.size + length
+        return offset
+
+    def _count(self, position, end):
+        """Number of records between two positions (startup only)"""
+        count = 0
+        while True:
+            position = self._next(position, end)
+            if position is None:
+                return count
+            seq, offset = position
+            (length,) = LENGTH.unpack_from(self._segment(seq).map, offset)
+            position = (seq, offset + LENGTH.size + length)
+            count += 1
+
+    def _next(self, position, end):
+        """Position of the next record at or after position, or None if there is none yet"""
+        while True:
+            seq, offset = position
+            if position == end:
+                return None
+            if offset + LENGTH.size <= self.segment_size and LENGTH.unpack_from(self._segment(seq).map, offset)[0]:
+                return position
+            if seq >= end[0]:
+                return None
+            # Sealed segment; continue in the next one
+            if seq != self.read_position[0]:
+                self._release(seq)
+            position = (seq + 1, 0)
+
+    def append(self, payload):
+        """Append one record; returns False if the spool is full (max_segments) or it is too large"""
+        size = LENGTH.size + len(payload)
+        if size > self.segment_size:
+            return False
+        seq, offset = self.write_position
+        if offset + size > self.segment_size:
+            if seq + 1 - self._first_seq >= self.max_segments:
+                return False
+            # Seal this segment (the reader moves on when it sees a zero length or the end)
+            if seq != self.read_position[0]:
+                self._release(seq)
+            seq, offset = seq + 1, 0
+        data = self._segment(seq).map
+        data[offset + LENGTH.size:offset + size] = payload
+        LENGTH.pack_into(data, offset, len(payload))
+        self.write_position = (seq, offset + size)
+        self.pending += 1
+        return True
+
+    def read(self, max_count):
+        """Up to max_count records after the read position: (payloads, positions after each)"""
+        payloads = []
+        positions = []
+        position = self.read_position
+        end = self.write_position
+        while len(payloads) < max_count:
+            position = self._next(position, end)
+            if position is None:
+                break
+            seq, offset = position
+            data = self._segment(seq).map
+            (length,) = LENGTH.unpack_from(data, offset)
+            start = offset + LENGTH.size
+            payloads.append(data[start:start + length])
+            position = (seq, start + length)
+            positions.append(position)
+        if positions:
+            self.read_position = positions[-1]
+        return payloads, positions
+
+    def rewind(self, position=None):
+        """Read again from position (default: the cursor, i.e. everything not committed)"""
+        self.read_position = self.cursor if position is None else position
+
+    def commit(self, position, count):
+        """Confirm delivery of `count` records up to position; deletes segments left behind
+
+        The cursor file is only rewritten by persist(), so a crash can replay up to
+        commit_interval seconds of already delivered records.
+        """
+        self.cursor = position
+        self.pending -= count
+        self.dirty = True
+        while self._first_seq < position[0]:
+            self._release(self._first_seq)
+            try:
+                os.remove(self._path(self._first_seq))
+            except OSError as e:
+                print(f"Error removing spool segment: {e}")
+            self._first_seq += 1
+
+    def persist(self, force=False):
+        """Write the committed cursor to disk if it moved and commit_interval has passed"""
+        if self.dirty and (force or time.monotonic() - self._last_persist >= self.commit_interval):
+            self._persist_cursor()
+
+    def close(self):
+        self.persist(force=True)
+        # Flush the segment being written (only matters if the OS goes down, not the relay)
+        segment = self._segments.get(self.write_position[0])
+        if segment is not None:
+            segment.map.flush()
+        for seq in list(self._segments):
+            self._release(seq)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""TCP syslog ingest with RFC 6587 framing.
+
+Each connection gets a FrameDecoder that parses frames incrementally from a
+streaming buffer. Both framings from RFC 6587 are accepted, decided per
+frame from its first byte:
+  octet counting  - "MSG-LEN SP SYSLOG-MSG" (first byte is a digit 1-9)
+  non-transparent - SYSLOG-MSG terminated by LF (or NUL, which some senders use)
+Frames are sliced out of the buffer by offset; consumed bytes are removed
+once per read, not once per frame. Every frame goes to the same handler as
+UDP datagrams.
+"""
+import asyncio
+
+# Longest octet-count prefix accepted ("65535 " and then some)
+MAX_COUNT_DIGITS = 9
+
+DIGITS = b'0123456789'
+
+
+class FrameDecoder:
+    """Incremental RFC 6587 frame parser for one TCP stream"""
+
+    def __init__(self, max_frame_size=65536):
+        self.max_frame_size = max_frame_size
+        self.truncated = 0
+        self._buffer = bytearray()
+        # Bytes of an oversized frame still to be thrown away
+        self._skip = 0
+        # Oversized LF-framed message: discard until the next LF
+        self._skip_to_lf = False
+
+    def feed(self, data):
+        """Add received bytes; returns the list of complete frames"""
+        buffer = self._buffer
+        buffer += data
+        frames = []
+        pos = 0
+        end = len(buffer)
+        while pos < end:
+            if self._skip:
+                taken = min(self._skip, end - pos)
+                self._skip -= taken
+                pos += taken
+                continue
+            if self._skip_to_lf:
+                lf = buffer.find(b'\n', pos)
+                if lf < 0:
+                    pos = end
+                    break
+                self._skip_to_lf = False
+                pos = lf + 1
+                continue
+
+            first = buffer[pos]
+            if 0x31 <= first <= 0x39:  # '1'-'9': octet counting
+                space = buffer.find(b' ', pos, pos + MAX_COUNT_DIGITS + 1)
+                if space < 0:
+                    if end - pos <= MAX_COUNT_DIGITS and buffer[pos:end].strip(DIGITS) == b'':
+                        break  # Length prefix still arriving
+                else:
+                    count = buffer[pos:space]
+                    if count.isdigit():
+                        length = int(count)
+                        start = space + 1
+                        if length > self.max_frame_size:
+                            # Keep the first max_frame_size bytes, discard the rest as it arrives
+                            if end - start < self.max_frame_size:
+                                break
+                            frames.append(bytes(buffer[start:start + self.max_frame_size]))
+                            self.truncated += 1
+                            self._skip = length - self.max_frame_size
+                            pos = start + self.max_frame_size
+                            continue
+                        if end - start < length:
+                            break  # Frame incomplete
+                        frames.append(bytes(buffer[start:start + length]))
+                        pos = start + length
+                        continue
+                # Not a valid length prefix: fall through and treat it as LF framing
+
+            lf = self._find_trailer(buffer, pos, end)
+            if lf < 0:
+                if end - pos > self.max_frame_size:
+                    frames.append(bytes(buffer[pos:pos + self.max_frame_size]))
+                    self.truncated += 1
+                    self._skip_to_lf = True
+                    pos = end
+                break
+            if lf - pos > self.max_frame_size:
+                frames.append(bytes(buffer[pos:pos + self.max_frame_size]))
+                self.truncated += 1
+            elif lf > pos:
+                frames.append(bytes(buffer[pos:lf]).rstrip(b'\r'))
+            pos = lf + 1
+        if pos:
+            del buffer[:pos]
+        return frames
+
+    def flush(self):
+        """Frame left over when the stream ends (a final message without a trailer)"""
+        if self._skip or self._skip_to_lf or not self._buffer.strip():
+            self._buffer.clear()
+            return []
+        frame = bytes(self._buffer[:self.max_frame_size]).rstrip(b'\r\n\x00')
+        self._buffer.clear()
+        return [frame] if frame else []
+
+    @staticmethod
+    def _find_trailer(buffer, start, end):
+        lf = buffer.find(b'\n', start, end)
+        nul = buffer.find(b'\x00', start, lf if lf >= 0 else end)
+        return nul if nul >= 0 else lf
+
+
+class TcpIngestProtocol(asyncio.Protocol):
+    """One TCP syslog connection: decode frames and pass each one to the relay"""
+
+    def __init__(self, relay):
+        self.relay = relay
+        self.decoder = FrameDecoder(relay.max_message_size)
+        self.transport = None
+        self.peer = None
+        self._last_activity = 0.0
+        self._idle_handle = None
+
+    def connection_made(self, transport):
+        relay = self.relay
+        if len(relay.tcp_connections) >= relay.tcp_max_connections:
+            print(f"TCP connection limit ({relay.tcp_max_connections}) reached, "
+                  f"refusing {transport.get_extra_info('peername')}")
+            transport.close()
+            return
+        self.transport = transport
+        self.peer = transport.get_extra_info('peername')
+        relay.tcp_connections.add(self)
+        relay.metrics.tcp_accepted += 1
+        if relay.ingest_paused:
+            transport.pause_reading()
+        self._last_activity = relay.loop.time()
+        if relay.tcp_idle_timeout:
+            self._idle_handle = relay.loop.call_later(relay.tcp_idle_timeout, self._check_idle)
+
+    def data_received(self, data):
+        if self.transport is None:
+            return
+        self._last_activity = self.relay.loop.time()
+        self._deliver(self.decoder.feed(data))
+
+    def eof_received(self):
+        if self.transport is not None:
+            self._deliver(self.decoder.flush())
+        return False  # Close our side too
+
+    def connection_lost(self, exc):
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+        if self.transport is not None:
+            self.relay.tcp_connections.discard(self)
+            self.transport = None
+
+    def _deliver(self, frames):
+        handle = self.relay.handle_datagram
+        for frame in frames:
+            handle(frame, self.peer)
+        if self.decoder.truncated:
+            self.relay.metrics.frames_truncated += self.decoder.truncated
+            self.decoder.truncated = 0
+
+    def _check_idle(self):
+        # Senders that vanish without a FIN would otherwise hold a slot forever
+        if self.transport is None:
+            return
+        loop = self.relay.loop
+        idle = loop.time() - self._last_activity
+        if idle >= self.relay.tcp_idle_timeout:
+            print(f"Closing idle TCP connection from {self.peer}")
+            self.transport.close()
+            return
+        self._idle_handle = loop.call_later(self.relay.tcp_idle_timeout - idle, self._check_idle)
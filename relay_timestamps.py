@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Cached RFC 3164 timestamp conversion for the device offset stage.
+
+An RFC 3164 timestamp ("Mmm dd hh:mm:ss") is fixed width, so it is read by
+slicing instead of strptime, and written back with one format string
+instead of strftime. Bursts share the same second, so each converter keeps
+the results of the seconds it has seen: most messages cost one dict lookup.
+
+A device offset is either a number of hours added to the timestamp, or the
+name of the time zone the device clock runs in ("America/New_York"), in
+which case the timestamp is converted from that zone's local time to UTC
+with the offset in effect at that moment, so DST changes need no config
+edit. During the repeated hour when DST ends, the reading closest to the
+time the message arrived is used (and not cached).
+
+RFC 3164 has no year: it is taken as the one that puts the timestamp
+within six months of now, so a "Dec 31 23:59:59" received just after New
+Year is read as last year (which matters for leap days and DST).
+"""
+import time
+from datetime import datetime, timedelta, timezone
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError  # Python 3.9+; Windows also needs the tzdata package
+except ImportError:
+    ZoneInfo = None
+
+MONTH_NAMES = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+MONTHS = {name: number for number, name in enumerate(MONTH_NAMES, 1)}
+
+# Distinct source seconds cached per converter before the cache is cleared
+CACHE_SIZE = 256
+
+# Seconds a cached conversion is trusted (the inferred year and zone rules can change over time)
+CACHE_SECONDS = 3600
+
+
+def load_zone(name):
+    """tzinfo for an IANA time zone name; raises ValueError"""
+    if ZoneInfo is None:
+        raise ValueError(f"time zone {name!r} needs Python 3.9 or later (zoneinfo)")
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"unknown time zone {name!r} (on Windows, install the tzdata package)") from None
+
+
+def parse_offset(value, what):
+    """Device offset (hours, or a time zone name) checked for use; raises ValueError"""
+    if isinstance(value, str):
+        try:
+            load_zone(value)
+        except ValueError as e:
+            raise ValueError(f"{what}: {e}") from None
+        return value
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or not -24 <= value <= 24:
+        raise ValueError(f"{what} must be a number of hours or a time zone name, got {value!r}")
+    return value
+
+
+def parse_timestamp(timestamp):
+    """(month, day, hour, minute, second) of an RFC 3164 timestamp, or None"""
+    month = MONTHS.get(timestamp[:3])
+    if month is None:
+        return None
+    try:
+        if len(timestamp) == 15 and timestamp[6] == ' ' and timestamp[9] == ':' and timestamp[12] == ':':
+            # "Mmm dd hh:mm:ss", day space- or zero-padded
+            return month, int(timestamp[4:6]), int(timestamp[7:9]), int(timestamp[10:12]), int(timestamp[13:15])
+        # Unpadded day or extra spaces
+        _, day, clock = timestamp.split()
+        hour, minute, second = clock.split(':')
+        return month, int(day), int(hour), int(minute), int(second)
+    except ValueError:
+        return None
+
+
+def infer_year(month, now):
+    """Year of a timestamp in `month` seen at datetime `now`: the one within six months of now"""
+    if month - now.month > 6:
+        return now.year - 1
+    if now.month - month > 6:
+        return now.year + 1
+    return now.year
+
+
+def format_timestamp(dt):
+    """RFC 3164 timestamp text of a datetime (day zero-padded, as the relay has always written it)"""
+    return f"{MONTH_NAMES[dt.month - 1]} {dt.day:02d} {dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}"
+
+
+class TimestampConverter:
+    """Shifts RFC 3164 timestamps by one device offset, caching the result per source second"""
+
+    def __init__(self, offset, cache_size=CACHE_SIZE, clock=time.time):
+        # Hours added, or the name of the device's time zone (converted to UTC)
+        self.offset = offset
+        self.zone = load_zone(offset) if isinstance(offset, str) else None
+        self.delta = timedelta(hours=offset) if self.zone is None else None
+        self.cache_size = cache_size
+        self.clock = clock
+        # Source timestamp text -> converted text
+        self._cache = {}
+        self._expires = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def convert(self, timestamp):
+        """Converted timestamp text, or None if timestamp is not a valid RFC 3164 timestamp"""
+        result = self._cache.get(timestamp)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+        fields = parse_timestamp(timestamp)
+        if fields is None:
+            return None
+        now = self.clock()
+        cache = self._cache
+        if now >= self._expires or len(cache) >= self.cache_size:
+            cache.clear()
+            self._expires = now + CACHE_SECONDS
+        month, day, hour, minute, second = fields
+        try:
+            if self.zone is None:
+                year = infer_year(month, datetime.fromtimestamp(now))
+                result = format_timestamp(datetime(year, month, day, hour, minute, second) + self.delta)
+                cache[timestamp] = result
+                return result
+            year = infer_year(month, datetime.fromtimestamp(now, self.zone))
+            local = datetime(year, month, day, hour, minute, second, tzinfo=self.zone)
+        except ValueError:
+            # Day out of range for the month (Feb 29 outside a leap year) or a field out of range
+            return None
+        earlier = local.astimezone(timezone.utc)
+        later = local.replace(fold=1).astimezone(timezone.utc)
+        if earlier == later:
+            result = format_timestamp(earlier)
+            cache[timestamp] = result
+            return result
+        # Repeated hour at the end of DST: whichever reading is closest to the arrival time, not cached
+        arrival = datetime.fromtimestamp(now, timezone.utc)
+        return format_timestamp(min(earlier, later, key=lambda reading: abs(reading - arrival)))
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""Precompiled, single-pass transform pipeline for the syslog relay.
+
+The pipeline is built from the source routing table (relay_routes): every
+rule set gets one precompiled tuple of stages, shared by all the source IPs
+its routes match, so a message from a source with no transforms costs one
+cached lookup, and classification uses cheap prefix checks before any regex
+runs.
+"""
+import re
+from collections import OrderedDict
+
+from relay_filters import FilterEngine
+from relay_message import FAMILY_RFC3164, TIMESTAMP
+from relay_timestamps import TimestampConverter
+
+# <PRI>1 YYYY-MM-DDTHH:MM:SS.mmm+HH:MM (RFC 5424 header as sent by Hubitat)
+RFC5424_HEADER = re.compile(r'<[0-9]+>1\s+\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}[+-]\d{2}:\d{2}')
+
+# <PRI>Mon DD HH:MM:SS (RFC 3164 header)
+RFC3164_HEADER = re.compile(r'(<[0-9]+>)([A-Za-z]{3}\s+\d{1,2}\s+\d{2}:\d{2}:\d{2})')
+
+# Docker container tag written by Unraid: container[ID]:
+DOCKER_TAG = re.compile(r'([a-zA-Z0-9_-]+)\[([0-9]+)\]:')
+
+# Docker tag with or without the space inserted by the hostname stage
+DOCKER_TAG_ANY = re.compile(r'([a-zA-Z0-9_-]+)\s*\[([0-9]+)\]:')
+
+# All superfluous container dates in one alternation (one scan instead of three):
+#   Frigate ISO format with fractional seconds (2025-08-24 08:54:23.339023614) -> ''
+#   Bracketed timestamp ([2025-08-24 08:54:23]) with surrounding spaces       -> ' '
+#   ImmichFrame short date (25-08-24 08:54:24 ) with trailing spaces          -> ''
+DOCKER_DATES = re.compile(
+    r'(?P<iso>\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}\.\d+)'
+    r'|(?P<bracketed>\s*\[\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}\]\s*)'
+    r'|(?P<short>\d{2}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}\s+)'
+)
+
+WHITESPACE = re.compile(r'\s+')
+
+
+def _date_replacement(match):
+    return ' ' if match.lastgroup == 'bracketed' else ''
+
+
+def is_rfc5424_message(message):
+    """Check if message is RFC 5424 format that should be passed through without conversion"""
+    # Hubitat and other RFC 5424 senders put the header first: "<PRI>1 "
+    if message.startswith('<'):
+        end = message.find('>', 1, 5)
+        if end > 0 and message.startswith('1', end + 1) and RFC5424_HEADER.match(message) is not None:
+            return True
+    # The header can appear later in the message; without a ">1" there is no need to run the regex
+    if '>1' not in message:
+        return False
+    return RFC5424_HEADER.search(message) is not None
+
+
+class TransformPipeline:
+    """Per-route transform stages for RFC 3164 messages, built once per configuration"""
+
+    def __init__(self, routes, filters=None):
+        # RouteTable: source IP -> RuleSet (longest prefix match, memoized per IP)
+        self.routes = routes
+        # FilterEngine: severity/facility/source drop and sample rules
+        self.filters = filters if filters is not None else FilterEngine()
+        # Device offset -> TimestampConverter, shared by the routes with that offset
+        self.converters = {}
+        # RuleSet -> tuple of stage callables
+        self._stages = {rules: self._build_stages(rules) for rules in set(routes.routes.values())}
+
+    def _build_stages(self, rules):
+        stages = []
+        if rules.offset is not None:
+            converter = self.converters.get(rules.offset)
+            if converter is None:
+                converter = self.converters[rules.offset] = TimestampConverter(rules.offset)
+            stages.append(lambda message, state, converter=converter:
+                          self._adjust_timestamp(message, converter, state))
+        if rules.hostname is not None:
+            stages.append(lambda message, state, hostname=rules.hostname: self._rewrite_hostname(message, hostname))
+        if rules.docker_tags:
+            stages.append(self._adjust_docker_hostname)
+        if rules.strip_dates:
+            if rules.docker_tags:
+                stages.append(self._strip_docker_dates)
+            stages.append(self._collapse_whitespace)
+        return tuple(stages)
+
+    def rules_for(self, source_ip):
+        """RuleSet for a source IP, or None when no route matches"""
+        return self.routes.lookup(source_ip)
+
+    def stages_for(self, rules):
+        """Stage tuple for a RuleSet (empty for None)"""
+        return self._stages.get(rules, ()) if rules is not None else ()
+
+    def process(self, message, source_ip):
+        """Run the stages configured for source_ip over an RFC 3164 message"""
+        return self.run(message, self.stages_for(self.rules_for(source_ip)))
+
+    @staticmethod
+    def run(message, stages, record=None):
+        """Run a precomputed stage tuple (see SourceProfile.stages) over a message (record: its SyslogMessage)"""
+        if not stages:
+            return message
+        # Shared between stages so later stages can reuse earlier matches and the parsed header
+        state = {'record': record}
+        for stage in stages:
+            message = stage(message, state)
+        return message
+
+    def _adjust_timestamp(self, message, converter, state):
+        """Shift the RFC 3164 timestamp by the device offset"""
+        record = state.get('record')
+        timestamp = record.raw(TIMESTAMP) if record is not None and record.family == FAMILY_RFC3164 else None
+        if timestamp:
+            # First stage, so the message is still the decoded datagram: the header is ASCII and byte
+            # offsets are character offsets
+            end = record.header_end - 1
+            start = end - len(timestamp)
+        else:
+            match = RFC3164_HEADER.match(message) if message.startswith('<') else None
+            if match is None:
+                match = RFC3164_HEADER.search(message)
+                if match is None:
+                    return message
+            start, end = match.span(2)
+        adjusted_timestamp = converter.convert(message[start:end])
+        if adjusted_timestamp is None:
+            print(f"Error adjusting traditional timestamp: {message[start:end]!r}")
+            return message
+        return f"{message[:start]}{adjusted_timestamp}{message[end:]}"
+
+    def _rewrite_hostname(self, message, hostname):
+        """Replace the HOSTNAME field after the RFC 3164 timestamp"""
+        match = RFC3164_HEADER.match(message) if message.startswith('<') else None
+        if match is None:
+            return message
+        start = match.end() + 1
+        end = message.find(' ', start)
+        if message[match.end():start] != ' ' or end < 0:
+            return message
+        return f"{message[:start]}{hostname}{message[end:]}"
+
+    def _adjust_docker_hostname(self, message, state):
+        """container[ID]: -> container [ID]:"""
+        if '[' not in message:
+            return message
+        match = DOCKER_TAG.search(message)
+        if match is None:
+            return message
+        state['docker_tag'] = True
+        return f"{message[:match.start()]}{match.group(1)} [{match.group(2)}]:{message[match.end():]}"
+
+    def _strip_docker_dates(self, message, state):
+        """Strip superfluous date information from Docker container messages"""
+        if not state.get('docker_tag') and ('[' not in message or DOCKER_TAG_ANY.search(message) is None):
+            return message
+        if '-' not in message:
+            return message
+        return DOCKER_DATES.sub(_date_replacement, message)
+
+    def _collapse_whitespace(self, message, state):
+        """Clean up any double spaces left by earlier stages"""
+        return WHITESPACE.sub(' ', message)
+
+
+class SourceProfile:
+    """What the relay knows about one source IP, decided from the configuration on its first message"""
+    __slots__ = ('source_ip', 'stages', 'rules', 'gated', 'pri_actions', '_sample_credit')
+
+    def __init__(self, source_ip, stages, rules=None, pri_actions=None):
+        self.source_ip = source_ip
+        # Transform stages for this source; empty means forward untouched
+        self.stages = stages
+        # RuleSet of the matching route (None: no route)
+        self.rules = rules
+        # True when the route drops or samples, so admit() must be asked
+        self.gated = rules is not None and rules.gated
+        # FilterEngine table indexed by PRI for this source (None: no filter rule applies)
+        self.pri_actions = pri_actions
+        self._sample_credit = 0.0
+
+    def admit(self):
+        """Drop/sample decision for one message from a gated source"""
+        rules = self.rules
+        if rules.drop:
+            return False
+        # Forward exactly `sample` of the messages, evenly spaced
+        self._sample_credit += rules.sample
+        if self._sample_credit >= 1.0:
+            self._sample_credit -= 1.0
+            return True
+        return False
+
+
+class SourceProfileCache:
+    """Bounded LRU cache of SourceProfile objects keyed on source IP"""
+
+    def __init__(self, pipeline, max_size=4096):
+        self.pipeline = pipeline
+        self.max_size = max_size
+        self._profiles = OrderedDict()
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def lookup(self, source_ip):
+        """Return the profile for source_ip, building it on the source's first message"""
+        profile = self._profiles.get(source_ip)
+        if profile is not None:
+            self._profiles.move_to_end(source_ip)
+            return profile
+        rules = self.pipeline.rules_for(source_ip)
+        profile = SourceProfile(source_ip, self.pipeline.stages_for(rules), rules,
+                                self.pipeline.filters.table_for(source_ip))
+        self._profiles[source_ip] = profile
+        if len(self._profiles) > self.max_size:
+            self._profiles.popitem(last=False)
+        return profile
+
+    def invalidate(self, pipeline=None):
+        """Drop every profile (call when the configuration is reloaded)"""
+        if pipeline is not None:
+            self.pipeline = pipeline
+        self._profiles.clear()
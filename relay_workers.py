@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""Multi-process receive: N worker processes sharing the listen port with SO_REUSEPORT.
+
+Each worker runs its own AsyncRelay (and therefore its own copy of the
+transform pipeline) on a socket bound with SO_REUSEPORT, so the kernel
+spreads incoming datagrams across the workers and the GIL no longer limits
+the relay to one core. The parent supervises the workers, restarting any
+that die, and sums their counters for the monitoring stats line.
+
+Each worker keeps its own RelayMetrics (single writer, no locks) and
+publishes a snapshot to the parent over its control pipe once a second.
+"""
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from relay_async import AsyncRelay
+from relay_metrics import merge_snapshots
+
+# How often a worker publishes its metrics snapshot
+PUBLISH_INTERVAL = 1.0
+
+
+def reuseport_supported():
+    """SO_REUSEPORT load-balances UDP across sockets on Linux only"""
+    return sys.platform.startswith('linux') and hasattr(socket, 'SO_REUSEPORT')
+
+
+def _worker_main(index, factory, listen_addr, forward_addr, relay_options, conn):
+    """Worker process entry point"""
+    # Ctrl+C is handled by the parent, which stops the workers in order
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # factory(index) -> (handler, metrics, cleanup, setup); the handler records into metrics too and
+    # setup(relay) registers the worker's own periodic tasks (e.g. config reload)
+    handler, metrics, cleanup, setup = factory(index)
+    if relay_options.get('spool_dir'):
+        # Each worker replays and commits its own spool
+        relay_options = dict(relay_options, spool_dir=os.path.join(relay_options['spool_dir'], f"worker{index}"))
+    relay = AsyncRelay(listen_addr, forward_addr, handler, reuse_port=True, metrics=metrics, **relay_options)
+
+    def publish():
+        try:
+            conn.send(metrics.snapshot())
+        except OSError:
+            pass  # Parent gone
+
+    relay.add_periodic(PUBLISH_INTERVAL, publish)
+    setup(relay)
+
+    def wait_for_stop():
+        # The parent sends a message (or dies, closing the pipe) to stop this worker
+        try:
+            conn.recv()
+        except (EOFError, OSError):
+            pass
+        relay.stop()
+
+    threading.Thread(target=wait_for_stop, name="worker-stop", daemon=True).start()
+    try:
+        relay.run()
+    finally:
+        publish()
+        cleanup()
+
+
+class WorkerSupervisor:
+    """Start, watch and restart relay worker processes"""
+
+    def __init__(self, worker_count, factory, listen_addr, forward_addr, restart_delay=1.0, **relay_options):
+        self.worker_count = worker_count
+        # factory must be importable by name (module-level function) for the spawn start method
+        self.factory = factory
+        self.listen_addr = listen_addr
+        self.forward_addr = forward_addr
+        # Passed through to each worker's AsyncRelay (batch_size, rcvbuf, tcp_listen_addr, ...)
+        self.relay_options = relay_options
+        self.restart_delay = restart_delay
+        self.restarts = 0
+        # spawn: never fork a process that is running the tray, log writer and event loop threads
+        self._ctx = multiprocessing.get_context('spawn')
+        # Latest metrics snapshot published by each worker
+        self._snapshots = [None] * worker_count
+        # Counts from workers that died, so totals never go backwards after a restart
+        self._retired = merge_snapshots([])
+        # One control pipe per worker (stop requests down, metrics snapshots up): a shared
+        # multiprocessing.Event would deadlock set() if a worker was killed while waiting on it
+        self._conns = [None] * worker_count
+        self._conn_closed = set()
+        self._stopped = threading.Event()
+        self._wakeup_reader, self._wakeup_writer = multiprocessing.Pipe(duplex=False)
+        self._processes = [None] * worker_count
+        self._thread = None
+        self._stopping = False
+
+    def start(self):
+        """Start every worker and the supervisor thread"""
+        self._stopping = False
+        self._stopped.clear()
+        for index in range(self.worker_count):
+            self._spawn(index)
+        self._thread = threading.Thread(target=self._supervise, name="worker-supervisor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stop the workers, waiting up to timeout seconds before terminating them"""
+        self._stopping = True
+        self._stopped.set()
+        self._wakeup_writer.send(None)
+        for conn in self._conns:
+            if conn is not None:
+                try:
+                    conn.send(None)
+                except OSError:
+                    pass  # Worker already gone
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            if process is not None:
+                process.join(max(0, deadline - time.monotonic()))
+                if process.is_alive():
+                    process.terminate()
+                    process.join(1)
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        # Collect the final snapshots the workers published on the way out
+        for index, conn in enumerate(self._conns):
+            if conn is not None:
+                self._receive(index)
+                conn.close()
+                self._conns[index] = None
+            self._retire(index)
+
+    def _spawn(self, index):
+        if self._conns[index] is not None:
+            self._conns[index].close()
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main, name=f"relay-worker-{index}", daemon=True,
+            args=(index, self.factory, self.listen_addr, self.forward_addr, self.relay_options, child_conn))
+        process.start()
+        child_conn.close()
+        self._conns[index] = parent_conn
+        self._conn_closed.discard(index)
+        self._processes[index] = process
+        print(f"Relay worker {index} started (pid {process.pid})")
+
+    def _receive(self, index):
+        """Read every snapshot waiting on a worker's pipe, keeping the newest"""
+        conn = self._conns[index]
+        try:
+            while conn.poll():
+                self._snapshots[index] = conn.recv()
+        except (EOFError, OSError):
+            # Worker exited; its sentinel triggers the restart
+            self._conn_closed.add(index)
+
+    def _supervise(self):
+        """Collect worker snapshots and restart any worker that exits"""
+        while not self._stopping:
+            sentinels = {p.sentinel: i for i, p in enumerate(self._processes) if p is not None}
+            conns = {c: i for i, c in enumerate(self._conns)
+                     if c is not None and i not in self._conn_closed}
+            ready = multiprocessing.connection.wait(list(sentinels) + list(conns) + [self._wakeup_reader])
+            if self._stopping:
+                break
+            for handle in ready:
+                if handle is self._wakeup_reader:
+                    self._wakeup_reader.recv()
+                elif handle in conns:
+                    self._receive(conns[handle])
+            for handle in ready:
+                index = sentinels.get(handle)
+                if index is None:
+                    continue
+                process = self._processes[index]
+                process.join(1)
+                print(f"Relay worker {index} (pid {process.pid}) exited with code {process.exitcode}, restarting")
+                self._receive(index)
+                self._retire(index)
+                self.restarts += 1
+                # Avoid a tight crash loop if the worker dies on startup
+                if self._stopped.wait(self.restart_delay):
+                    break
+                self._spawn(index)
+
+    def _retire(self, index):
+        snapshot = self._snapshots[index]
+        if snapshot is not None:
+            self._retired = merge_snapshots([self._retired, snapshot])
+            self._snapshots[index] = None
+
+    def alive(self):
+        return sum(1 for p in self._processes if p is not None and p.is_alive())
+
+    def totals(self):
+        """Metrics snapshot summed across all workers (including restarted ones)"""
+        return merge_snapshots([self._retired] + list(self._snapshots))
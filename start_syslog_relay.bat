@@ -1,5 +1,5 @@
 @echo off
-title Syslog Relay v1.34
-echo Starting Syslog Relay v1.34...
+title Syslog Relay v1.58
+echo Starting Syslog Relay v1.58...
 python syslog_relay_tray.py
 pause
\ No newline at end of file
@@ -1,10 +1,9 @@
 #!/usr/bin/env python3
 import socket
-import re
 import time
 import threading
 import sys
-from datetime import datetime, timedelta
+from datetime import datetime
 import tkinter as tk
 from tkinter import messagebox
 import pystray
@@ -13,12 +12,79 @@ import os
 import psutil
 import gc
 import platform
+import functools
+from relay_archive import ArchiveWriter
+from relay_async import AsyncRelay
+from relay_config import RESTART_SETTINGS, ConfigWatcher, RelayConfig
+from relay_dedup import Deduplicator
+from relay_destinations import parse_destination
+from relay_diagnostics import DEBUG, Diagnostics, DiagnosticsSpec, parse_diagnostics
+from relay_exporter import MetricsExporter
+from relay_filters import FACILITY_NAMES, FilterEngine, parse_filter
+from relay_kernel import clamped_buffers, probe_socket_buffers, udp_snmp_counters, udp_socket_stats
+from relay_logwriter import LogWriter
+from relay_message import FAMILY_RFC5424, SyslogMessage
+from relay_metrics import RateWindow, RelayMetrics, latency_percentile, merge_snapshots
+from relay_ratelimit import RateLimiter, RateLimitSpec
+from relay_routes import RouteTable, host_routes, parse_route
+from relay_workers import WorkerSupervisor, reuseport_supported
+from relay_transforms import SourceProfileCache, TransformPipeline, is_rfc5424_message
 
 # Configuration
 LISTEN_PORT = 513
 FORWARD_PORT = 514
 FORWARD_HOST = '127.0.0.1'
 
+# Batched datagram engine
+# Number of datagrams drained from the listen socket per wakeup (uses recvmmsg/sendmmsg on Linux)
+RELAY_BATCH_SIZE = 64
+MAX_DATAGRAM_SIZE = 8192  # Was 1024, which truncated long messages (stack traces)
+
+# TCP ingest (Hubitat "UDP or TCP?" = TCP): RFC 6587 octet-counted or LF-delimited frames
+TCP_LISTEN_PORT = 513  # None disables the TCP listener
+TCP_MAX_MESSAGE_SIZE = 64 * 1024  # Longer frames are truncated to this
+TCP_MAX_CONNECTIONS = 256
+TCP_IDLE_TIMEOUT = 300  # Seconds before a silent connection is closed
+
+# Forwarding to ktranslate: 'udp' = one datagram per message; 'tcp' = one persistent connection with
+# RFC 6587 octet-counted frames, coalesced writes, reconnect with exponential backoff and a bounded
+# queue that pauses ingestion when ktranslate lags (ktranslate must accept syslog over TCP on
+# FORWARD_PORT). Startup/stats/health messages are still sent over UDP.
+FORWARD_PROTOCOL = 'udp'
+FORWARD_QUEUE_SIZE = 10000  # Messages held while ktranslate is slow or restarting
+FORWARD_BATCH_BYTES = 64 * 1024  # Largest coalesced write
+FORWARD_RECONNECT_MAX = 30  # Cap on the reconnect backoff, seconds
+
+# Disk spool (store-and-forward) between the transforms and the forwarder: messages are written to
+# memory-mapped segment files under the log folder and only removed once ktranslate has taken them,
+# so a ktranslate restart or outage costs no data. Delivery is at-least-once (a relay crash can
+# re-send up to half a second of messages). UDP forwarding detects a stopped ktranslate through ICMP
+# port unreachable; TCP forwarding also covers ktranslate hanging (and, with the spool, the backlog
+# waits on disk instead of pausing ingestion)
+SPOOL_ENABLED = True
+SPOOL_SEGMENT_SIZE = 16 * 1024 * 1024  # Bytes per segment file
+SPOOL_MAX_SEGMENTS = 64  # Disk cap (1 GB); new messages are dropped and counted beyond it
+SPOOL_CATCHUP_RATE = 5000  # Messages per second when replaying a backlog
+
+# Extra collectors that get a copy of the stream, each with its own bounded queue and sender so a slow
+# or unreachable one never holds up ktranslate (the spool only covers FORWARD_HOST). Keys: name, host,
+# port, protocol ('udp'/'tcp'), sources (CIDR list), max_severity (0-7, lower is more severe),
+# facilities (names or 0-23), exclusive (those messages skip ktranslate), queue_size - see
+# relay_destinations.py. Example:
+#   {"name": "archive", "host": "192.168.2.50", "port": 514},
+#   {"name": "alerts", "host": "192.168.2.51", "port": 6514, "protocol": "tcp", "max_severity": 3},
+FORWARD_DESTINATIONS = [
+]
+
+# Socket buffer sizes in bytes (None = OS default). Bursts larger than the receive buffer are
+# dropped by the kernel before the relay sees them; Linux caps these at net.core.rmem_max/wmem_max
+LISTEN_RCVBUF = 4 * 1024 * 1024
+FORWARD_SNDBUF = 1 * 1024 * 1024
+
+# Multi-process receive (Linux only): worker processes sharing LISTEN_PORT via SO_REUSEPORT
+# 1 = single in-process relay (the only option on Windows)
+RELAY_WORKERS = 1
+
 # Hubitat Dual Send Mode - REMOVED in v1.33, now only sends RFC 5424 messages
 
 # Syslog Relay Server Information
@@ -28,8 +94,32 @@ SYSLOG_RELAY_IP = "192.168.2.70"
 SYSLOG_RELAY_PORT = 513
 
 # Version and changelog
-VERSION = "1.34"
+VERSION = "1.58"
 CHANGELOG = {
+    "1.58": "2026-10-18 - Optional Prometheus endpoint on localhost (METRICS_HTTP_*): relay counters, per-source and per-destination counters, queue depths, transform latency histogram and process RSS/CPU, rendered on its own thread from the snapshot published at each metrics sample",
+    "1.57": "2026-10-18 - relay_query.py: query the message archive by time range, source IP/network, hostname, app name and regex; skips segments and blocks using the archive index, reads segments through mmap and streams results block by block",
+    "1.56": "2026-10-18 - Message archive: every forwarded message as one line in gzip block segments with a sidecar time/source-IP index, hourly/16 MB segments, 14-day and 512 MB retention (ARCHIVE_*); the relay thread only queues the payload, compression and indexing run on a writer thread",
+    "1.55": "2026-10-18 - Remove per-message console banners from the hot path; per-message logging moves behind a leveled diagnostics switch (DIAGNOSTICS_* / [diagnostics]: off, messages, debug), off by default and switchable at runtime per source network or sample rate, with the parsed header fields at debug level",
+    "1.54": "2026-10-18 - Cached RFC 3164 timestamp conversion (relay_timestamps): fixed-width slicing instead of strptime/strftime, per-offset cache of recent source seconds, year inferred within six months of now (correct across New Year), and device offsets may name a time zone for DST-aware conversion to UTC",
+    "1.53": "2026-10-18 - Shared parsed message record (relay_message.SyslogMessage): PRI and RFC 5424/3164 format read once per datagram, header fields split on first use without regex (RFC 5424 structured data delimited properly); the filter, rate limit, dedup, fast path and timestamp stages read it instead of each re-scanning the datagram",
+    "1.52": "2026-10-18 - Severity/facility filter engine (FILTER_RULES / [[filters]]): regex-free PRI parser on the raw datagram, drop/sample/forward rules by severity, facility and source compiled to a per-source PRI table and applied before any decode or transform; destinations can also route by facility",
+    "1.51": "2026-10-18 - Duplicate coalescing (DEDUP_WINDOW / transforms.dedup_window): repeats of a message from the same source within the window are counted instead of forwarded and collapse into one '(repeated N times)' line, tracked in a time-bucketed hash index with O(1) expiry",
+    "1.50": "2026-10-18 - Storm suppression: token buckets per source IP and per app name (RATE_LIMIT_* / [rate_limit]) ahead of the transforms, drop or sample mode, periodic 'Suppressed N messages from X' summaries, idle buckets evicted",
+    "1.49": "2026-10-18 - Fan-out forwarding (FORWARD_DESTINATIONS / [[destinations]]): extra UDP/TCP collectors, each with its own bounded queue and sender, routed by source CIDR and severity (optionally exclusive); delivered/dropped/latency per destination in the stats message",
+    "1.48": "2026-10-18 - CIDR source routing (SOURCE_ROUTES / [[routes]]): longest-prefix match to per-route rule sets (offset, date strip, Docker tags, hostname rewrite, drop, sample), memoized per IP",
+    "1.47": "2026-10-18 - External configuration file (syslog_relay.toml) for ports, forward host, device offsets and transform IP lists, compiled into immutable structures and hot-reloaded on change with an atomic swap on the relay loop (no restart, no lost datagrams)",
+    "1.46": "2026-10-18 - Disk spool between the transforms and the forwarder (SPOOL_ENABLED): messages go through memory-mapped segment files and are only removed once ktranslate has taken them, so a ktranslate restart or outage loses nothing; backlog replayed at SPOOL_CATCHUP_RATE, delivered segments deleted",
+    "1.45": "2026-10-18 - Optional persistent TCP forwarding to ktranslate (FORWARD_PROTOCOL = 'tcp'): octet-counted frames, coalesced writes, reconnect with exponential backoff, bounded queue with backpressure and overflow drop counts",
+    "1.44": "2026-10-18 - TCP ingest listener (TCP_LISTEN_PORT) with incremental RFC 6587 octet-counting and LF framing, many concurrent connections, idle timeout; UDP receive limit raised from 1024 to 8192 bytes so long messages arrive whole",
+    "1.43": "2026-10-18 - Configurable SO_RCVBUF/SO_SNDBUF (LISTEN_RCVBUF, FORWARD_SNDBUF), kernel UDP drop counters from /proc/net/udp and /proc/net/snmp in the stats line, startup warning when the kernel clamps a buffer size",
+    "1.42": "2026-10-18 - Lock-free per-relay/per-worker metrics (received, forwarded, dropped, bytes, per-source, per-format, transform latency histogram); messages/minute from a sliding window, counts passthrough traffic and no longer fails with UnboundLocalError",
+    "1.41": "2026-10-18 - Optional multi-process receive (RELAY_WORKERS, Linux): SO_REUSEPORT worker processes supervised and restarted by the tray process, counters aggregated for the stats line",
+    "1.40": "2026-10-18 - Per-source profile cache (LRU, invalidation hook): dispatch is a dict lookup, sources without transforms are forwarded untouched",
+    "1.39": "2026-10-18 - Zero-decode RFC 5424 fast path: classify passthrough datagrams from the raw <PRI>1 header and forward the original bytes untouched",
+    "1.38": "2026-10-18 - Precompiled transform pipeline built once at startup: per-source stage lists, prefix checks before regex, single-pass Docker date stripping",
+    "1.37": "2026-10-18 - Background log writer: bounded queue, one long-lived file handle, batched flushes and in-memory rotation tracking so the relay thread never touches the disk",
+    "1.36": "2026-10-18 - Asyncio relay core: DatagramProtocol ingest, non-blocking forwarding, monitoring as event-loop tasks so Stop/Restart take effect immediately",
+    "1.35": "2026-10-18 - Batched datagram engine: drain up to RELAY_BATCH_SIZE datagrams per wakeup with recvmmsg/sendmmsg on Linux, non-blocking drain elsewhere",
     "1.34": "2025-10-05 - Simplify relay logic: pass through all RFC 5424 messages unchanged, only convert Unraid RFC 3164 messages",
     "1.33": "2025-10-05 - Remove dual-send mode and RFC 3164 conversion for Hubitat messages, keep only RFC 5424 processing",
     "1.32": "2025-10-05 - Remove HUBITAT_TIMEZONE_OFFSET_FIX as timezone handling moved to Hubitat driver with DST auto-detection",
@@ -64,7 +154,8 @@ CHANGELOG = {
     "1.03": "2025-08-03 - Add detailed debug logging to log file for RFC 5424 parsing"
 }
 
-# Device time zone offsets (hours to add to UTC)
+# Device time zone offsets (hours to add to UTC), or the device's time zone name ("America/New_York",
+# converted to UTC with DST applied; needs the tzdata package on Windows)
 # Only Unraid needs conversion - all RFC 5424 messages pass through unchanged
 DEVICE_OFFSETS = {
     "192.168.2.110": 5,  # Unraid (RFC 3164 conversion only)
@@ -77,25 +168,156 @@ DATE_STRIP_IPS = [
     "192.168.2.110",  # Unraid (Docker containers: frigate, immichFrame, etc.)
 ]
 
+# IPs whose messages carry Docker container tags (container[ID]: -> container [ID]:)
+DOCKER_HOST_IPS = [
+    "192.168.2.110",  # Unraid
+]
+
+# CIDR routes for whole subnets (DHCP ranges, Docker bridges); the most specific route for a source
+# wins, and the per-IP settings above count as /32 routes. Keys: cidr, offset, strip_dates,
+# docker_tags, hostname, drop, sample (fraction forwarded) - see relay_routes.py. Example:
+#   {"cidr": "172.17.0.0/16", "docker_tags": True, "strip_dates": True},
+#   {"cidr": "192.168.2.200/29", "drop": True},
+SOURCE_ROUTES = [
+]
+
+# Severity/facility filters, applied to the raw datagram before anything else is done with it (the
+# <PRI> is read without decoding). First matching rule wins. Keys: action ('drop', 'sample' or
+# 'forward' = exempt from later rules), severities (emerg alert crit err warning notice info debug or
+# 0-7), facilities (kern user ... local0-local7 or 0-23), sources (CIDR list), sample (fraction
+# forwarded) - see relay_filters.py. Example:
+#   {"action": "forward", "sources": ["192.168.2.108"]},
+#   {"action": "drop", "severities": ["debug"]},
+#   {"action": "sample", "severities": ["info"], "facilities": ["daemon"], "sample": 0.1},
+FILTER_RULES = [
+]
+
+# Storm suppression: token buckets per source IP and per (source IP, app name), checked before the
+# transforms. A source or app sending faster than its rate (after a burst allowance) is suppressed:
+# 'drop' discards the excess, 'sample' still forwards RATE_LIMIT_SAMPLE of it. A summary of what was
+# suppressed ("Suppressed N messages from X") is forwarded every RATE_LIMIT_SUMMARY_INTERVAL seconds.
+# None disables a level. Off by default: suppression is lossy, and normal Unraid/Frigate/Hubitat bursts
+# go over any rate low enough to matter; switch a level on (e.g. 500/s per source, 100/s per app) for
+# a known flood
+RATE_LIMIT_SOURCE_RATE = None  # Messages per second per source IP
+RATE_LIMIT_SOURCE_BURST = 5000
+RATE_LIMIT_APP_RATE = None  # Messages per second per app (Docker container, Hubitat app, ...)
+RATE_LIMIT_APP_BURST = 1000
+RATE_LIMIT_MODE = 'drop'
+RATE_LIMIT_SAMPLE = 0.1
+RATE_LIMIT_SUMMARY_INTERVAL = 60
+RATE_LIMIT_MAX_ENTRIES = 16384  # Buckets per level; idle (refilled) buckets are evicted
+
+# Duplicate coalescing: repeats of a message (same source, same text apart from the timestamp) within
+# DEDUP_WINDOW seconds of its first occurrence are not forwarded; when the window ends one copy is
+# forwarded with a " (repeated N times)" suffix. 0 disables
+DEDUP_WINDOW = 30
+DEDUP_MAX_ENTRIES = 10000  # Distinct messages tracked at once; beyond that messages pass untracked
+DEDUP_CHECK_INTERVAL = 1  # Seconds between window expiry checks
+
+# Per-message diagnostics, off by default: printing or logging every message makes console and disk
+# I/O the throughput ceiling. 'messages' logs the incoming/outgoing text of traced messages to the log
+# file; 'debug' adds the parsed header fields and a console line per traced message. Tracing can be
+# limited to DIAGNOSTICS_SOURCES (CIDR list, empty = all) and to a DIAGNOSTICS_SAMPLE fraction, and
+# switched on at runtime with a [diagnostics] section in syslog_relay.toml
+DIAGNOSTICS_LEVEL = 'off'
+DIAGNOSTICS_SOURCES = []
+DIAGNOSTICS_SAMPLE = 1.0
+
+# External configuration: syslog_relay.toml next to this script overrides the settings above (format
+# in relay_config.py). Device offsets and transform IP lists are reloaded within CONFIG_CHECK_INTERVAL
+# seconds of the file changing; port and forward host changes apply on the next relay restart
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'syslog_relay.toml')
+CONFIG_CHECK_INTERVAL = 5
+config_watcher = ConfigWatcher(CONFIG_FILE, RelayConfig(LISTEN_PORT, FORWARD_HOST, FORWARD_PORT, DEVICE_OFFSETS,
+                                                        DATE_STRIP_IPS, DOCKER_HOST_IPS,
+                                                        [parse_route(entry) for entry in SOURCE_ROUTES],
+                                                        [parse_destination(entry) for entry in FORWARD_DESTINATIONS],
+                                                        RateLimitSpec(RATE_LIMIT_SOURCE_RATE, RATE_LIMIT_SOURCE_BURST,
+                                                                      RATE_LIMIT_APP_RATE, RATE_LIMIT_APP_BURST,
+                                                                      RATE_LIMIT_MODE, RATE_LIMIT_SAMPLE),
+                                                        DEDUP_WINDOW, [parse_filter(entry) for entry in FILTER_RULES],
+                                                        parse_diagnostics({}, DiagnosticsSpec(DIAGNOSTICS_LEVEL,
+                                                                                              DIAGNOSTICS_SOURCES,
+                                                                                              DIAGNOSTICS_SAMPLE))))
+# The configuration the relay is running with; only replaced (never modified) on the relay loop thread
+active_config = config_watcher.config
+LISTEN_PORT = active_config.listen_port
+FORWARD_HOST = active_config.forward_host
+FORWARD_PORT = active_config.forward_port
+# Extra destinations the running relay was started with
+forward_destinations = active_config.destinations
+
+def build_pipeline(config):
+    """Routing table and transform stages for a compiled configuration"""
+    routes = host_routes(config.device_offsets, config.date_strip_ips, config.docker_host_ips)
+    return TransformPipeline(RouteTable(routes + list(config.routes)), FilterEngine(config.filters))
+
+transform_pipeline = build_pipeline(active_config)
+
+# Per-source dispatch: the first message from an IP decides its format family and stages
+SOURCE_PROFILE_CACHE_SIZE = 4096
+source_profiles = SourceProfileCache(transform_pipeline, SOURCE_PROFILE_CACHE_SIZE)
+
+# Token buckets for storm suppression (loop thread only)
+rate_limiter = RateLimiter(active_config.rate_limit, RATE_LIMIT_MAX_ENTRIES)
+
+# Recent messages per source, for collapsing repeats (loop thread only)
+deduplicator = Deduplicator(active_config.dedup_window, DEDUP_MAX_ENTRIES)
+
+# Per-message tracing switch (loop thread only; reconfigured on reload)
+diagnostics = Diagnostics(active_config.diagnostics)
+
+# Hot-path counters for this process's relay (each worker process has its own copy)
+relay_metrics = RelayMetrics()
+
 # Global variables for status
+relay = None  # AsyncRelay instance while the relay is running
+worker_supervisor = None  # WorkerSupervisor when RELAY_WORKERS > 1
 relay_running = False
-message_count = 0
-last_message_time = None
 
 # Log file configuration
 DESKTOP_LOG_DIR = os.path.join(os.path.expanduser("~"), "Desktop", "Syslog Relay")
 LOG_FILE = os.path.join(DESKTOP_LOG_DIR, 'syslog_relay.log')
+SPOOL_DIR = os.path.join(DESKTOP_LOG_DIR, 'spool')
 MAX_LOG_SIZE = 1 * 1024 * 1024  # 1 MB (reduced from 10 MB for easier log review)
 MAX_LOG_FILES = 5  # Keep 5 log files
 
+# Background log writer
+LOG_QUEUE_SIZE = 10000  # Records waiting to be written
+LOG_FLUSH_BYTES = 64 * 1024  # Flush once this much is pending...
+LOG_FLUSH_INTERVAL = 1.0  # ...or after this many seconds
+LOG_QUEUE_FULL_POLICY = 'drop'  # 'drop' (count and discard) or 'block' (wait up to 1s for room)
+
+# Message archive: every forwarded message as one line in gzip segments with a time/source index
+# (indexed by time and source IP; search it with relay_query.py)
+ARCHIVE_ENABLED = True
+ARCHIVE_DIR = os.path.join(DESKTOP_LOG_DIR, 'archive')
+ARCHIVE_SEGMENT_SIZE = 16 * 1024 * 1024  # Start a new segment after this many compressed bytes...
+ARCHIVE_SEGMENT_SECONDS = 3600  # ...or after this many seconds
+ARCHIVE_MAX_BYTES = 512 * 1024 * 1024  # Delete the oldest segments beyond this total (split evenly between RELAY_WORKERS)
+ARCHIVE_RETENTION_DAYS = 14  # Delete segments older than this
+ARCHIVE_QUEUE_SIZE = 50000  # Messages waiting to be compressed (further ones are dropped and counted)
+ARCHIVE_BLOCK_INTERVAL = 10.0  # Seconds before a partly filled block is written anyway
+
+# Prometheus metrics endpoint (http://127.0.0.1:9513/metrics); counters are as of the last metrics
+# sample (metrics_sample_interval), so scrapes never touch the relay loop
+METRICS_HTTP_ENABLED = False
+METRICS_HTTP_HOST = '127.0.0.1'  # Keep on localhost unless the port is firewalled
+METRICS_HTTP_PORT = 9513
+
 # System monitoring variables
 last_monitoring_time = time.time()
-total_messages_processed = 0
-last_minute_messages = 0
-last_minute_time = time.time()
 monitoring_interval = 60  # Check every 60 seconds
+metrics_sample_interval = 10  # Counter samples for the sliding-window rates
 start_time = time.time()
 
+# Counter samples taken off the hot path; messages/minute etc. are computed from these
+metrics_window = RateWindow(max_age=300)
+
+# Prometheus endpoint, fed by sample_metrics (None when METRICS_HTTP_ENABLED is off)
+metrics_exporter = MetricsExporter(METRICS_HTTP_HOST, METRICS_HTTP_PORT, VERSION) if METRICS_HTTP_ENABLED else None
+
 def create_tray_icon():
     """Create a simple icon for th
     e system tray"""
@@ -107,320 +329,404 @@ def create_tray_icon():
     draw.ellipse([10, 10, width-10, height-10], fill='green', outline='darkgreen', width=2)
     return image
 
-def rotate_log_file():
-    """Rotate log file if it exceeds MAX_LOG_SIZE"""
-    # Ensure the desktop log directory exists
-    os.makedirs(DESKTOP_LOG_DIR, exist_ok=True)
-    
-    if os.path.exists(LOG_FILE) and os.path.getsize(LOG_FILE) > MAX_LOG_SIZE:
-        # Rotate existing backup files
-        for i in range(MAX_LOG_FILES - 1, 0, -1):
-            old_file = f"{LOG_FILE}.{i}"
-            new_file = f"{LOG_FILE}.{i + 1}"
-            if os.path.exists(old_file):
-                if i == MAX_LOG_FILES - 1:
-                    os.remove(old_file)  # Remove oldest
-                else:
-                    os.rename(old_file, new_file)
-        
-        # Rotate current log file
-        os.rename(LOG_FILE, f"{LOG_FILE}.1")
-        print(f"Log file rotated: {LOG_FILE} -> {LOG_FILE}.1")
-
-def log_message_to_file(message_type, source_ip, message, transformed_message=None):
-    """Log all messages to the log file for debugging"""
-    # Ensure the desktop log directory exists
-    os.makedirs(DESKTOP_LOG_DIR, exist_ok=True)
-    rotate_log_file()
-    
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-    
-    with open(LOG_FILE, 'a', encoding='utf-8') as log_file:
-        log_file.write(f"\n=== {message_type.upper()} MESSAGE (v{VERSION}) - {timestamp} ===\n")
-        log_file.write(f"Source IP: {source_ip}\n")
-        log_file.write(f"Raw message: {message.strip()}\n")
-        if transformed_message:
-            log_file.write(f"Transformed message: {transformed_message.strip()}\n")
-        log_file.write(f"==========================================\n")
-
-
-
-def is_rfc5424_message(message):
-    """Check if message is RFC 5424 format that should be passed through without conversion"""
-    # RFC 5424 format: <priority>1 timestamp hostname app-name ...
-    rfc5424_pattern = r'<[0-9]+>1\s+\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}[+-]\d{2}:\d{2}'
-    return bool(re.search(rfc5424_pattern, message))
-
-def adjust_docker_hostname(message, source_ip):
-    """Transform Docker container hostnames for Unraid messages (container[ID]: -> container [ID]:)"""
-    # Only process Unraid messages
-    if source_ip != "192.168.2.110":
-        return message
-    
-    # Look for pattern: container[ID]: (Docker container format)
-    pattern = r'([a-zA-Z0-9_-]+)\[([0-9]+)\]:'
-    match = re.search(pattern, message)
-    
-    if match:
-        container_name = match.group(1)
-        container_id = match.group(2)
-        # Replace container[ID]: with container [ID]:
-        return re.sub(pattern, f'{container_name} [{container_id}]:', message)
-    
-    return message
+def format_log_record(record):
+    """Format a queued message record (runs on the log writer thread)"""
+    created, message_type, source_ip, message, transformed_message, parsed = record
+    # Passthrough records carry the raw datagram; decode here, off the relay thread
+    if isinstance(message, bytes):
+        message = message.decode('utf-8', errors='replace')
+    if isinstance(transformed_message, bytes):
+        transformed_message = transformed_message.decode('utf-8', errors='replace')
+    timestamp = datetime.fromtimestamp(created).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    text = (f"\n=== {message_type.upper()} MESSAGE (v{VERSION}) - {timestamp} ===\n"
+            f"Source IP: {source_ip}\n"
+            f"Raw message: {message.strip()}\n")
+    if parsed is not None:
+        text += f"Parsed: {parsed.describe()}\n"
+    if transformed_message:
+        text += f"Transformed message: {transformed_message.strip()}\n"
+    return text + "==========================================\n"
 
-def strip_docker_dates(message, source_ip):
-    """Strip superfluous date information from Docker container messages (Unraid only)"""
-    # Only process messages from configured IPs (Unraid only)
-    if source_ip not in DATE_STRIP_IPS:
-        return message
-    
-    try:
-        # Process Docker container dates (Unraid only)
-        if source_ip == "192.168.2.110":
-            # Look for Docker container pattern to identify these messages
-            container_pattern = r'([a-zA-Z0-9_-]+)\s*\[([0-9]+)\]:'
-            if re.search(container_pattern, message):
-                # Pattern 1: Frigate ISO format with microseconds (2025-08-24 08:54:23.339023614)
-                # Use more specific pattern to avoid catastrophic backtracking
-                message = re.sub(r'\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}\.\d+', '', message)
-                
-                # Pattern 1b: Remove bracketed timestamps that might follow ([2025-08-24 08:54:23])
-                message = re.sub(r'\s*\[\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}\]\s*', ' ', message)
-                
-                # Pattern 2: ImmichFrame short date format (25-08-24 08:54:24)
-                message = re.sub(r'\d{2}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}\s+', '', message)
-        
-        # Clean up any double spaces that might result
-        message = re.sub(r'\s+', ' ', message)
-        
-        return message
-    except Exception as e:
-        # If regex processing fails, return original message
-        print(f"Warning: Date stripping failed for message: {e}")
+# Background log writer: the relay thread only queues records, it never touches the disk
+log_writer = LogWriter(LOG_FILE, MAX_LOG_SIZE, MAX_LOG_FILES, formatter=format_log_record,
+                       queue_size=LOG_QUEUE_SIZE, flush_bytes=LOG_FLUSH_BYTES,
+                       flush_interval=LOG_FLUSH_INTERVAL, full_policy=LOG_QUEUE_FULL_POLICY)
+
+# Message archive writer: the relay thread only queues (time, source, payload)
+archive_writer = ArchiveWriter(ARCHIVE_DIR, segment_size=ARCHIVE_SEGMENT_SIZE,
+                               segment_seconds=ARCHIVE_SEGMENT_SECONDS, max_bytes=ARCHIVE_MAX_BYTES,
+                               retention_days=ARCHIVE_RETENTION_DAYS, queue_size=ARCHIVE_QUEUE_SIZE,
+                               block_interval=ARCHIVE_BLOCK_INTERVAL)
+archive_message = archive_writer.write if ARCHIVE_ENABLED else None
+
+def write_log(text):
+    """Queue preformatted text for the log file"""
+    log_writer.write(text)
+
+def log_message_to_file(message_type, source_ip, message, transformed_message=None, parsed=None):
+    """Queue one message record for the log file (parsed: SyslogMessage whose fields are logged too)"""
+    # Formatting is deferred to the log writer thread
+    log_writer.write((time.time(), message_type, source_ip, message, transformed_message, parsed))
+
+def trace_message(source_ip, record, output):
+    """Diagnostics for one message selected by the diagnostics switch (never called when it is off)"""
+    relay_metrics.traced += 1
+    debug = diagnostics.level >= DEBUG
+    log_message_to_file("incoming", source_ip, record.data, parsed=record if debug else None)
+    log_message_to_file("outgoing", source_ip, record.data, output)
+    if debug:
+        print(f"Trace {source_ip}: {record.describe()} -> {FORWARD_HOST}:{FORWARD_PORT}")
+
+def process_message(message, source_ip, stages, record=None):
+    """Classify and transform one decoded message, returning the text to forward"""
+    # RFC 5424 messages (header found past the start) pass through without conversion
+    if is_rfc5424_message(message):
         return message
+    # Process RFC 3164 messages (Unraid only): timestamp offset, Docker hostname, date stripping
+    transform_start = time.perf_counter()
+    final_message = transform_pipeline.run(message, stages, record)
+    relay_metrics.record_transform(time.perf_counter() - transform_start)
+    return final_message
 
-def adjust_timestamp(message, source_ip):
-    """Adjust timestamp in syslog message based on source IP (Unraid only)"""
-    global message_count, last_message_time
+def handle_datagram(data, addr):
+    """Relay handler: log and transform one datagram, returning the bytes to forward"""
+    source_ip = addr[0]
+    # Header parsed once; every stage below reads its fields from this record
+    record = SyslogMessage(data)
+    profile = source_profiles.lookup(source_ip)
+    # Format of this message: one source can send both (Unraid host RFC 3164, containers RFC 5424)
+    relay_metrics.record_source(source_ip, record.family)
     
-    # Check if IP is in DEVICE_OFFSETS (Unraid only)
-    if source_ip in DEVICE_OFFSETS:
-        offset_hours = DEVICE_OFFSETS[source_ip]
-        print(f"Using IP-based offset for {source_ip}: {offset_hours} hours")
-    else:
-        # IP not found in DEVICE_OFFSETS, return original message unchanged
-        print(f"No offset configured for {source_ip}, no processing needed")
-        return message
+    # Route rules that drop or sample this source
+    if profile.gated and not profile.admit():
+        relay_metrics.filtered += 1
+        return None
     
-    # Try ISO 8601 format first: <priority>1 YYYY-MM-DDTHH:MM:SS.mmm±HH:MM
-    iso_pattern = r'(<[0-9]+>1\s+)(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}[+-]\d{2}:\d{2})'
-    iso_match = re.search(iso_pattern, message)
+    # Severity/facility rules: a table lookup on the parsed PRI, before any decoding
+    pri_actions = profile.pri_actions
+    if pri_actions is not None:
+        rule = pri_actions[record.pri]
+        if rule is not None and not rule.admit():
+            relay_metrics.pri_filtered += 1
+            return None
     
-    if iso_match:
-        priority_part = iso_match.group(1)
-        timestamp = iso_match.group(2)
-        
-        try:
-            # Parse ISO timestamp
-            dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-            
-            # Add the offset
-            adjusted_dt = dt + timedelta(hours=offset_hours)
-            
-            # Format to traditional syslog format (Month Day HH:MM:SS)
-            adjusted_timestamp = adjusted_dt.strftime("%b %d %H:%M:%S")
-            
-            # Convert entire RFC 5424 format to RFC 3164 format
-            # Extract components from the message
-            # Format: <priority>1 timestamp hostname app-name process-id message-id structured-data message
-            parts = message.split(' ', 7)  # Split into 8 parts
-            if len(parts) >= 8:
-                priority = parts[0]  # <14>1
-                # Remove the "1" from priority
-                priority = priority.replace('1', '')
-                hostname = parts[2]  # HubitatC8Pro (actual hostname)
-                app_name = parts[3]  # Watchdog.-.Motion.Sensors.-.Virtual.Switch (app name)
-                message_content = parts[7]  # The actual message
-                
-                # Debug: Print the parsed components
-                print(f"DEBUG - Parsed components:")
-                print(f"  Priority: {priority}")
-                print(f"  Hostname: {hostname}")
-                print(f"  App name: {app_name}")
-                print(f"  Message content: {message_content}")
-                
-                # Rotate log file if needed
-                rotate_log_file()
-                
-                # Write debug info to log file
-                with open(LOG_FILE, 'a', encoding='utf-8') as log_file:
-                    log_file.write(f"\n=== RFC 5424 PARSING DEBUG (v{VERSION}) ===\n")
-                    log_file.write(f"Raw message: {message.strip()}\n")
-                    log_file.write(f"Split into {len(parts)} parts:\n")
-                    for i, part in enumerate(parts):
-                        log_file.write(f"  parts[{i}]: '{part}'\n")
-                    log_file.write(f"Assigned fields:\n")
-                    log_file.write(f"  Priority: '{priority}' (from parts[0])\n")
-                    log_file.write(f"  Hostname: '{hostname}' (from parts[2])\n")
-                    log_file.write(f"  App name: '{app_name}' (from parts[3])\n")
-                    log_file.write(f"  Message content: '{message_content}' (from parts[7])\n")
-                    log_file.write(f"==========================================\n")
-                
-                # Check if this is a Docker message by looking for container ID pattern in hostname
-                # Docker container IDs are 12-character hex strings like "5183c0a146c0"
-                docker_tag = None
-                if re.match(r'^[a-f0-9]{12}$', hostname):
-                    # This is likely a Docker container ID
-                    # Map container IDs to friendly names
-                    docker_container_mapping = {
-                        '5183c0a146c0': 'immichFrame-All',  # Add more mappings as needed
-                    }
-                    if hostname in docker_container_mapping:
-                        docker_tag = docker_container_mapping[hostname]
-                        print(f"Detected Docker container {hostname}, using tag: {docker_tag}")
-                    else:
-                        print(f"Detected Docker container {hostname}, but no mapping found")
-                
-                # Clean up app_name by removing HTML tags
-                app_name_clean = re.sub(r'<[^>]+>', '', app_name)
-                
-                # Further clean app_name to remove special characters that might confuse ktranslate
-                app_name_clean = re.sub(r'[^\w\-\.]', '_', app_name_clean)
-                
-                # Use Docker tag as hostname if available, otherwise use original hostname
-                final_hostname = docker_tag if docker_tag else hostname
-                
-                # Create RFC 3164 format: <priority>timestamp hostname app-name: app-name (process-id) - message
-                # Use a format that ktranslate can properly parse
-                # For Docker messages, use the tag as hostname for cleaner identification
-                # For other devices, keep the original hostname (HubitatC8Pro, HubitatC7, etc.)
-                adjusted_message = f"{priority}{adjusted_timestamp} {final_hostname} {app_name_clean}: {app_name_clean} ({parts[4]}) - {message_content}"
-            else:
-                # Fallback to simple timestamp replacement if parsing fails
-                adjusted_message = re.sub(iso_pattern, f"{priority_part}{adjusted_timestamp}", message)
-            
-            # Update counters
-            message_count += 1
-            last_message_time = datetime.now()
-            
-            print(f"Converted RFC 5424 to RFC 3164 from {source_ip} (+{offset_hours}h): {timestamp} -> {adjusted_timestamp}")
-            return adjusted_message
-            
-        except Exception as e:
-            print(f"Error adjusting ISO timestamp: {e}")
-            return message
+    # Storm suppression, before any decoding or transform work
+    if rate_limiter.enabled and not rate_limiter.admit(source_ip, record):
+        relay_metrics.rate_limited += 1
+        return None
     
-    # Try traditional syslog format: <priority>Month Day HH:MM:SS
-    traditional_pattern = r'(<[0-9]+>)([A-Za-z]{3}\s+\d{1,2}\s+\d{2}:\d{2}:\d{2})'
-    traditional_match = re.search(traditional_pattern, message)
+    # Repeats of a recent message are only counted; the first copy's entry records what was forwarded
+    dedup_entry = None
+    if deduplicator.enabled:
+        dedup_entry = deduplicator.check(source_ip, record)
+        if dedup_entry is None:
+            relay_metrics.deduplicated += 1
+            return None
     
-    if traditional_match:
-        priority = traditional_match.group(1)
-        timestamp = traditional_match.group(2)
-        
-        try:
-            # Parse the timestamp (assuming current year)
-            current_year = datetime.now().year
-            timestamp_str = f"{current_year} {timestamp}"
-            dt = datetime.strptime(timestamp_str, "%Y %b %d %H:%M:%S")
-            
-            # Add the offset
-            adjusted_dt = dt + timedelta(hours=offset_hours)
-            
-            # Format back to syslog format
-            adjusted_timestamp = adjusted_dt.strftime("%b %d %H:%M:%S")
-            
-            # Replace in message
-            adjusted_message = re.sub(traditional_pattern, f"{priority}{adjusted_timestamp}", message)
-            
-            # Update counters
-            message_count += 1
-            last_message_time = datetime.now()
-            
-            print(f"Adjusted traditional timestamp from {source_ip} (+{offset_hours}h): {timestamp} -> {adjusted_timestamp}")
-            return adjusted_message
-            
-        except Exception as e:
-            print(f"Error adjusting traditional timestamp: {e}")
-            return message
+    # Per-message diagnostics: one attribute read unless switched on (DIAGNOSTICS_* / [diagnostics])
+    trace = diagnostics.active and diagnostics.traces(source_ip)
     
-    return message
-
-def relay_worker():
-    """Main relay function"""
-    global relay_running
+    # Fast path: sources with no transforms and RFC 5424 traffic are forwarded untouched (no decode/encode)
+    if not profile.stages or record.family == FAMILY_RFC5424:
+        if trace:
+            trace_message(source_ip, record, data)
+        if dedup_entry is not None:
+            dedup_entry.payload = data
+        if archive_message is not None:
+            archive_message(source_ip, data)
+        return data
     
-    # Create UDP socket
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.bind(('0.0.0.0', LISTEN_PORT))
+    final_message = process_message(record.text, source_ip, profile.stages, record)
+    if trace:
+        trace_message(source_ip, record, final_message)
     
-    # Create forwarding socket
-    forward_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    payload = final_message.encode('utf-8')
+    if dedup_entry is not None:
+        dedup_entry.payload = payload
+    if archive_message is not None:
+        archive_message(source_ip, payload)
+    return payload
+
+def create_worker_handler(index):
+    """Worker process setup: per-worker log file and archive segments; returns (handler, metrics, cleanup, setup)"""
+    log_writer.path = os.path.join(DESKTOP_LOG_DIR, f'syslog_relay.worker{index}.log')
+    log_writer.start()
+    archive_writer.prefix = f'archive.worker{index}'
+    # Each writer only caps its own segments, so the workers share the archive cap
+    archive_writer.max_bytes = ARCHIVE_MAX_BYTES // RELAY_WORKERS
+    if ARCHIVE_ENABLED:
+        archive_writer.start()
+    def cleanup():
+        archive_writer.stop()
+        log_writer.stop()
+    return handle_datagram, relay_metrics, cleanup, schedule_relay_tasks
+
+def schedule_relay_tasks(target_relay):
+    """Loop-side periodic jobs every relay process runs (config reload, suppression and repeat summaries)"""
+    watch_config(target_relay)
+    target_relay.add_periodic(RATE_LIMIT_SUMMARY_INTERVAL, functools.partial(report_suppressed, target_relay))
+    target_relay.add_periodic(DEDUP_CHECK_INTERVAL, functools.partial(expire_repeats, target_relay))
+
+def expire_repeats(target_relay):
+    """Periodic task (executor thread): have the relay loop close expired dedup windows"""
+    if len(deduplicator):
+        target_relay.call_soon(forward_repeats, target_relay)
+
+def forward_repeats(target_relay, flush=False):
+    """Forward the "repeated N times" lines for expired windows, or all of them (relay loop thread)"""
+    for line in deduplicator.expire(flush):
+        target_relay.forward(line)
+
+def report_suppressed(target_relay):
+    """Periodic task (executor thread): have the relay loop forward the suppression summary"""
+    if len(rate_limiter):
+        target_relay.call_soon(forward_suppression_summary, target_relay)
+
+def forward_suppression_summary(target_relay):
+    """Forward one message per suppressed source/app since the last summary (relay loop thread)"""
+    timestamp = datetime.utcnow().strftime("%b %d %H:%M:%S")
+    for source_ip, app, count in rate_limiter.summaries():
+        if source_ip is None:
+            origin = "other sources (bucket table full)"
+        else:
+            origin = f"{source_ip} ({app})" if app else source_ip
+        text = f"Suppressed {count} messages from {origin} in the last {RATE_LIMIT_SUMMARY_INTERVAL}s"
+        print(text)
+        target_relay.forward(f"<132>{timestamp} syslog-relay rate-limit: {text}".encode('utf-8'))
+
+def watch_config(target_relay):
+    """Reload the config file on target_relay's loop when it changes (every relay process watches it)"""
+    target_relay.add_periodic(CONFIG_CHECK_INTERVAL, functools.partial(check_config, target_relay))
+
+def check_config(target_relay):
+    """Periodic task (executor thread): compile a changed config file and hand it to the relay loop"""
+    config = config_watcher.poll()
+    if config is None:
+        return
+    # Build the pipeline here so the loop thread only swaps references
+    target_relay.call_soon(apply_config, config, build_pipeline(config))
+
+def apply_config(config, pipeline):
+    """Swap in a new configuration; runs on the relay loop thread, between datagrams"""
+    global active_config, transform_pipeline
+    transform_pipeline = pipeline
+    source_profiles.invalidate(pipeline)
+    rate_limiter.configure(config.rate_limit)
+    deduplicator.configure(config.dedup_window)
+    diagnostics.configure(config.diagnostics)
+    active_config = config
+    print(f"Configuration reloaded from {config.source}: device offsets {dict(config.device_offsets)}, "
+          f"date strip {sorted(config.date_strip_ips)}, docker hosts {sorted(config.docker_host_ips)}, "
+          f"{len(config.routes)} routes, {len(config.filters)} filters, diagnostics {diagnostics.describe()}")
+    running = {'listen_port': LISTEN_PORT, 'forward_host': FORWARD_HOST, 'forward_port': FORWARD_PORT,
+               'destinations': forward_destinations}
+    pending = [name for name in RESTART_SETTINGS if getattr(config, name) != running[name]]
+    if pending:
+        print(f"Configuration change to {', '.join(pending)} takes effect when the relay is restarted")
+
+def start_relay():
+    """Start the asyncio relay core in a background thread"""
+    global relay, relay_running, worker_supervisor, LISTEN_PORT, FORWARD_HOST, FORWARD_PORT, forward_destinations
     
-    print(f"Syslog relay v{VERSION} started. Listening on port {LISTEN_PORT}, forwarding to {FORWARD_HOST}:{FORWARD_PORT}")
-    print(f"Device offsets: {DEVICE_OFFSETS}")
+    # Port, forward host and destination changes from the config file apply here (restart)
+    LISTEN_PORT = active_config.listen_port
+    FORWARD_HOST = active_config.forward_host
+    FORWARD_PORT = active_config.forward_port
+    forward_destinations = active_config.destinations
     
-    relay_running = True
+    use_workers = RELAY_WORKERS > 1 and reuseport_supported()
+    if RELAY_WORKERS > 1 and not use_workers:
+        print(f"RELAY_WORKERS={RELAY_WORKERS} needs SO_REUSEPORT (Linux); running a single relay")
+    
+    relay_options = dict(batch_size=RELAY_BATCH_SIZE, max_datagram_size=MAX_DATAGRAM_SIZE,
+                         rcvbuf=LISTEN_RCVBUF, sndbuf=FORWARD_SNDBUF,
+                         tcp_listen_addr=('0.0.0.0', TCP_LISTEN_PORT) if TCP_LISTEN_PORT else None,
+                         max_message_size=TCP_MAX_MESSAGE_SIZE, tcp_max_connections=TCP_MAX_CONNECTIONS,
+                         tcp_idle_timeout=TCP_IDLE_TIMEOUT, forward_protocol=FORWARD_PROTOCOL,
+                         forward_queue_size=FORWARD_QUEUE_SIZE, forward_batch_bytes=FORWARD_BATCH_BYTES,
+                         forward_backoff_max=FORWARD_RECONNECT_MAX,
+                         spool_dir=SPOOL_DIR if SPOOL_ENABLED else None, spool_segment_size=SPOOL_SEGMENT_SIZE,
+                         spool_max_segments=SPOOL_MAX_SEGMENTS, spool_catchup_rate=SPOOL_CATCHUP_RATE,
+                         destinations=forward_destinations)
+    if use_workers:
+        # Workers own the listen port; this process only runs monitoring
+        relay = AsyncRelay(None, None, None)
+    else:
+        relay = AsyncRelay(('0.0.0.0', LISTEN_PORT), (FORWARD_HOST, FORWARD_PORT), handle_datagram,
+                           metrics=relay_metrics, **relay_options)
+    # Monitoring and counter sampling run as event-loop tasks instead of sleep loops
+    relay.add_periodic(monitoring_interval, monitoring_worker, run_immediately=True)
+    relay.add_periodic(metrics_sample_interval, sample_metrics, run_immediately=True)
+    schedule_relay_tasks(relay)
     
     try:
-        while relay_running:
-            # Receive message with timeout
-            sock.settimeout(1.0)
-            try:
-                data, addr = sock.recvfrom(1024)
-                message = data.decode('utf-8', errors='ignore')
-                source_ip = addr[0]
-                
-                print(f"=== INCOMING MESSAGE (v{VERSION}) ===")
-                print(f"Source IP: {source_ip}")
-                print(f"Raw message: {message.strip()}")
-                
-                # Log incoming message
-                log_message_to_file("incoming", source_ip, message)
-                
-                # Check if this is an RFC 5424 message that should be passed through without conversion
-                if is_rfc5424_message(message):
-                    # Pass through all RFC 5424 messages without conversion
-                    final_message = message
-                    print(f"=== RFC 5424 PASSTHROUGH (v{VERSION}) ===")
-                    print(f"Original message: {message.strip()}")
-                    print(f"Destination: {FORWARD_HOST}:{FORWARD_PORT}")
-                    print(f"========================")
-                else:
-                    # Process RFC 3164 messages (Unraid only)
-                    # Adjust timestamp if needed
-                    adjusted_message = adjust_timestamp(message, source_ip)
-                    
-                    # Transform Docker hostname if needed
-                    transformed_message = adjust_docker_hostname(adjusted_message, source_ip)
-                    
-                    # Strip Docker dates if needed
-                    final_message = strip_docker_dates(transformed_message, source_ip)
-                
-                print(f"=== OUTGOING MESSAGE (v{VERSION}) ===")
-                print(f"Transformed message: {final_message}")
-                print(f"Destination: {FORWARD_HOST}:{FORWARD_PORT}")
-                print(f"========================")
-                
-                # Forward to ktranslate
-                forward_sock.sendto(final_message.encode('utf-8'), (FORWARD_HOST, FORWARD_PORT))
-                
-                # Log outgoing message
-                log_message_to_file("outgoing", source_ip, message, final_message)
-                
-            except socket.timeout:
-                # No message received, continue
-                continue
-            except Exception as e:
-                print(f"Error processing message: {e}")
-                
+        if use_workers:
+            worker_supervisor = WorkerSupervisor(RELAY_WORKERS, create_worker_handler,
+                                                 ('0.0.0.0', LISTEN_PORT), (FORWARD_HOST, FORWARD_PORT),
+                                                 **relay_options)
+            worker_supervisor.start()
+        relay.start()
     except Exception as e:
-        print(f"Relay error: {e}")
-    finally:
-        sock.close()
-        forward_sock.close()
-        relay_running = False
+        print(f"Failed to start relay: {e}")
+        stop_relay()
+        return False
+    
+    relay_running = True
+    print(f"Syslog relay v{VERSION} started. Listening on port {LISTEN_PORT}, forwarding to {FORWARD_HOST}:{FORWARD_PORT} ({FORWARD_PROTOCOL.upper()})")
+    if SPOOL_ENABLED:
+        print(f"Spooling to {SPOOL_DIR} (up to {SPOOL_MAX_SEGMENTS} x {SPOOL_SEGMENT_SIZE // (1024 * 1024)} MB, replay at {SPOOL_CATCHUP_RATE}/s)")
+    for spec in forward_destinations:
+        rules = [f"sources={','.join(map(str, spec.sources))}" if spec.sources else 'all sources']
+        if spec.max_severity is not None:
+            rules.append(f"severity<={spec.max_severity}")
+        if spec.facilities is not None:
+            rules.append(f"facilities={','.join(FACILITY_NAMES[f] for f in sorted(spec.facilities))}")
+        if spec.exclusive:
+            rules.append('exclusive')
+        print(f"Destination {spec.name}: {spec.host}:{spec.port} ({spec.protocol.upper()}), {', '.join(rules)}")
+    if TCP_LISTEN_PORT:
+        print(f"TCP listener on port {TCP_LISTEN_PORT} (RFC 6587 octet counting or LF framing)")
+    if use_workers:
+        print(f"Relay engine: {RELAY_WORKERS} worker processes (SO_REUSEPORT), batch size {RELAY_BATCH_SIZE}")
+    else:
+        print(f"Relay engine: {relay.ingest_mode}, batch size {RELAY_BATCH_SIZE}")
+    print(f"Configuration: {active_config.source or 'built-in defaults'}")
+    print(f"Device offsets: {dict(active_config.device_offsets)}")
+    for network, rules in transform_pipeline.routes.routes.items():
+        print(f"Route {network}: {rules.describe()}")
+    for rule in transform_pipeline.filters.rules:
+        print(f"Filter: {rule.describe()}")
+    print(f"Diagnostics: {diagnostics.describe()}")
+    if ARCHIVE_ENABLED:
+        print(f"Archive: {ARCHIVE_DIR} ({ARCHIVE_RETENTION_DAYS} days, {ARCHIVE_MAX_BYTES // (1024 * 1024)} MB max)")
+    for name, (requested, actual) in clamped_buffers(socket_buffer_sizes()).items():
+        print(f"Warning: {name} requested {requested} bytes but the kernel granted {actual} (Linux reports double the usable size)")
+    return True
+
+def stop_relay():
+    """Stop the relay core; returns as soon as the event loop has shut down"""
+    global relay, relay_running, worker_supervisor
+    
+    relay_running = False
+    if worker_supervisor is not None:
+        worker_supervisor.stop()
+        worker_supervisor = None
+    if relay is not None:
+        # Repeat counts still in a window go out (or into the spool) ahead of the shutdown
+        relay.call_soon(forward_repeats, relay, True)
+        relay.stop()
+        relay = None
+
+def metrics_snapshot():
+    """Relay metrics for this process plus any worker processes"""
+    snapshots = [relay_metrics.snapshot()]
+    supervisor = worker_supervisor
+    if supervisor is not None:
+        snapshots.append(supervisor.totals())
+    return merge_snapshots(snapshots)
+
+def sample_metrics(snapshot=None):
+    """Record a counter sample for the sliding-window rates (periodic task and get_system_stats, executor threads)"""
+    if snapshot is None:
+        snapshot = metrics_snapshot()
+    sample = {name: snapshot[name] for name in ('received', 'forwarded', 'dropped')}
+    # Kernel drop counters (Linux only) so the stats line can show whether drops are happening now
+    kernel = udp_snmp_counters()
+    if kernel is not None:
+        sample.update(kernel)
+    socket_stats = udp_socket_stats(LISTEN_PORT)
+    if socket_stats is not None:
+        sample['socket_drops'] = socket_stats['drops']
+    metrics_window.record(sample)
+    if metrics_exporter is not None:
+        metrics_exporter.publish(snapshot, metrics_gauges())
+    return snapshot
+
+def metrics_gauges():
+    """Queue depths and table sizes for the metrics endpoint (executor thread, with the counter sample)"""
+    current_relay = relay
+    forwarder = current_relay.forwarder if current_relay is not None else None
+    spool = current_relay.spool if current_relay is not None else None
+    destinations = current_relay.destinations if current_relay is not None else ()
+    supervisor = worker_supervisor
+    gauges = {
+        'forward_queue_depth': ("Messages waiting for the TCP forwarder",
+                                forwarder.depth if forwarder is not None else 0, None),
+        'destination_queue_depth': ("Messages waiting for an extra destination",
+                                    {d.name: d.depth for d in destinations}, 'destination'),
+        'log_queue_depth': ("Records waiting for the log writer", log_writer.depth, None),
+        'archive_queue_depth': ("Messages waiting for the archive writer", archive_writer.depth, None),
+        'rate_limit_buckets': ("Token buckets tracked by the rate limiter", len(rate_limiter), None),
+        'dedup_entries': ("Recent messages tracked for duplicate coalescing", len(deduplicator), None),
+        'source_profiles': ("Source IPs with a cached transform profile", len(source_profiles), None),
+        'workers': ("Worker processes alive", supervisor.alive() if supervisor is not None else 0, None),
+        'up': ("1 while the relay is running", int(relay_running), None),
+    }
+    if spool is not None:
+        gauges['spool_pending'] = ("Messages in the disk spool not yet delivered", spool.pending, None)
+    return gauges
+
+def socket_buffer_sizes():
+    """{option: (requested, actual)} for the relay sockets"""
+    current_relay = relay
+    if current_relay is not None and current_relay.socket_buffers:
+        sizes = dict(current_relay.socket_buffers.get('listen', {}))
+        sizes.update(current_relay.socket_buffers.get('forward', {}))
+        return sizes
+    # Worker mode: the sockets live in the workers; the kernel limits are the same here
+    return probe_socket_buffers(LISTEN_RCVBUF, FORWARD_SNDBUF)
+
+def format_buffer_sizes(sizes):
+    """SO_RCVBUF=requested/actual pairs; 'default' when no size is configured"""
+    return ','.join(f"{name}={requested}/{actual}" for name, (requested, actual) in sizes.items()) or 'default'
+
+def format_forward_stats(stats):
+    """Forwarding mode and, for TCP, connection/queue state for the stats line"""
+    if stats.get('forward_protocol') != 'tcp':
+        return 'udp'
+    state = {True: 'connected', False: 'disconnected'}.get(stats.get('forward_connected'), 'workers')
+    return (f"tcp {state} queue={stats.get('forward_queue_depth', 0)} "
+            f"overflow={stats.get('forward_overflow', 0)} connects={stats.get('forward_connects', 0)}")
+
+def format_spool_stats(stats):
+    """Disk spool backlog and counters for the stats line"""
+    if not SPOOL_ENABLED:
+        return 'off'
+    pending = stats.get('spool_pending')
+    return (f"pending={pending if pending is not None else 'workers'} "
+            f"spooled={stats.get('messages_spooled', 0)} dropped={stats.get('spool_dropped', 0)}")
+
+def format_destination_stats(stats):
+    """Per-destination delivered/dropped counts, queueing latency and queue state for the stats line"""
+    parts = []
+    for name, counts in stats.get('destinations', {}).items():
+        state = stats.get('destination_state', {}).get(name)
+        latency_count = counts['latency_count']
+        average_ms = counts['latency_sum_us'] / latency_count / 1000 if latency_count else 0
+        text = (f"{name}={counts['forwarded']}/{counts['dropped']} dropped "
+                f"lat={average_ms:.1f}/{counts['latency_max_us'] / 1000:.1f}ms")
+        if state is not None:
+            depth, connected = state
+            text += f" queue={depth}{'' if connected else ' disconnected'}"
+        parts.append(text)
+    return ', '.join(parts) or 'none'
+
+def format_kernel_stats(stats):
+    """Kernel UDP drop counters for the stats line ('n/a' where /proc is unavailable)"""
+    if stats.get('udp_in_errors') is None:
+        return 'n/a'
+    socket_drops = stats.get('udp_socket_drops')
+    return (f"socket_drops={socket_drops if socket_drops is not None else 'n/a'}"
+            f"({stats.get('udp_socket_drops_per_minute', 0)}/min) "
+            f"rxq={stats.get('udp_rx_queue_bytes', 0)}B "
+            f"InErrors={stats['udp_in_errors']}({stats.get('udp_in_errors_per_minute', 0)}/min) "
+            f"RcvbufErrors={stats.get('udp_rcvbuf_errors')}({stats.get('udp_rcvbuf_errors_per_minute', 0)}/min) "
+            f"SndbufErrors={stats.get('udp_sndbuf_errors')}")
+
+def format_counts(counts, limit=5):
+    """name=count pairs, largest first"""
+    top = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return ','.join(f"{name}={count}" for name, count in top) or 'none'
 
 def get_system_stats():
     """Collect comprehensive system statistics"""
@@ -448,17 +754,17 @@ def get_system_stats():
         except NameError:
             uptime = 0
         
-        # Calculate message rates - handle case where global variables might not be initialized
-        try:
-            current_time = time.time()
-            if current_time - last_minute_time >= 60:
-                messages_per_minute = last_minute_messages
-                last_minute_messages = 0
-                last_minute_time = current_time
-            else:
-                messages_per_minute = last_minute_messages
-        except NameError:
-            messages_per_minute = 0
+        # Relay counters (summed across worker processes); rates come from the sliding window
+        metrics = sample_metrics()
+        
+        # TCP forwarder state (in-process relay only; workers report their counters through metrics)
+        forwarder = relay.forwarder if relay is not None else None
+        spool = relay.spool if relay is not None else None
+        destinations = relay.destinations if relay is not None else ()
+        
+        # Kernel-level UDP drops (Linux /proc; None elsewhere)
+        kernel_udp = udp_snmp_counters() or {}
+        listen_socket = udp_socket_stats(LISTEN_PORT) or {}
         
         # Get active threads
         active_threads = threading.active_count()
@@ -466,12 +772,6 @@ def get_system_stats():
         # Get garbage collection stats
         gc_stats = gc.get_stats()
         
-        # Handle case where global variables might not be initialized
-        try:
-            total_messages = total_messages_processed
-        except NameError:
-            total_messages = 0
-        
         try:
             relay_status = relay_running
         except NameError:
@@ -495,8 +795,64 @@ def get_system_stats():
             'disk_percent': round((disk.used / disk.total) * 100, 2),
             'network_bytes_sent_mb': round(network.bytes_sent / (1024**2), 2),
             'network_bytes_recv_mb': round(network.bytes_recv / (1024**2), 2),
-            'total_messages': total_messages,
-            'messages_per_minute': messages_per_minute,
+            'total_messages': metrics['received'],
+            'messages_per_minute': round(metrics_window.rate('received', 60)),
+            'messages_per_minute_5m': round(metrics_window.rate('received', 300)),
+            'messages_forwarded': metrics['forwarded'],
+            'forwarded_per_minute': round(metrics_window.rate('forwarded', 60)),
+            'messages_dropped': metrics['dropped'],
+            'dropped_per_minute': round(metrics_window.rate('dropped', 60)),
+            'bytes_received_kb': round(metrics['bytes_in'] / 1024, 1),
+            'bytes_forwarded_kb': round(metrics['bytes_out'] / 1024, 1),
+            'messages_by_format': metrics['per_format'],
+            'messages_by_source': metrics['per_source'],
+            'messages_transformed': metrics['transformed'],
+            'transform_p50_us': latency_percentile(metrics, 50),
+            'transform_p99_us': latency_percentile(metrics, 99),
+            'udp_socket_drops': listen_socket.get('drops'),
+            'udp_socket_drops_per_minute': round(metrics_window.rate('socket_drops', 60)),
+            'udp_rx_queue_bytes': listen_socket.get('rx_queue'),
+            'udp_in_errors': kernel_udp.get('InErrors'),
+            'udp_in_errors_per_minute': round(metrics_window.rate('InErrors', 60)),
+            'udp_rcvbuf_errors': kernel_udp.get('RcvbufErrors'),
+            'udp_rcvbuf_errors_per_minute': round(metrics_window.rate('RcvbufErrors', 60)),
+            'udp_sndbuf_errors': kernel_udp.get('SndbufErrors'),
+            'tcp_connections': len(relay.tcp_connections) if relay is not None else 0,
+            'tcp_accepted': metrics['tcp_accepted'],
+            'frames_truncated': metrics['frames_truncated'],
+            'forward_protocol': FORWARD_PROTOCOL,
+            'forward_connected': forwarder.connected if forwarder is not None else None,
+            'forward_queue_depth': forwarder.depth if forwarder is not None else 0,
+            'forward_overflow': metrics['forward_overflow'],
+            'forward_connects': metrics['forward_connects'],
+            'spool_pending': spool.pending if spool is not None else None,
+            'messages_spooled': metrics['spooled'],
+            'spool_dropped': metrics['spool_dropped'],
+            'destinations': metrics['destinations'],
+            'destination_state': {d.name: (d.depth, d.connected) for d in destinations},
+            'messages_claimed': metrics['claimed'],
+            'source_profiles': len(source_profiles),
+            'routes': len(transform_pipeline.routes),
+            'messages_filtered': metrics['filtered'],
+            'messages_rate_limited': metrics['rate_limited'],
+            'rate_limit_buckets': len(rate_limiter),
+            'filters': len(transform_pipeline.filters),
+            'messages_pri_filtered': metrics['pri_filtered'],
+            'messages_deduplicated': metrics['deduplicated'],
+            'dedup_entries': len(deduplicator),
+            'messages_traced': metrics['traced'],
+            'diagnostics': active_config.diagnostics.level,
+            'config_source': 'file' if active_config.source else 'defaults',
+            'config_reloads': config_watcher.reloads,
+            'config_errors': config_watcher.errors,
+            'workers': worker_supervisor.alive() if worker_supervisor is not None else 0,
+            'worker_restarts': worker_supervisor.restarts if worker_supervisor is not None else 0,
+            'log_queue_depth': log_writer.depth,
+            'log_dropped': log_writer.dropped,
+            'archive_written': archive_writer.written,
+            'archive_dropped': archive_writer.dropped,
+            'archive_segments': archive_writer.segments,
+            'archive_ratio': round(archive_writer.bytes_in / archive_writer.bytes_out, 1) if archive_writer.bytes_out else None,
             'active_threads': active_threads,
             'relay_running': relay_status,
             'gc_collections': len(gc_stats),
@@ -537,16 +893,27 @@ def send_startup_message(forward_sock):
             f"Status:Starting"
         ]
         
+        # Socket buffers, with a warning when the kernel granted less than requested
+        try:
+            buffer_sizes = socket_buffer_sizes()
+            message_parts.insert(-1, f"Buffers:{format_buffer_sizes(buffer_sizes)}")
+            for name, (requested, actual) in clamped_buffers(buffer_sizes).items():
+                limit = 'net.core.rmem_max' if name == 'SO_RCVBUF' else 'net.core.wmem_max'
+                message_parts.insert(-1, f"Warning:{name} clamped {requested}->{actual} (raise {limit})")
+        except Exception as e:
+            print(f"Error reading socket buffer sizes: {e}")
+        
         syslog_message = f"{priority}{timestamp} {hostname} {app_name}: {' | '.join(message_parts)}"
         forward_sock.sendto(syslog_message.encode('utf-8'), (FORWARD_HOST, FORWARD_PORT))
         print(f"Startup message sent to ktranslate: {syslog_message}")
         
         # Also log to file for debugging
         try:
-            with open(LOG_FILE, 'a', encoding='utf-8') as log_file:
-                log_file.write(f"\n=== STARTUP MESSAGE SENT (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
-                log_file.write(f"Message: {syslog_message}\n")
-                log_file.write(f"==========================================\n")
+            write_log(
+                f"\n=== STARTUP MESSAGE SENT (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n"
+                f"Message: {syslog_message}\n"
+                f"==========================================\n"
+            )
         except:
             pass
             
@@ -555,10 +922,11 @@ def send_startup_message(forward_sock):
         print(error_msg)
         # Log error to file
         try:
-            with open(LOG_FILE, 'a', encoding='utf-8') as log_file:
-                log_file.write(f"\n=== STARTUP MESSAGE ERROR (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
-                log_file.write(f"{error_msg}\n")
-                log_file.write(f"==========================================\n")
+            write_log(
+                f"\n=== STARTUP MESSAGE ERROR (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n"
+                f"{error_msg}\n"
+                f"==========================================\n"
+            )
         except:
             pass
 
@@ -604,10 +972,11 @@ def send_shutdown_message(forward_sock):
         
         # Also log to file for debugging
         try:
-            with open(LOG_FILE, 'a', encoding='utf-8') as log_file:
-                log_file.write(f"\n=== SHUTDOWN MESSAGE SENT (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
-                log_file.write(f"Message: {syslog_message}\n")
-                log_file.write(f"==========================================\n")
+            write_log(
+                f"\n=== SHUTDOWN MESSAGE SENT (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n"
+                f"Message: {syslog_message}\n"
+                f"==========================================\n"
+            )
         except:
             pass
             
@@ -616,10 +985,11 @@ def send_shutdown_message(forward_sock):
         print(error_msg)
         # Log error to file
         try:
-            with open(LOG_FILE, 'a', encoding='utf-8') as log_file:
-                log_file.write(f"\n=== SHUTDOWN MESSAGE ERROR (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
-                log_file.write(f"{error_msg}\n")
-                log_file.write(f"==========================================\n")
+            write_log(
+                f"\n=== SHUTDOWN MESSAGE ERROR (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n"
+                f"{error_msg}\n"
+                f"==========================================\n"
+            )
         except:
             pass
 
@@ -665,10 +1035,11 @@ def send_restart_message(forward_sock):
         
         # Also log to file for debugging
         try:
-            with open(LOG_FILE, 'a', encoding='utf-8') as log_file:
-                log_file.write(f"\n=== RESTART MESSAGE SENT (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
-                log_file.write(f"Message: {syslog_message}\n")
-                log_file.write(f"==========================================\n")
+            write_log(
+                f"\n=== RESTART MESSAGE SENT (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n"
+                f"Message: {syslog_message}\n"
+                f"==========================================\n"
+            )
         except:
             pass
             
@@ -677,10 +1048,11 @@ def send_restart_message(forward_sock):
         print(error_msg)
         # Log error to file
         try:
-            with open(LOG_FILE, 'a', encoding='utf-8') as log_file:
-                log_file.write(f"\n=== RESTART MESSAGE ERROR (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
-                log_file.write(f"{error_msg}\n")
-                log_file.write(f"==========================================\n")
+            write_log(
+                f"\n=== RESTART MESSAGE ERROR (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n"
+                f"{error_msg}\n"
+                f"==========================================\n"
+            )
         except:
             pass
 
@@ -713,7 +1085,27 @@ def send_system_stats_to_ktranslate(stats, forward_sock):
                 f"CPU:{stats.get('cpu_percent', 'Unknown')}%",
                 f"Disk:{stats.get('disk_percent', 'Unknown')}%({stats.get('disk_used_gb', 'Unknown')}GB/{stats.get('disk_total_gb', 'Unknown')}GB)",
                 f"Messages:{stats.get('total_messages', 'Unknown')}({stats.get('messages_per_minute', 'Unknown')}/min)",
+                f"Forwarded:{stats.get('messages_forwarded', 'Unknown')}({stats.get('forwarded_per_minute', 'Unknown')}/min)",
+                f"Dropped:{stats.get('messages_dropped', 'Unknown')}({stats.get('dropped_per_minute', 'Unknown')}/min)",
+                f"Forward:{format_forward_stats(stats)}",
+                f"Spool:{format_spool_stats(stats)}",
+                f"Destinations:{format_destination_stats(stats)}({stats.get('messages_claimed', 0)} exclusive)",
+                f"Bytes:{stats.get('bytes_received_kb', 'Unknown')}KB in/{stats.get('bytes_forwarded_kb', 'Unknown')}KB out",
+                f"Formats:{format_counts(stats.get('messages_by_format', {}))}",
+                f"Sources:{format_counts(stats.get('messages_by_source', {}))}",
+                f"Transform:{stats.get('messages_transformed', 'Unknown')}(p50<={stats.get('transform_p50_us', 'Unknown')}us p99<={stats.get('transform_p99_us', 'Unknown')}us)",
+                f"Routes:{stats.get('routes', 0)}({stats.get('messages_filtered', 0)} filtered)",
+                f"Filters:{stats.get('filters', 0)}({stats.get('messages_pri_filtered', 0)} filtered)",
+                f"Dedup:{stats.get('messages_deduplicated', 0)} repeats({stats.get('dedup_entries', 0)} tracked)",
+                f"RateLimit:{stats.get('messages_rate_limited', 0)} suppressed({stats.get('rate_limit_buckets', 0)} buckets)",
+                f"Diagnostics:{stats.get('diagnostics', 'off')}({stats.get('messages_traced', 0)} traced)",
+                f"TCP:{stats.get('tcp_connections', 0)} open({stats.get('tcp_accepted', 0)} accepted, {stats.get('frames_truncated', 0)} truncated)",
                 f"Threads:{stats.get('active_threads', 'Unknown')}",
+                f"LogQueue:{stats.get('log_queue_depth', 'Unknown')}({stats.get('log_dropped', 'Unknown')} dropped)",
+                f"Archive:{stats.get('archive_written', 0)}({stats.get('archive_dropped', 0)} dropped, {stats.get('archive_segments', 0)} segments, x{stats.get('archive_ratio') or '-'})",
+                f"Kernel:{format_kernel_stats(stats)}",
+                f"Config:{stats.get('config_source', 'Unknown')}({stats.get('config_reloads', 0)} reloads, {stats.get('config_errors', 0)} errors)",
+                f"Workers:{stats.get('workers', 0)}({stats.get('worker_restarts', 0)} restarts)",
                 f"Relay:{'Running' if stats.get('relay_running', relay_running) else 'Stopped'}"
             ]
         
@@ -723,10 +1115,11 @@ def send_system_stats_to_ktranslate(stats, forward_sock):
         
         # Also log to file for debugging
         try:
-            with open(LOG_FILE, 'a', encoding='utf-8') as log_file:
-                log_file.write(f"\n=== SYSTEM STATS SENT (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
-                log_file.write(f"Message: {syslog_message}\n")
-                log_file.write(f"==========================================\n")
+            write_log(
+                f"\n=== SYSTEM STATS SENT (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n"
+                f"Message: {syslog_message}\n"
+                f"==========================================\n"
+            )
         except:
             pass
             
@@ -735,87 +1128,39 @@ def send_system_stats_to_ktranslate(stats, forward_sock):
         print(error_msg)
         # Log error to file
         try:
-            with open(LOG_FILE, 'a', encoding='utf-8') as log_file:
-                log_file.write(f"\n=== SYSTEM STATS ERROR (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
-                log_file.write(f"{error_msg}\n")
-                log_file.write(f"==========================================\n")
+            write_log(
+                f"\n=== SYSTEM STATS ERROR (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n"
+                f"{error_msg}\n"
+                f"==========================================\n"
+            )
         except:
             pass
 
 def monitoring_worker():
-    """Background worker for periodic system monitoring"""
-    global last_monitoring_time, total_messages_processed, last_minute_messages
-    
-    print(f"Monitoring worker starting (v{VERSION})")
+    """Periodic system monitoring task (scheduled on the relay event loop)"""
+    global last_monitoring_time
     
     try:
         monitor_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        print("Monitoring socket created successfully")
+        try:
+            stats = get_system_stats()
+            send_system_stats_to_ktranslate(stats, monitor_sock)
+            last_monitoring_time = time.time()
+            print(f"System monitoring completed at {stats.get('timestamp', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))}")
+        finally:
+            monitor_sock.close()
     except Exception as e:
-        print(f"Failed to create monitoring socket: {e}")
-        # Log to file if possible
+        error_msg = f"Error in monitoring worker: {e}"
+        print(error_msg)
+        # Log error to file
         try:
-            os.makedirs(DESKTOP_LOG_DIR, exist_ok=True)
-            with open(LOG_FILE, 'a', encoding='utf-8') as log_file:
-                log_file.write(f"\n=== MONITORING WORKER ERROR (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
-                log_file.write(f"Failed to create monitoring socket: {e}\n")
-                log_file.write(f"==========================================\n")
+            write_log(
+                f"\n=== MONITORING WORKER ERROR (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n"
+                f"{error_msg}\n"
+                f"==========================================\n"
+            )
         except:
             pass
-        return
-    
-    # Wait for relay to be running before starting monitoring loop
-    wait_count = 0
-    while not relay_running and wait_count < 30:  # Wait up to 30 seconds
-        time.sleep(1)
-        wait_count += 1
-    
-    if not relay_running:
-        print("Monitoring worker exiting: relay not running after 30 seconds")
-        monitor_sock.close()
-        return
-    
-    print(f"Monitoring worker started successfully, relay_running={relay_running}")
-    
-    # Send first system stats message immediately
-    print("Sending initial system stats...")
-    stats = get_system_stats()
-    send_system_stats_to_ktranslate(stats, monitor_sock)
-    last_monitoring_time = time.time()  # Reset timer for next 60-second interval
-    
-    while relay_running:
-        try:
-            current_time = time.time()
-            
-            # Check if it's time for monitoring
-            if current_time - last_monitoring_time >= monitoring_interval:
-                last_monitoring_time = current_time
-                stats = get_system_stats()
-                send_system_stats_to_ktranslate(stats, monitor_sock)
-                print(f"System monitoring completed at {stats['timestamp']}")
-            
-            # Update message counters
-            if message_count > total_messages_processed:
-                last_minute_messages += (message_count - total_messages_processed)
-                total_messages_processed = message_count
-            
-            time.sleep(10)  # Check every 10 seconds
-            
-        except Exception as e:
-            error_msg = f"Error in monitoring worker: {e}"
-            print(error_msg)
-            # Log error to file
-            try:
-                with open(LOG_FILE, 'a', encoding='utf-8') as log_file:
-                    log_file.write(f"\n=== MONITORING WORKER ERROR (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
-                    log_file.write(f"{error_msg}\n")
-                    log_file.write(f"==========================================\n")
-            except:
-                pass
-            time.sleep(30)  # Wait longer on error
-    
-    print("Monitoring worker shutting down")
-    monitor_sock.close()
 
 def send_health_check_message(forward_sock):
     """Send health check message to ktranslate via syslog"""
@@ -859,10 +1204,11 @@ def send_health_check_message(forward_sock):
         
         # Also log to file for debugging
         try:
-            with open(LOG_FILE, 'a', encoding='utf-8') as log_file:
-                log_file.write(f"\n=== HEALTH CHECK MESSAGE SENT (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
-                log_file.write(f"Message: {syslog_message}\n")
-                log_file.write(f"==========================================\n")
+            write_log(
+                f"\n=== HEALTH CHECK MESSAGE SENT (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n"
+                f"Message: {syslog_message}\n"
+                f"==========================================\n"
+            )
         except:
             pass
             
@@ -871,16 +1217,16 @@ def send_health_check_message(forward_sock):
         print(error_msg)
         # Log error to file
         try:
-            with open(LOG_FILE, 'a', encoding='utf-8') as log_file:
-                log_file.write(f"\n=== HEALTH CHECK MESSAGE ERROR (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
-                log_file.write(f"{error_msg}\n")
-                log_file.write(f"==========================================\n")
+            write_log(
+                f"\n=== HEALTH CHECK MESSAGE ERROR (v{VERSION}) - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n"
+                f"{error_msg}\n"
+                f"==========================================\n"
+            )
         except:
             pass
 
 def on_clicked(icon, item):
     """Handle tray icon clicks"""
-    global relay_running
     
     if str(item) == f"Status (v{VERSION})":
         # Send health check message
@@ -891,8 +1237,6 @@ def on_clicked(icon, item):
         except Exception as e:
             print(f"Error sending health check message: {e}")
     elif str(item) == "Stop":
-        relay_running = False
-        
         # Send shutdown message before stopping
         try:
             shutdown_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -901,6 +1245,7 @@ def on_clicked(icon, item):
         except Exception as e:
             print(f"Error sending shutdown message: {e}")
         
+        stop_relay()
         icon.stop()
     elif str(item) == "Restart":
         # Send restart message
@@ -911,21 +1256,11 @@ def on_clicked(icon, item):
         except Exception as e:
             print(f"Error sending restart message: {e}")
         
-        # Stop the current relay
-        relay_running = False
-        
-        # Wait a moment for cleanup
-        time.sleep(1)
-        
-        # Restart the relay
-        relay_running = True
-        
-        # Start relay in background thread
-        relay_thread = threading.Thread(target=relay_worker, daemon=True)
-        relay_thread.start()
+        # Stop the current relay (returns once the event loop has shut down)
+        stop_relay()
         
-        # Give relay worker time to set relay_running = True before starting monitoring
-        time.sleep(2)
+        # Restart the relay; start_relay() returns once the socket is bound
+        start_relay()
         
         # Send startup message
         try:
@@ -934,18 +1269,21 @@ def on_clicked(icon, item):
             startup_sock.close()
         except Exception as e:
             print(f"Error sending startup message: {e}")
-        
-        # Start monitoring in background thread
-        monitoring_thread = threading.Thread(target=monitoring_worker, daemon=True)
-        monitoring_thread.start()
 
 def main():
-    # Start relay in background thread
-    relay_thread = threading.Thread(target=relay_worker, daemon=True)
-    relay_thread.start()
+    # Start the background log writer before anything logs
+    log_writer.start()
+    if ARCHIVE_ENABLED:
+        archive_writer.start()
+    if metrics_exporter is not None:
+        try:
+            metrics_exporter.start()
+            print(f"Metrics endpoint: http://{METRICS_HTTP_HOST}:{metrics_exporter.port}/metrics")
+        except OSError as e:
+            print(f"Error starting metrics endpoint on {METRICS_HTTP_HOST}:{METRICS_HTTP_PORT}: {e}")
     
-    # Give relay worker time to set relay_running = True before starting monitoring
-    time.sleep(2)
+    # Start the relay event loop in a background thread (returns once the socket is bound)
+    start_relay()
     
     # Send startup message immediately
     try:
@@ -955,10 +1293,6 @@ def main():
     except Exception as e:
         print(f"Error sending startup message: {e}")
     
-    # Start monitoring in background thread
-    monitoring_thread = threading.Thread(target=monitoring_worker, daemon=True)
-    monitoring_thread.start()
-    
     # Create tray icon
     icon_image = create_tray_icon()
     
@@ -977,8 +1311,14 @@ def main():
     try:
         icon.run()
     except KeyboardInterrupt:
-        relay_running = False
+        stop_relay()
         icon.stop()
+    finally:
+        # Flush queued log and archive records before exiting
+        if metrics_exporter is not None:
+            metrics_exporter.stop()
+        archive_writer.stop()
+        log_writer.stop()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
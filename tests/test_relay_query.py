@@ -0,0 +1,48 @@
+"""relay_query against a real archive written by ArchiveWriter"""
+import contextlib
+import io
+import tempfile
+import unittest
+
+import relay_query
+from relay_archive import ArchiveWriter
+
+# An Unraid Docker line as the transforms forward it (and the archive keeps it)
+UNRAID_DOCKER_LINE = b'<30>Aug 29 06:57:27 immichFrame-All [16201]: Frame updated'
+UNRAID_HOST_LINE = b'<30>Aug 29 06:57:28 Tower kernel: eth0: link up'
+
+
+class QueryTransformedLinesTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = self._directory.name
+        writer = ArchiveWriter(self.directory, block_interval=0)
+        writer.start()
+        writer.write('192.168.2.110', UNRAID_DOCKER_LINE)
+        writer.write('192.168.2.110', UNRAID_HOST_LINE)
+        writer.stop()
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def count(self, *args):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(relay_query.main(['--dir', self.directory, '--count', *args]), 0)
+        return int(output.getvalue())
+
+    def test_app_matches_docker_tag(self):
+        self.assertEqual(self.count('--app', 'immich*'), 1)
+
+    def test_docker_tag_is_not_a_hostname(self):
+        self.assertEqual(self.count('--host', 'immich*'), 0)
+
+    def test_host_and_app_of_plain_line(self):
+        self.assertEqual(self.count('--host', 'tower', '--app', 'kernel'), 1)
+
+    def test_no_filter(self):
+        self.assertEqual(self.count(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()